@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Compare catalog throughput of the WSGI and ASGI deployments under concurrent load.
+
+Start both servers against the same database, e.g.:
+
+    gunicorn api.wsgi -w 4 -b 127.0.0.1:8000
+    uvicorn api.asgi:application --workers 1 --port 8001   # with CATALOG_ASYNC_VIEWS = True
+
+then run:
+
+    python benchmark_async.py --wsgi http://127.0.0.1:8000 --asgi http://127.0.0.1:8001 \
+        --concurrency 200 --requests 5000 --category car-wash --brand Toyota --model Innova
+
+Each target gets the same request mix (category list, services by category with
+and without brand/model, all services, service prices), and the script reports
+requests/second, latency percentiles and errors. The first --warmup requests of
+each target are not measured.
+"""
+
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+
+import aiohttp
+
+
+def request_paths(args):
+    priced = f'/api/services/categories/{args.category}/?brand={args.brand}&model={args.model}'
+    return [
+        '/api/services/categories/',
+        f'/api/services/categories/{args.category}/',
+        priced,
+        priced,
+        '/api/services/all/',
+        '/api/service-prices/',
+    ]
+
+
+async def run_load(base_url, paths, total, concurrency):
+    """Send ``total`` requests with ``concurrency`` in flight. Returns (seconds, latencies, errors)."""
+    cycle = itertools.cycle(paths)
+    latencies = []
+    errors = 0
+    remaining = total
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    timeout = aiohttp.ClientTimeout(total=60)
+
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def worker():
+            nonlocal remaining, errors
+            while remaining > 0:
+                remaining -= 1
+                started = time.perf_counter()
+                try:
+                    async with session.get(base_url + next(cycle)) as response:
+                        await response.read()
+                        if response.status >= 500:
+                            errors += 1
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started, latencies, errors
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def benchmark(name, base_url, args):
+    paths = request_paths(args)
+    if args.warmup:
+        await run_load(base_url, paths, args.warmup, min(args.concurrency, args.warmup))
+    seconds, latencies, errors = await run_load(base_url, paths, args.requests, args.concurrency)
+    print(f"\n📊 {name} ({base_url})")
+    print(f"   {args.requests / seconds:10.1f} requests/s   ({args.requests} requests in {seconds:.2f}s, {errors} errors)")
+    print(
+        f"   latency ms: mean {statistics.mean(latencies) * 1000:.1f}  "
+        f"p50 {percentile(latencies, 0.50) * 1000:.1f}  "
+        f"p95 {percentile(latencies, 0.95) * 1000:.1f}  "
+        f"p99 {percentile(latencies, 0.99) * 1000:.1f}"
+    )
+    return args.requests / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wsgi', help='base URL of the WSGI server')
+    parser.add_argument('--asgi', help='base URL of the ASGI server')
+    parser.add_argument('--requests', type=int, default=2000, help='measured requests per target')
+    parser.add_argument('--concurrency', type=int, default=100, help='requests in flight')
+    parser.add_argument('--warmup', type=int, default=200, help='unmeasured requests per target')
+    parser.add_argument('--category', default='car-wash', help='category slug')
+    parser.add_argument('--brand', default='Toyota')
+    parser.add_argument('--model', default='Innova')
+    args = parser.parse_args()
+
+    targets = [(name, url.rstrip('/')) for name, url in (('WSGI', args.wsgi), ('ASGI', args.asgi)) if url]
+    if not targets:
+        parser.error('pass --wsgi and/or --asgi')
+
+    results = {name: asyncio.run(benchmark(name, url, args)) for name, url in targets}
+    if len(results) == 2:
+        print(f"\n🚀 ASGI / WSGI throughput: {results['ASGI'] / results['WSGI']:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Benchmark the catalog response renderers.
+
+Renders the payloads of ServicesByCategoryView and ServicePriceListView with:
+1. DRF's default JSONRenderer
+2. FastJSONRenderer (orjson)
+3. MessagePackRenderer
+
+and reports the serialization CPU time per response and the payload size.
+The JSON output of both JSON renderers is checked to be byte-identical.
+
+Usage:
+    python benchmark_renderers.py [--seed 2000] [--repeat 200]
+
+--seed creates that many sample prices (and a few services) inside a
+transaction that is rolled back at the end, for an empty database.
+"""
+
+import argparse
+import os
+import sys
+import time
+import django
+
+# Setup Django environment
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'api.settings')
+django.setup()
+
+from decimal import Decimal
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from myapp.linkage import link_prices
+from myapp.models import ServiceCategory, Service, ServicePrice
+from myapp.renderers import FastJSONRenderer, MessagePackRenderer
+from myapp.views import ServicesByCategoryView, ServicePriceListView
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed(count):
+    """Create sample catalog data"""
+    category = ServiceCategory.objects.create(name='Benchmark', slug='benchmark', description='Benchmark services')
+    headers = ['Oil Change', 'Car Wash', 'AC Service', 'Brake Service', 'Wheel Alignment', 'Battery Check']
+    for position, header in enumerate(headers):
+        Service.objects.create(
+            category=category, header=header, details='Inspection, Labour, Parts',
+            price=Decimal('499.00') + position, is_featured=position % 2 == 0
+        )
+    brands = ['Toyota', 'Honda', 'Hyundai', 'Maruti', 'Kia']
+    ServicePrice.objects.bulk_create([
+        ServicePrice(
+            brand=brands[i % len(brands)], model=f'Model {i % 40}', type='Service',
+            product_name=f'{headers[i % len(headers)]} Package {i}',
+            before_price=Decimal('1000.00') + i, after_price=Decimal('800.00') + i,
+            discounted_price=Decimal('750.00') + i if i % 3 else None,
+            link=f'https://example.com/prices/{i}',
+        )
+        for i in range(count)
+    ], batch_size=1000)
+    link_prices(ServicePrice.objects.all())
+    return category.slug, brands[0], 'Model 0'
+
+
+def collect_payloads(category_slug, brand, model):
+    """Get the response data of the benchmarked views"""
+    factory = APIRequestFactory()
+    payloads = {}
+
+    response = ServicesByCategoryView.as_view()(
+        factory.get('/', {'brand': brand, 'model': model}), category_identifier=category_slug
+    )
+    payloads['ServicesByCategoryView'] = response.data
+
+    response = ServicePriceListView.as_view()(factory.get('/'))
+    payloads['ServicePriceListView'] = response.data
+    return payloads
+
+
+def measure(renderer, data, repeat):
+    """CPU seconds per render and the rendered size"""
+    started = time.process_time()
+    for _ in range(repeat):
+        content = renderer.render(data)
+    return (time.process_time() - started) / repeat, len(content), content
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0, help='sample prices to create (rolled back)')
+    parser.add_argument('--repeat', type=int, default=200, help='renders per measurement')
+    parser.add_argument('--category', default=None, help='category slug (default: first active category)')
+    parser.add_argument('--brand', default='Toyota')
+    parser.add_argument('--model', default='Model 0')
+    args = parser.parse_args()
+
+    try:
+        with transaction.atomic():
+            category_slug, brand, model = args.category, args.brand, args.model
+            if args.seed:
+                category_slug, brand, model = seed(args.seed)
+            elif category_slug is None:
+                category = ServiceCategory.objects.filter(is_active=True).first()
+                if category is None:
+                    print("❌ No categories found. Use --seed to create sample data.")
+                    return
+                category_slug = category.slug
+
+            # The shared price index does not see the uncommitted sample data
+            with override_settings(PRICE_INDEX_ENABLED=not args.seed):
+                payloads = collect_payloads(category_slug, brand, model)
+            raise Rollback
+    except Rollback:
+        pass
+
+    renderers = [
+        ('JSONRenderer', JSONRenderer()),
+        ('FastJSONRenderer', FastJSONRenderer()),
+        ('MessagePackRenderer', MessagePackRenderer()),
+    ]
+    for name, data in payloads.items():
+        print(f"\n📊 {name}")
+        baseline = None
+        for renderer_name, renderer in renderers:
+            seconds, size, content = measure(renderer, data, args.repeat)
+            if baseline is None:
+                baseline, baseline_content = seconds, content
+                saved = ''
+            else:
+                saved = f"  ({(1 - seconds / baseline) * 100:5.1f}% CPU saved)"
+            print(f"   {renderer_name:<20} {seconds * 1000:8.3f} ms/render  {size:>10,} bytes{saved}")
+            if renderer_name == 'FastJSONRenderer' and content != baseline_content:
+                print("   ⚠️ FastJSONRenderer output differs from JSONRenderer")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+"""
+Measure worker cold start: import time and resident memory after Django startup.
+
+Starts a fresh interpreter per run with ``python -X importtime`` that does what a
+worker does before its first request (django.setup(), admin autodiscovery and
+loading the URLconf with every view), then reports:
+- wall-clock startup time and resident set size (RSS)
+- which heavy optional libraries got loaded (pandas, NumPy, openpyxl, ...)
+- the slowest top-level imports
+
+Usage:
+    python benchmark_startup.py [--runs 5] [--top 15] [--settings api.settings]
+
+Compare e.g. a regular worker with an API-only one:
+    python benchmark_startup.py --settings api.settings_api_only
+(SERVICE_PRICE_ADMIN_IMPORT_EXPORT = False, IMPORT_WORKER_POOL = 2 and
+'import_export' left out of INSTALLED_APPS)
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = (
+    'pandas', 'numpy', 'openpyxl', 'tablib', 'import_export', 'twilio', 'rest_framework_simplejwt',
+)
+
+WORKER_STARTUP = f"""
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+seconds = time.perf_counter() - started
+
+rss_kb = None
+try:
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss_kb //= 1024
+print(json.dumps({{
+    'seconds': seconds,
+    'rss_kb': rss_kb,
+    'loaded': [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def start_worker(settings_module):
+    """Run one cold start. Returns (result dict, {top-level module: cumulative microseconds})."""
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings_module)
+    env.setdefault('PYTHONPATH', os.path.dirname(os.path.abspath(__file__)))
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', WORKER_STARTUP],
+        capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else 'startup failed')
+
+    imports = {}
+    for line in completed.stderr.splitlines():
+        # "import time: self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not name.startswith('  '):  # top-level imports only, nested ones are included
+            imports[name.strip()] = int(cumulative)
+    return json.loads(completed.stdout.strip().splitlines()[-1]), imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='cold starts to average')
+    parser.add_argument('--top', type=int, default=15, help='slowest top-level imports to list')
+    parser.add_argument('--settings', default=os.environ.get('DJANGO_SETTINGS_MODULE', 'api.settings'))
+    args = parser.parse_args()
+
+    results = []
+    imports = {}
+    for _ in range(args.runs):
+        result, run_imports = start_worker(args.settings)
+        results.append(result)
+        for name, micros in run_imports.items():
+            imports.setdefault(name, []).append(micros)
+
+    seconds = [result['seconds'] for result in results]
+    rss = [result['rss_kb'] for result in results]
+    print(f"\n📊 Worker startup ({args.settings}, {args.runs} runs)")
+    print(f"   startup: {statistics.median(seconds) * 1000:8.1f} ms (median, min {min(seconds) * 1000:.1f} ms)")
+    print(f"   RSS:     {statistics.median(rss) / 1024:8.1f} MiB (median)")
+    loaded = results[-1]['loaded']
+    print(f"   heavy modules loaded: {', '.join(loaded) if loaded else 'none'}")
+
+    print(f"\n   Slowest top-level imports (median cumulative):")
+    slowest = sorted(imports.items(), key=lambda item: statistics.median(item[1]), reverse=True)[:args.top]
+    for name, micros in slowest:
+        print(f"   {statistics.median(micros) / 1000:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+"""
+Load-test the app's user journey end to end, with a local SMS provider stand-in.
+
+Each virtual user does what the app does from launch to a signed-in session:
+
+    categories    GET  /api/services/categories/
+    services      GET  /api/services/categories/<name>/?brand=&model=
+    otp_request   POST /api/otp/request/
+    otp_verify    POST /api/otp/verify/        (with the code the stand-in received)
+    browse        GET  catalog endpoints with the JWT, --browse times
+
+The script serves the SMS stand-in itself (default http://127.0.0.1:8025/messages).
+Point the server at it, so OTP messages come here instead of going to Twilio:
+
+    SMS_BACKEND = 'myapp.sms.WebhookBackend'
+    SMS_WEBHOOK_URL = 'http://127.0.0.1:8025/messages'
+
+then run, e.g. for 2000 sign-ins with 200 users at a time:
+
+    python loadtest_journey.py --base-url http://127.0.0.1:8000 \
+        --journeys 2000 --concurrency 200 --cars Toyota:Innova,Honda:City --browse 5
+
+The report lists throughput, error rate and latency percentiles per step,
+and completed journeys per second. --sms-latency adds the delay of a real
+provider to every message. Every journey signs up a new phone number
+(--phone-prefix plus a run id and a counter), so run it against a staging
+database, never production.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import re
+import statistics
+import time
+import uuid
+from urllib.parse import quote
+
+import aiohttp
+from aiohttp import web
+
+OTP_PATTERN = re.compile(r'code is: (\d+)')
+
+STEPS = ['categories', 'services', 'otp_request', 'otp_verify', 'browse']
+
+
+class StepFailed(Exception):
+    pass
+
+
+class SMSStandIn:
+    """Local SMS provider: receives the WebhookBackend's messages and hands out their codes."""
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.received = 0
+        self._codes = {}
+
+    def expect(self, phone_number):
+        """A future resolved with the next code sent to ``phone_number``."""
+        future = asyncio.get_running_loop().create_future()
+        self._codes[phone_number] = future
+        return future
+
+    async def handle(self, request):
+        message = await request.json()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.received += 1
+        match = OTP_PATTERN.search(message.get('body', ''))
+        future = self._codes.pop(message.get('to'), None)
+        if match and future is not None and not future.done():
+            future.set_result(match.group(1))
+        return web.json_response({'id': uuid.uuid4().hex})
+
+    async def start(self, host, port):
+        app = web.Application()
+        app.router.add_post('/messages', self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        return runner
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {step: [] for step in STEPS}
+        self.errors = {step: 0 for step in STEPS}
+        self.error_samples = {}
+        self.completed = 0
+        self.failed = 0
+
+    def record(self, step, seconds, error=None):
+        self.latencies[step].append(seconds)
+        if error is not None:
+            self.errors[step] += 1
+            self.error_samples.setdefault(f'{step}: {error}', 0)
+            self.error_samples[f'{step}: {error}'] += 1
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def timed(stats, step, session, method, url, **kwargs):
+    """Send one request of a step; returns the decoded JSON body or raises StepFailed."""
+    started = time.perf_counter()
+    error = None
+    try:
+        async with session.request(method, url, **kwargs) as response:
+            body = await response.read()
+            if response.status >= 400:
+                error = f'HTTP {response.status}'
+            else:
+                return json.loads(body) if body else None
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        error = type(e).__name__
+    finally:
+        stats.record(step, time.perf_counter() - started, error)
+    raise StepFailed(error)
+
+
+async def journey(session, args, sms, stats, phone_number):
+    base = args.base_url
+    categories = await timed(stats, 'categories', session, 'GET', f'{base}/api/services/categories/')
+    if isinstance(categories, dict):
+        categories = categories.get('results', [])
+    # The list has no slugs; the services-by-category URL takes names too
+    names = [category['name'] for category in categories or []]
+    category = args.category or (random.choice(names) if names else 'car-wash')
+    brand, model = random.choice(args.cars)
+    car = {'brand': brand, 'model': model}
+
+    await timed(stats, 'services', session, 'GET', f'{base}/api/services/categories/{quote(category)}/', params=car)
+
+    code = sms.expect(phone_number)
+    await timed(stats, 'otp_request', session, 'POST', f'{base}/api/otp/request/',
+                json={'phone_number': phone_number})
+    try:
+        otp_code = await asyncio.wait_for(code, args.sms_timeout)
+    except asyncio.TimeoutError:
+        stats.record('otp_verify', 0, 'no SMS received')
+        raise StepFailed('no SMS received')
+
+    tokens = await timed(stats, 'otp_verify', session, 'POST', f'{base}/api/otp/verify/',
+                         json={'phone_number': phone_number, 'otp_code': otp_code})
+    headers = {'Authorization': f"Bearer {tokens['access']}"}
+
+    browse_paths = itertools.cycle([
+        (f'/api/services/categories/{quote(random.choice(names or [category]))}/', car),
+        ('/api/services/all/', None),
+        ('/api/service-prices/', car),
+    ])
+    for _ in range(args.browse):
+        if args.think_time:
+            await asyncio.sleep(random.uniform(0, 2 * args.think_time))
+        path, params = next(browse_paths)
+        try:
+            await timed(stats, 'browse', session, 'GET', base + path, params=params, headers=headers)
+        except StepFailed:
+            # Keep browsing: one failed page doesn't end a session
+            pass
+
+
+async def run(args):
+    sms = SMSStandIn(args.sms_latency)
+    sms_runner = await sms.start(args.sms_host, args.sms_port)
+    stats = Stats()
+    run_id = random.randint(0, 999)
+    counter = itertools.count()
+    remaining = args.journeys
+
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        async def virtual_user(index):
+            nonlocal remaining
+            if args.ramp_up:
+                await asyncio.sleep(args.ramp_up * index / args.concurrency)
+            while remaining > 0:
+                remaining -= 1
+                phone_number = f'{args.phone_prefix}{run_id:03d}{next(counter):06d}'
+                try:
+                    await journey(session, args, sms, stats, phone_number)
+                    stats.completed += 1
+                except StepFailed:
+                    stats.failed += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(virtual_user(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    await sms_runner.cleanup()
+    return stats, elapsed, sms.received
+
+
+def report(args, stats, elapsed, sms_received):
+    print(f"\n📊 {args.journeys} journeys, {args.concurrency} concurrent users, {elapsed:.2f}s ({args.base_url})")
+    print(
+        f"   {stats.completed / elapsed:.1f} completed journeys/s   "
+        f"({stats.completed} completed, {stats.failed} failed, {sms_received} SMS received)\n"
+    )
+    print(f"   {'step':<12}{'requests':>9}{'req/s':>9}{'errors':>8}{'err %':>7}"
+          f"{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}  (ms)")
+    summary = {}
+    for step in STEPS:
+        latencies = stats.latencies[step]
+        if not latencies:
+            continue
+        row = {
+            'requests': len(latencies),
+            'requests_per_second': len(latencies) / elapsed,
+            'errors': stats.errors[step],
+            'error_rate': stats.errors[step] / len(latencies),
+            **{
+                name: value * 1000 for name, value in (
+                    ('mean_ms', statistics.mean(latencies)),
+                    ('p50_ms', percentile(latencies, 0.50)),
+                    ('p95_ms', percentile(latencies, 0.95)),
+                    ('p99_ms', percentile(latencies, 0.99)),
+                )
+            },
+        }
+        summary[step] = row
+        print(
+            f"   {step:<12}{row['requests']:>9}{row['requests_per_second']:>9.1f}{row['errors']:>8}"
+            f"{row['error_rate'] * 100:>7.1f}{row['mean_ms']:>9.1f}{row['p50_ms']:>9.1f}"
+            f"{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}"
+        )
+    if stats.error_samples:
+        print("\n⚠️ Errors:")
+        for error, count in sorted(stats.error_samples.items(), key=lambda item: -item[1])[:10]:
+            print(f"   {count:>6}  {error}")
+
+    if args.report_json:
+        with open(args.report_json, 'w') as f:
+            json.dump({
+                'base_url': args.base_url,
+                'journeys': args.journeys,
+                'concurrency': args.concurrency,
+                'seconds': elapsed,
+                'completed': stats.completed,
+                'failed': stats.failed,
+                'journeys_per_second': stats.completed / elapsed,
+                'steps': summary,
+                'errors': stats.error_samples,
+            }, f, indent=2)
+        print(f"\n💾 Report written to {args.report_json}")
+
+
+def parse_cars(value):
+    cars = []
+    for car in value.split(','):
+        brand, _, model = car.partition(':')
+        cars.append((brand.strip(), model.strip()))
+    return cars
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000', help='base URL of the API server')
+    parser.add_argument('--journeys', type=int, default=500, help='journeys (sign-ins) in total')
+    parser.add_argument('--concurrency', type=int, default=50, help='virtual users at a time')
+    parser.add_argument('--ramp-up', type=float, default=0, help='seconds over which the users start')
+    parser.add_argument('--browse', type=int, default=5, help='authenticated requests per journey')
+    parser.add_argument('--think-time', type=float, default=0, help='mean seconds between browse requests')
+    parser.add_argument('--category', help='category slug or name (default: a random one from the category list)')
+    parser.add_argument('--cars', type=parse_cars, default=parse_cars('Toyota:Innova'),
+                        help='brand:model pairs, comma separated')
+    parser.add_argument('--phone-prefix', default='+1555', help='prefix of the generated phone numbers')
+    parser.add_argument('--sms-host', default='127.0.0.1', help='address the SMS stand-in listens on')
+    parser.add_argument('--sms-port', type=int, default=8025, help='port the SMS stand-in listens on')
+    parser.add_argument('--sms-latency', type=float, default=0, help='seconds the stand-in takes per message')
+    parser.add_argument('--sms-timeout', type=float, default=10, help='seconds to wait for an OTP message')
+    parser.add_argument('--timeout', type=float, default=60, help='seconds per request')
+    parser.add_argument('--report-json', help='also write the report to this file')
+    args = parser.parse_args()
+    args.base_url = args.base_url.rstrip('/')
+
+    stats, elapsed, sms_received = asyncio.run(run(args))
+    report(args, stats, elapsed, sms_received)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,39 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
-from import_export.admin import ImportExportModelAdmin, ExportActionMixin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
 
 # Register your models here.
 from .models import *
-from .resources import (
-    ServicePriceResource, 
-    ServicePriceResourceWithMapping, 
-    SimpleServicePriceResource,
-    ServicePriceResourceSmart
-)
+from .exports import export_service_prices
+from .changefeed import record_queryset_changes
+from .facets import mark_queryset_brands
+from .signals import notify_catalog_changed
+
+if getattr(settings, 'SERVICE_PRICE_ADMIN_IMPORT_EXPORT', True):
+    from import_export.admin import ImportExportModelAdmin as ServicePriceAdminBase
+    from .resources import (
+        ServicePriceResource, 
+        ServicePriceResourceWithMapping, 
+        SimpleServicePriceResource,
+        ServicePriceResourceSmart
+    )
+    SERVICE_PRICE_RESOURCES = [
+        ServicePriceResourceSmart,  # Recommended: Smart duplicate handling
+        ServicePriceResource,       # Standard: Basic upsert
+        ServicePriceResourceWithMapping,  # With column mapping
+        SimpleServicePriceResource  # Always create new (not recommended)
+    ]
+else:
+    # API-only workers: the import/export admin and resources pull in
+    # tablib, openpyxl and NumPy at startup
+    ServicePriceAdminBase = admin.ModelAdmin
+    SERVICE_PRICE_RESOURCES = []
 
 admin.site.register(UserProfile)
 
@@ -27,23 +52,134 @@ class ServiceAdmin(admin.ModelAdmin):
     list_editable=['is_featured', 'is_active']
 
 
+def admin_fast_mode_enabled():
+    return getattr(settings, 'SERVICE_PRICE_ADMIN_FAST_MODE', False)
+
+
+class InputListFilter(admin.SimpleListFilter):
+    """
+    Filter rendered as a text box with suggestions (an HTML datalist) instead
+    of a link per value, for columns with too many values to list.
+    """
+    template = 'admin/myapp/input_filter.html'
+    max_suggestions = 500
+
+    def lookups(self, request, model_admin):
+        # Nothing to list; the suggestions feed the datalist
+        self.suggestions = list(self.get_suggestions(request)[:self.max_suggestions])
+        return []
+
+    def get_suggestions(self, request):
+        return []
+
+    def has_output(self):
+        return True
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.value() is None,
+            'query_string': changelist.get_query_string(remove=[self.parameter_name]),
+            'display': _('All'),
+            # Other filters, search and ordering are submitted with the text box
+            'preserved': [
+                (name, value)
+                for name, values in changelist.filter_params.items() if name != self.parameter_name
+                for value in values
+            ],
+        }
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.parameter_name: self.value()})
+        return queryset
+
+
+class BrandInputFilter(InputListFilter):
+    """Brand filter; suggests the PriceFacet brands (active prices), any brand can be typed."""
+    title = 'brand'
+    parameter_name = 'brand'
+
+    def get_suggestions(self, request):
+        return PriceFacet.objects.order_by('brand').values_list('brand', flat=True).distinct()
+
+
+class ModelInputFilter(InputListFilter):
+    """Model filter; suggests the PriceFacet models of the selected brand only."""
+    title = 'model'
+    parameter_name = 'model'
+
+    def get_suggestions(self, request):
+        if not request.GET.get('brand'):
+            return []
+        facets = PriceFacet.objects.filter(brand=request.GET['brand'])
+        return facets.exclude(model='').order_by('model').values_list('model', flat=True)
+
+
+class TypeInputFilter(InputListFilter):
+    """Type filter; the distinct types are scanned at most every TYPE_SUGGESTIONS_TIMEOUT seconds."""
+    title = 'type'
+    parameter_name = 'type'
+    cache_key = 'admin:serviceprice-types'
+    TYPE_SUGGESTIONS_TIMEOUT = 300
+
+    def get_suggestions(self, request):
+        return cache.get_or_set(
+            self.cache_key,
+            lambda: list(ServicePrice.objects.order_by('type').values_list('type', flat=True).distinct()),
+            self.TYPE_SUGGESTIONS_TIMEOUT,
+        )
+
+
+def planner_row_estimate(queryset):
+    """The query planner's row estimate for a queryset (PostgreSQL only, else None)."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that counts exactly up to SERVICE_PRICE_ADMIN_EXACT_COUNT_LIMIT
+    rows and uses the planner's estimate beyond that, instead of a COUNT(*)
+    over the whole (filtered) table. Databases without an estimate fall back
+    to an exact count.
+    """
+
+    @cached_property
+    def count(self):
+        limit = getattr(settings, 'SERVICE_PRICE_ADMIN_EXACT_COUNT_LIMIT', 10000)
+        bounded = self.object_list.order_by()[:limit + 1].count()
+        if bounded <= limit:
+            return bounded
+        estimate = planner_row_estimate(self.object_list)
+        if estimate is None:
+            return self.object_list.count()
+        return max(estimate, bounded)
+
+
 @admin.register(ServicePrice)
-class ServicePriceAdmin(ImportExportModelAdmin):
+class ServicePriceAdmin(ServicePriceAdminBase):
     """
     Admin interface for ServicePrice with import/export functionality.
     
     Features:
-    - Excel import/export capabilities
+    - Excel import/export capabilities (rows repeating a key are not collapsed
+      here, unlike the import API's duplicate_policy)
     - Bulk operations
     - Data validation and preview
     - Error handling and reporting
+    - Fast mode for large tables (SERVICE_PRICE_ADMIN_FAST_MODE): estimated
+      counts, text box filters with suggestions from PriceFacet, prefix
+      searches and the database-generated discount column
     """
-    resource_classes = [
-        ServicePriceResourceSmart,  # Recommended: Smart duplicate handling
-        ServicePriceResource,       # Standard: Basic upsert
-        ServicePriceResourceWithMapping,  # With column mapping
-        SimpleServicePriceResource  # Always create new (not recommended)
-    ]
+    resource_classes = SERVICE_PRICE_RESOURCES
     
     list_display = [
         'brand', 'model', 'type', 'product_name', 
@@ -80,38 +216,92 @@ class ServicePriceAdmin(ImportExportModelAdmin):
         }),
     )
     
+    @property
+    def show_full_result_count(self):
+        # The "N total" link runs an unfiltered COUNT(*) on every page load
+        return not admin_fast_mode_enabled()
+    
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if admin_fast_mode_enabled():
+            return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page)
+        return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+    
+    def get_list_display(self, request):
+        list_display = super().get_list_display(request)
+        if admin_fast_mode_enabled():
+            return ['discount' if name == 'discount_percentage' else name for name in list_display]
+        return list_display
+    
+    def get_list_filter(self, request):
+        if admin_fast_mode_enabled():
+            return [BrandInputFilter, ModelInputFilter, TypeInputFilter, 'is_active', 'created_at', 'updated_at']
+        return super().get_list_filter(request)
+    
+    def get_search_fields(self, request):
+        if admin_fast_mode_enabled():
+            # Prefix matches instead of scanning every value with icontains
+            return ['^brand', '^model', '=type', '^product_name']
+        return super().get_search_fields(request)
+    
+    @admin.display(description='discount percentage', ordering='discount_pct')
+    def discount(self, obj):
+        """Discount percentage as stored by the database (sortable)."""
+        return obj.discount_pct
+    
     # Customize the import/export options
     def get_import_resource_classes(self, request):
         """
         Return available resource classes for import with descriptions.
         """
-        return [
-            ServicePriceResourceSmart,      # Smart duplicate handling with detailed reporting
-            ServicePriceResource,           # Standard upsert functionality  
-            ServicePriceResourceWithMapping, # With flexible column name mapping
-            SimpleServicePriceResource      # Always create new records (use with caution)
-        ]
+        # Smart duplicate handling, standard upsert, column mapping, always create
+        return list(SERVICE_PRICE_RESOURCES)
     
     def get_export_resource_class(self):
         """
         Return the default resource class for export.
         """
+        from .resources import ServicePriceResource
         return ServicePriceResource
     
     # Add custom actions
-    actions = ['activate_selected', 'deactivate_selected']
+    actions = ['activate_selected', 'deactivate_selected', 'export_selected_csv', 'export_selected_xlsx']
     
     def activate_selected(self, request, queryset):
         """Activate selected service prices."""
-        updated = queryset.update(is_active=True)
+        updated = self._set_active(queryset, True)
         self.message_user(request, f'{updated} service prices were activated.')
     activate_selected.short_description = "Activate selected service prices"
     
     def deactivate_selected(self, request, queryset):
         """Deactivate selected service prices."""
-        updated = queryset.update(is_active=False)
+        updated = self._set_active(queryset, False)
         self.message_user(request, f'{updated} service prices were deactivated.')
     deactivate_selected.short_description = "Deactivate selected service prices"
+    
+    def _set_active(self, queryset, is_active):
+        # The action queryset keeps the changelist filters (e.g. is_active=Yes),
+        # so it may no longer match the rows once they are updated
+        pks = list(queryset.values_list('pk', flat=True))
+        updated = ServicePrice.objects.filter(pk__in=pks).update(is_active=is_active)
+        # update() bypasses the model signals
+        changed = ServicePrice.objects.filter(pk__in=pks)
+        record_queryset_changes(changed)
+        mark_queryset_brands(changed)
+        notify_catalog_changed('admin')
+        return updated
+    
+    def export_selected_csv(self, request, queryset):
+        """Stream selected service prices as CSV without building the file in memory."""
+        return export_service_prices(queryset.order_by('brand', 'model', 'type', 'product_name'), 'csv')
+    export_selected_csv.short_description = "Export selected service prices (streaming CSV)"
+    
+    def export_selected_xlsx(self, request, queryset):
+        """
+        Export selected service prices with a write-only workbook, written to a
+        temporary file and sent once complete (not streamed).
+        """
+        return export_service_prices(queryset.order_by('brand', 'model', 'type', 'product_name'), 'xlsx')
+    export_selected_xlsx.short_description = "Export selected service prices (XLSX, low memory)"
 
 
 admin.site.register(ServiceCategory, ServiceCategoryAdmin)
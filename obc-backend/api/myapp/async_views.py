@@ -0,0 +1,261 @@
+"""
+Native async variants of the catalog views for the ASGI stack.
+
+DRF's APIView is synchronous, so under ASGI every request to the catalog
+views is handed to a thread for its whole lifetime. These views are plain
+async Django views with the same URLs, parameters and response bodies:
+
+- AsyncServiceCategoryListView -> ServiceCategoryListView
+- AsyncServicesByCategoryView  -> ServicesByCategoryView
+- AsyncAllServicesView         -> AllServicesView
+- AsyncServicePriceListView    -> ServicePriceListView
+
+Queries use Django's async ORM and only occupy a thread while they run;
+payload store hits are served without one. Independent lookups run
+concurrently: the category is fetched while the price index is mapped.
+Django runs the async ORM queries of one request on one thread, so the
+gain is in the number of requests a worker can keep in flight.
+
+Like the DRF views they replace, every view applies the DEFAULT_AUTHENTICATION_CLASSES,
+DEFAULT_PERMISSION_CLASSES and DEFAULT_THROTTLE_CLASSES of REST_FRAMEWORK
+(see APIPolicyMixin); the checks run in a thread, as they may query the
+database or the cache.
+
+Responses are negotiated between FastJSONRenderer and MessagePackRenderer
+(``Accept: application/msgpack`` or ``?format=msgpack``); the browsable API
+is only available on the sync views.
+
+PriceStreamView has no sync counterpart: it streams live price deltas as
+server-sent events (see myapp.price_stream) and needs api.asgi, since a WSGI
+worker would be held for the whole stream. It is only routed with
+CATALOG_ASYNC_VIEWS.
+
+Settings:
+- CATALOG_ASYNC_VIEWS: route the catalog URLs to these views and the price
+  stream URL (default: False; enable when serving api.asgi)
+- CATALOG_STREAM_HEARTBEAT_SECONDS: idle seconds before a price stream sends a
+  keep-alive comment (default: 15)
+"""
+
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.generics import GenericAPIView
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
+
+from .catalog import abuild_services_by_category, aget_category
+from .fast_serializers import (
+    serialize_service_price_rows, serialize_service_rows, service_price_rows, service_rows,
+)
+from .filters import filter_service_prices, filter_services
+from .models import Service, ServiceCategory, ServicePrice
+from .payload_store import aget_payload, is_enabled as payload_store_enabled, payload_response
+from .price_index import get_price_index
+from .price_stream import RESYNC, Subscription, get_broker
+from .renderers import FastJSONRenderer, MessagePackRenderer
+from .replicas import AsyncReplicaReadMixin
+from .serializers import ServiceCategorySerializer
+
+DEFAULT_STREAM_HEARTBEAT_SECONDS = 15
+
+
+def _renderer(request):
+    if request.GET.get('format') == MessagePackRenderer.format:
+        return MessagePackRenderer()
+    if MessagePackRenderer.media_type in request.headers.get('Accept', ''):
+        return MessagePackRenderer()
+    return FastJSONRenderer()
+
+
+def catalog_response(request, data, status=200):
+    """Render response data with the negotiated catalog renderer."""
+    renderer = _renderer(request)
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f'{content_type}; charset={renderer.charset}'
+    response = HttpResponse(renderer.render(data), content_type=content_type, status=status)
+    response['Vary'] = 'Accept'
+    return response
+
+
+async def paginated_rows(request, rows, serialize):
+    """
+    Serialized rows, paginated like the DRF list views when a default
+    pagination class is configured.
+    """
+    pagination_class = GenericAPIView.pagination_class
+    if pagination_class is None:
+        return serialize([row async for row in rows])
+
+    def paginate():
+        paginator = pagination_class()
+        page = paginator.paginate_queryset(rows, Request(request))
+        if page is None:
+            return serialize(list(rows))
+        return paginator.get_paginated_response(serialize(page)).data
+    return await sync_to_async(paginate)()
+
+
+class APIPolicyMixin:
+    """
+    Authenticate, check permissions and throttle an async view's requests
+    with DRF's API policies, the way APIView.initial() does for sync views.
+    """
+    authentication_classes = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    permission_classes = api_settings.DEFAULT_PERMISSION_CLASSES
+    throttle_classes = api_settings.DEFAULT_THROTTLE_CLASSES
+
+    async def dispatch(self, request, *args, **kwargs):
+        api_view = APIView(
+            authentication_classes=self.authentication_classes,
+            permission_classes=self.permission_classes,
+            throttle_classes=self.throttle_classes,
+        )
+        api_view.args, api_view.kwargs, api_view.headers = args, kwargs, {}
+        api_view.request = api_view.initialize_request(request, *args, **kwargs)
+        try:
+            await sync_to_async(api_view.initial)(api_view.request, *args, **kwargs)
+        except APIException as exc:
+            # 401 or 403, with the WWW-Authenticate or Retry-After header of APIView
+            error = api_view.handle_exception(exc)
+            response = catalog_response(request, error.data, status=error.status_code)
+            for header, value in error.items():
+                response[header] = value
+            return response
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncServiceCategoryListView(AsyncReplicaReadMixin, APIPolicyMixin, View):
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request):
+        categories = ServiceCategory.objects.filter(is_active=True).prefetch_related('services')
+        return catalog_response(request, await paginated_rows(
+            request, categories, lambda page: ServiceCategorySerializer(page, many=True).data
+        ))
+
+
+class AsyncServicesByCategoryView(AsyncReplicaReadMixin, APIPolicyMixin, View):
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request, category_identifier):
+        brand = request.GET.get('brand')
+        model = request.GET.get('model')
+        try:
+            # Plain JSON responses are served pre-rendered from the payload store
+            if payload_store_enabled() and isinstance(_renderer(request), FastJSONRenderer) \
+                    and 'indent=' not in request.headers.get('Accept', ''):
+                entry = await aget_payload(category_identifier, brand, model)
+                if entry is not None:
+                    return payload_response(request, entry)
+
+            if brand and model:
+                category, price_index = await asyncio.gather(
+                    aget_category(category_identifier),
+                    sync_to_async(get_price_index, thread_sensitive=False)(),
+                )
+            else:
+                category, price_index = await aget_category(category_identifier), None
+            data = await abuild_services_by_category(category, brand, model, price_index)
+            return catalog_response(request, data)
+
+        except ServiceCategory.DoesNotExist:
+            return catalog_response(request, {
+                'error': f'Service category "{category_identifier}" not found.'
+            }, status=404)
+        except Exception as e:
+            return catalog_response(request, {
+                'error': str(e)
+            }, status=500)
+
+
+class AsyncAllServicesView(AsyncReplicaReadMixin, APIPolicyMixin, View):
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request):
+        rows = service_rows(filter_services(Service.objects.filter(is_active=True), request.GET))
+        return catalog_response(request, await paginated_rows(request, rows, serialize_service_rows))
+
+
+class AsyncServicePriceListView(AsyncReplicaReadMixin, APIPolicyMixin, View):
+    http_method_names = ['get', 'head', 'options']
+
+    async def get(self, request):
+        rows = service_price_rows(filter_service_prices(ServicePrice.objects.filter(is_active=True), request.GET))
+        return catalog_response(request, await paginated_rows(request, rows, serialize_service_price_rows))
+
+
+class PriceStreamView(APIPolicyMixin, View):
+    """
+    Server-sent events with the price changes of a car and/or category.
+
+    Query parameters: ``brand`` and ``model`` (brand-generic prices are
+    included), ``category`` (slug or name, like the services-by-category
+    URL). Each ``prices`` event carries ``{version, changed, removed}``:
+    the changed prices in the service-prices list format and the ids of
+    removed prices. A ``resync`` event asks the client to reload the
+    category and reconnect.
+    """
+    http_method_names = ['get', 'options']
+
+    async def get(self, request):
+        brand = request.GET.get('brand') or None
+        model = request.GET.get('model', '')
+        category_identifier = request.GET.get('category')
+        if not brand and not category_identifier:
+            return catalog_response(request, {
+                'status': 'error',
+                'message': 'Subscribe with brand (and model) and/or category.'
+            }, status=400)
+
+        since = request.headers.get('Last-Event-ID') or request.GET.get('since')
+        try:
+            since = int(since) if since else None
+        except ValueError:
+            return catalog_response(request, {
+                'status': 'error',
+                'message': 'Last-Event-ID must be an integer.'
+            }, status=400)
+
+        category_id = None
+        if category_identifier:
+            try:
+                category_id = (await aget_category(category_identifier)).pk
+            except ServiceCategory.DoesNotExist:
+                return catalog_response(request, {
+                    'error': f'Service category "{category_identifier}" not found.'
+                }, status=404)
+
+        broker = get_broker()
+        subscription = Subscription(brand, model, category_id)
+        await broker.subscribe(subscription, since)
+        response = StreamingHttpResponse(self.events(broker, subscription), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Don't let a reverse proxy buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def events(self, broker, subscription):
+        heartbeat = getattr(settings, 'CATALOG_STREAM_HEARTBEAT_SECONDS', DEFAULT_STREAM_HEARTBEAT_SECONDS)
+        renderer = FastJSONRenderer()
+        try:
+            yield b'retry: 5000\n\n'
+            while True:
+                try:
+                    delta = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b': keep-alive\n\n'
+                    continue
+                if delta is RESYNC:
+                    yield b'event: resync\ndata: {}\n\n'
+                    return
+                yield b'id: %d\nevent: prices\ndata: %s\n\n' % (delta['version'], renderer.render(delta))
+        finally:
+            # Also runs when the client disconnects and the stream is cancelled
+            broker.unsubscribe(subscription)
@@ -0,0 +1,106 @@
+"""
+JWT authentication without a user query per request.
+
+SimpleJWT's JWTAuthentication loads the user row on every authenticated
+request. CachedJWTAuthentication verifies the access token the same way,
+then takes the user's state from a short-lived cache and only queries the
+database on a miss. The password hash is not cached; with SimpleJWT's
+CHECK_REVOKE_TOKEN only its digest is kept for the revoke claim check.
+
+Saving or deleting a user drops its cache entry (see myapp.signals), so a
+deactivated user is rejected on the next request. Use a shared cache
+(Redis, Memcached) when several processes serve the API: with a
+per-process cache, other processes keep the old state for up to
+AUTH_USER_CACHE_TIMEOUT seconds. Queryset ``update()`` calls bypass the
+signals; call invalidate_cached_user() for the updated users.
+
+Enable it in settings:
+
+    REST_FRAMEWORK = {
+        'DEFAULT_AUTHENTICATION_CLASSES': ['myapp.authentication.CachedJWTAuthentication'],
+    }
+
+Settings:
+- AUTH_USER_CACHE: cache alias holding the user states (default: 'default')
+- AUTH_USER_CACHE_TIMEOUT: seconds a user state is kept (default: 60)
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+DEFAULT_TIMEOUT = 60
+REVOKE_HASH_KEY = '_revoke_hash'
+
+
+def get_cache():
+    return caches[getattr(settings, 'AUTH_USER_CACHE', 'default')]
+
+
+def user_cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def invalidate_cached_user(user):
+    """Drop the cached state of a user; the next request reloads it."""
+    get_cache().delete(user_cache_key(getattr(user, api_settings.USER_ID_FIELD)))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves the token's user from a short-TTL cache."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        cache = get_cache()
+        key = user_cache_key(user_id)
+        state = cache.get(key)
+        if state is None:
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            state = self._user_state(user)
+            cache.set(key, state, timeout=getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+        else:
+            user = self._user_from_state(state)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != state.get(REVOKE_HASH_KEY):
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return user
+
+    def _user_state(self, user):
+        """Concrete field values of a user, without the password hash."""
+        state = {
+            field.attname: getattr(user, field.attname)
+            for field in self.user_model._meta.concrete_fields
+            if field.attname != 'password'
+        }
+        if api_settings.CHECK_REVOKE_TOKEN:
+            state[REVOKE_HASH_KEY] = get_md5_hash_password(user.password)
+        return state
+
+    def _user_from_state(self, state):
+        """A user instance built from cached state; its password is loaded on access."""
+        field_names = [name for name in state if name != REVOKE_HASH_KEY]
+        return self.user_model.from_db(
+            router.db_for_read(self.user_model),
+            field_names,
+            [state[name] for name in field_names],
+        )
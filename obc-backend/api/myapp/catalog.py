@@ -0,0 +1,236 @@
+"""
+Response data of the services-by-category and price quote endpoints.
+
+Shared by ServicesByCategoryView and the pre-rendered payload store, so a
+stored payload is byte-for-byte what the view would render.
+"""
+
+import logging
+
+from django.db.models import Value
+from django.db.models.functions import Lower, Upper
+
+from .fast_serializers import annotate_real_prices, serialize_service_rows, service_rows
+from .models import Service, ServiceCategory, ServicePrice
+from .price_index import get_price_index
+from .pricing import is_generic_model, resolve_price
+
+logger = logging.getLogger(__name__)
+
+
+def _categories_named(category_identifier):
+    """
+    Active categories whose name matches case-insensitively, with dashes as
+    spaces. Compared as UPPER(name) so servicecategory_name_upper_idx is used.
+    """
+    return ServiceCategory.objects.alias(name_upper=Upper('name')).filter(
+        name_upper=Upper(Value(category_identifier.replace('-', ' '))),
+        is_active=True
+    )
+
+
+def get_category(category_identifier):
+    """Active category by slug, or by name with dashes as spaces. Raises DoesNotExist."""
+    try:
+        return ServiceCategory.objects.get(
+            slug=category_identifier,
+            is_active=True
+        )
+    except ServiceCategory.DoesNotExist:
+        #if slug not found, try by name
+        return _categories_named(category_identifier).get()
+
+
+async def aget_category(category_identifier):
+    """get_category() on the async ORM."""
+    try:
+        return await ServiceCategory.objects.aget(
+            slug=category_identifier,
+            is_active=True
+        )
+    except ServiceCategory.DoesNotExist:
+        return await _categories_named(category_identifier).aget()
+
+
+def build_services_by_category(category, brand=None, model=None):
+    """Response data for a category, priced for the given brand/model when both are set."""
+    services = Service.objects.filter(
+        category=category,
+        is_active=True
+    ).order_by('-is_featured', 'created_at')
+
+    resolved_prices = None
+    with_prices = False
+    price_index = get_price_index() if brand and model else None
+    if price_index is not None:
+        # Resolve from the shared in-memory index instead of per-service subqueries
+        rows = list(service_rows(services))
+        resolved_prices = {
+            row[0]: price_index.resolve(brand, model, row[0]) for row in rows
+        }
+
+    # If brand and model are provided, annotate with real prices
+    elif brand and model:
+        try:
+            services = annotate_real_prices(services, brand, model)
+            with_prices = True
+        except Exception as e:
+            # Log the error but continue with fallback pricing
+            logger.warning(f"Error fetching real-time prices: {str(e)}")
+            brand = None
+            model = None
+
+    if resolved_prices is None:
+        rows = service_rows(services, with_prices=with_prices)
+
+    # Build the response rows straight from the values, like ServiceSerializer would
+    services_data = serialize_service_rows(rows, brand, model, resolved_prices)
+    return _services_by_category_data(category, services_data, brand, model)
+
+
+async def abuild_services_by_category(category, brand=None, model=None, price_index=None):
+    """
+    build_services_by_category() on the async ORM. The caller passes the
+    price index (or None), so it can be loaded concurrently with the category.
+    """
+    services = Service.objects.filter(
+        category=category,
+        is_active=True
+    ).order_by('-is_featured', 'created_at')
+
+    resolved_prices = None
+    with_prices = False
+    if brand and model and price_index is not None:
+        rows = [row async for row in service_rows(services)]
+        resolved_prices = {
+            row[0]: price_index.resolve(brand, model, row[0]) for row in rows
+        }
+    elif brand and model:
+        try:
+            services = annotate_real_prices(services, brand, model)
+            with_prices = True
+        except Exception as e:
+            logger.warning(f"Error fetching real-time prices: {str(e)}")
+            brand = None
+            model = None
+
+    if resolved_prices is None:
+        rows = [row async for row in service_rows(services, with_prices=with_prices)]
+
+    services_data = serialize_service_rows(rows, brand, model, resolved_prices)
+    return _services_by_category_data(category, services_data, brand, model)
+
+
+def _services_by_category_data(category, services_data, brand, model):
+    return {
+        'category': {
+            'id': category.id,
+            'name': category.name,
+            'description': category.description,
+            'icon': category.icon,
+            'slug': category.slug,
+        },
+        'services': services_data,
+        'total_services': len(services_data),
+        'pricing_context': {
+            'brand': brand,
+            'model': model,
+            'has_real_pricing': bool(brand and model)
+        }
+    }
+
+
+def _resolve_from_database(items):
+    """
+    ``{(service id, brand, model): (price, price_status)}`` for all items with
+    one query over the price links of the requested services and brands.
+    """
+    rows = ServicePrice.matched_services.through.objects.filter(
+        serviceprice__is_active=True,
+        service_id__in={service_id for service_id, _, _ in items}
+    ).annotate(
+        brand_key=Lower('serviceprice__brand')
+    ).filter(
+        brand_key__in={brand.lower() for _, brand, _ in items}
+    ).order_by(
+        *(f'serviceprice__{field}' for field in ServicePrice._meta.ordering)
+    ).values_list(
+        'brand_key', 'serviceprice__model', 'service_id',
+        'serviceprice__discounted_price', 'serviceprice__after_price'
+    )
+
+    # The first row in the default ordering wins, like the view's subqueries
+    model_specific = {}
+    brand_generic = {}
+    for brand_key, model, service_id, discounted, after in rows:
+        model_specific.setdefault((brand_key, (model or '').lower(), service_id), (discounted, after))
+        if is_generic_model(model):
+            brand_generic.setdefault((brand_key, service_id), (discounted, after))
+
+    return {
+        (service_id, brand, model): resolve_price(
+            model_specific.get((brand.lower(), model.lower(), service_id)),
+            brand_generic.get((brand.lower(), service_id)),
+        )
+        for service_id, brand, model in items
+    }
+
+
+def build_price_quotes(items):
+    """
+    Price quotes for ``(service id, brand, model)`` items, in request order.
+
+    Prices follow ServiceSerializer's real_price/display_price/price_status
+    rules; items without both a brand and a model get the service's default
+    price. Unknown or inactive services are listed in ``not_found``.
+    """
+    services = {row[0]: row for row in service_rows(
+        Service.objects.filter(pk__in={service_id for service_id, _, _ in items}, is_active=True)
+    )}
+    priced = [
+        (service_id, brand, model) for service_id, brand, model in items
+        if service_id in services and brand and model
+    ]
+
+    resolved = {}
+    if priced:
+        price_index = get_price_index()
+        if price_index is not None:
+            resolved = {item: price_index.resolve(item[1], item[2], item[0]) for item in priced}
+        else:
+            resolved = _resolve_from_database(priced)
+
+    # One serializer pass per car, so prices are formatted exactly like the category view
+    by_car = {}
+    for service_id, brand, model in items:
+        if service_id in services:
+            by_car.setdefault((brand, model), set()).add(service_id)
+    serialized = {}
+    for (brand, model), service_ids in by_car.items():
+        resolved_prices = {
+            service_id: resolved[(service_id, brand, model)]
+            for service_id in service_ids if (service_id, brand, model) in resolved
+        }
+        for service in serialize_service_rows(
+            [services[service_id] for service_id in service_ids], brand, model, resolved_prices
+        ):
+            serialized[(service['id'], brand, model)] = service
+
+    quotes = []
+    not_found = []
+    for service_id, brand, model in items:
+        service = serialized.get((service_id, brand, model))
+        if service is None:
+            not_found.append(service_id)
+            continue
+        quotes.append({
+            'service_id': service_id,
+            'header': service['header'],
+            'brand': brand,
+            'model': model,
+            'price': service['price'],
+            'real_price': service['real_price'],
+            'display_price': service['display_price'],
+            'price_status': service['price_status'],
+        })
+    return {'quotes': quotes, 'not_found': not_found}
@@ -0,0 +1,258 @@
+"""
+Catalog change feed for delta sync clients.
+
+Every create, update, deactivation or deletion of a ServiceCategory, Service
+or ServicePrice appends a CatalogChange row. Once committed, the row gets a
+sequence number that clients keep as their ``since`` token; a sync returns
+the current state of everything that changed after it, so a client
+downloads only the delta instead of the whole catalog.
+
+Features:
+- Model saves/deletes are recorded by the receivers in myapp.signals
+- Bulk and raw SQL writers (imports, admin actions) record with record_changes()
+  or record_queryset_changes()
+- Inside a catalog_batch() the changes are collected and written in one
+  insert when the batch ends, so a long import doesn't hold sequence numbers
+  open for its whole duration
+- Sequence numbers follow commit order: committed entries that have none
+  yet are numbered by publish_changes(), so a transaction that took a lower
+  id but committed later is served after the entries already read, never
+  skipped. Writers publish once their change committed (catalog_changed);
+  readers only open a transaction when an exists check finds entries left
+- Entries older than CATALOG_CHANGE_RETENTION are deleted by
+  ``manage.py cleanup_catalog_changes``; a ``since`` token from before the
+  retained feed raises ChangesExpired (410 Gone at the sync endpoint), and the
+  client resyncs from the snapshot (see myapp.snapshot)
+
+Settings:
+- CATALOG_SYNC_MAX_LIMIT: largest page a client can ask for (default: 5000)
+- CATALOG_CHANGE_RETENTION: seconds a change entry is kept, None to keep them (default: 30 days)
+"""
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, connections, router, transaction
+from django.db.models import F, Max, Min
+from django.utils import timezone
+
+from .fast_serializers import (
+    SERVICE_COLUMNS, serialize_service_price_rows, serialize_service_rows, service_price_rows,
+)
+from .models import CatalogChange, Service, ServiceCategory, ServicePrice
+from .signals import current_batch
+
+logger = logging.getLogger(__name__)
+
+ENTITY_MODELS = {
+    'category': ServiceCategory,
+    'service': Service,
+    'price': ServicePrice,
+}
+MODEL_ENTITIES = {model: entity for entity, model in ENTITY_MODELS.items()}
+
+DEFAULT_LIMIT = 1000
+DEFAULT_MAX_LIMIT = 5000
+DEFAULT_RETENTION = 30 * 24 * 60 * 60
+
+CATEGORY_FIELDS = ('id', 'name', 'description', 'icon', 'slug')
+
+
+def _action(is_active):
+    return 'upsert' if is_active else 'deactivate'
+
+
+# ----------------------------------------------------------------------
+# Recording
+# ----------------------------------------------------------------------
+def record_changes(entity, changes):
+    """
+    Record ``(object_id, action)`` pairs of one entity. Within a
+    catalog_batch() they are written when the batch ends.
+    """
+    batch = current_batch()
+    if batch is not None:
+        pending = batch.setdefault('changes', {})
+        for object_id, action in changes:
+            # Clients only read the current row, so the latest action per object is enough
+            pending.pop((entity, object_id), None)
+            pending[(entity, object_id)] = action
+        return
+    _write([(entity, object_id, action) for object_id, action in changes])
+
+
+def record_instance_change(instance, deleted=False):
+    """Record a saved or deleted category, service or price."""
+    action = 'delete' if deleted else _action(instance.is_active)
+    record_changes(MODEL_ENTITIES[type(instance)], [(instance.pk, action)])
+
+
+def record_queryset_changes(queryset):
+    """Record the current active state of every row of a queryset (after a bulk update)."""
+    record_changes(
+        MODEL_ENTITIES[queryset.model],
+        [(object_id, _action(is_active)) for object_id, is_active in queryset.values_list('id', 'is_active')]
+    )
+
+
+def flush_batch_changes(batch):
+    """Write the changes collected by a catalog_batch()."""
+    pending = batch.pop('changes', None)
+    if pending:
+        _write([(entity, object_id, action) for (entity, object_id), action in pending.items()])
+
+
+def _write(changes):
+    if not changes:
+        return
+    now = timezone.now()
+    CatalogChange.objects.bulk_create(
+        [
+            CatalogChange(entity=entity, object_id=object_id, action=action, created_at=now)
+            for entity, object_id, action in changes
+        ],
+        batch_size=1000
+    )
+
+
+# ----------------------------------------------------------------------
+# Publishing
+# ----------------------------------------------------------------------
+# Advisory lock serializing publish_changes() on PostgreSQL
+PUBLISH_LOCK_ID = 0x6f62635f66656564
+
+
+def publish_changes():
+    """
+    Give the committed entries without a sequence number the next ones, in id
+    order, and return the latest sequence number.
+
+    Only committed rows are visible here, so an entry gets its number after
+    its transaction committed: later than every entry already served, even
+    when its id is lower. One UPDATE numbers a whole import (sequence = id +
+    offset), which leaves gaps but keeps the numbers increasing.
+    """
+    alias = router.db_for_write(CatalogChange)
+    changes = CatalogChange.objects.using(alias)
+    if not changes.filter(sequence__isnull=True).exists():
+        # Nothing to number: no write transaction, no lock
+        return changes.aggregate(latest=Max('sequence'))['latest'] or 0
+    try:
+        with transaction.atomic(using=alias):
+            connection = connections[alias]
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_xact_lock(%s)', [PUBLISH_LOCK_ID])
+            first = changes.filter(sequence__isnull=True).aggregate(first=Min('id'))['first']
+            latest = changes.aggregate(latest=Max('sequence'))['latest'] or 0
+            if first is None:
+                return latest
+            # Rows committed meanwhile with a lower id wait for the next call
+            changes.filter(sequence__isnull=True, id__gte=first).update(sequence=F('id') + (latest + 1 - first))
+            return changes.aggregate(latest=Max('sequence'))['latest']
+    except DatabaseError as e:
+        # A concurrent publisher won (e.g. SQLite's single writer); its numbers are as good
+        logger.warning(f"Publishing catalog changes deferred: {str(e)}")
+        return changes.aggregate(latest=Max('sequence'))['latest'] or 0
+
+
+# ----------------------------------------------------------------------
+# Retention
+# ----------------------------------------------------------------------
+class ChangesExpired(Exception):
+    """The ``since`` token predates the retained change feed; the client has to resync."""
+
+
+def cleanup_changes(max_age=None):
+    """
+    Delete the entries older than ``max_age`` seconds (default:
+    CATALOG_CHANGE_RETENTION). The newest of them is kept: the first retained
+    sequence number tells which ``since`` tokens can still be served.
+    Returns the number of entries deleted.
+    """
+    if max_age is None:
+        max_age = getattr(settings, 'CATALOG_CHANGE_RETENTION', DEFAULT_RETENTION)
+        if max_age is None:
+            return 0
+    publish_changes()
+    horizon = CatalogChange.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=max_age), sequence__isnull=False
+    ).aggregate(horizon=Max('sequence'))['horizon']
+    if horizon is None:
+        return 0
+    deleted, _ = CatalogChange.objects.filter(sequence__lt=horizon).delete()
+    if deleted:
+        logger.info(f"🧹 Deleted {deleted} catalog changes before sequence {horizon}")
+    return deleted
+
+
+def check_retained(since):
+    """Raise ChangesExpired when entries after ``since`` may have been deleted."""
+    first = CatalogChange.objects.aggregate(first=Min('sequence'))['first']
+    # Every sequence number below the first retained one is gone (or was never used)
+    if first is not None and since + 1 < first:
+        raise ChangesExpired(f'Changes before {first} are no longer kept; resync from the snapshot')
+
+
+# ----------------------------------------------------------------------
+# Reading
+# ----------------------------------------------------------------------
+def get_max_limit():
+    return getattr(settings, 'CATALOG_SYNC_MAX_LIMIT', DEFAULT_MAX_LIMIT)
+
+
+def changes_since(since=0, limit=DEFAULT_LIMIT):
+    """
+    Catalog delta after the ``since`` sequence number.
+
+    Returns the current representation of every active row that changed
+    (same fields as the catalog list endpoints; services also carry their
+    category id) and the ids of the rows that were deactivated or deleted.
+    ``next`` is the token for the following call; ``has_more`` tells whether
+    another page is waiting. Raises ChangesExpired when ``since`` predates the
+    retained feed.
+    """
+    publish_changes()
+    check_retained(since)
+    entries = list(
+        CatalogChange.objects.filter(sequence__gt=since).order_by('sequence')
+        .values_list('sequence', 'entity', 'object_id')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    changed = {entity: set() for entity in ENTITY_MODELS}
+    for _, entity, object_id in entries:
+        changed[entity].add(object_id)
+
+    categories = list(
+        ServiceCategory.objects.filter(pk__in=changed['category'], is_active=True)
+        .order_by('id').values(*CATEGORY_FIELDS)
+    ) if changed['category'] else []
+
+    services = []
+    if changed['service']:
+        rows = list(
+            Service.objects.filter(pk__in=changed['service'], is_active=True)
+            .order_by('id').values_list(*SERVICE_COLUMNS, 'category_id')
+        )
+        services = serialize_service_rows(rows)
+        for service, row in zip(services, rows):
+            service['category'] = row[-1]
+
+    prices = serialize_service_price_rows(service_price_rows(
+        ServicePrice.objects.filter(pk__in=changed['price'], is_active=True).order_by('id')
+    )) if changed['price'] else []
+
+    def removed(entity, current):
+        return sorted(changed[entity] - {item['id'] for item in current})
+
+    return {
+        'since': since,
+        'next': entries[-1][0] if entries else since,
+        'has_more': has_more,
+        'categories': {'changed': categories, 'removed': removed('category', categories)},
+        'services': {'changed': services, 'removed': removed('service', services)},
+        'prices': {'changed': prices, 'removed': removed('price', prices)},
+    }
@@ -0,0 +1,103 @@
+"""
+In-sheet duplicate collapsing for ServicePrice imports.
+
+A sheet may repeat the same (brand, model, type, product_name) key several
+times. Before rows reach an import strategy, repeated keys are collapsed so
+the database sees exactly one write per distinct key.
+
+Keys are normalized (trimmed, lower-cased) and hashed into a fixed-size
+digest, so tracking the keys of a large sheet stays compact.
+
+Policies:
+- 'last': the last occurrence of a key wins (default)
+- 'first': the first occurrence of a key wins
+- 'error': any repeated key rejects the import
+
+The default policy can be changed with the IMPORT_DUPLICATE_POLICY setting.
+"""
+
+import hashlib
+
+from django.conf import settings
+
+from .price_rows import KEY_FIELDS, normalize_key_part, row_value
+
+DUPLICATE_POLICIES = ('last', 'first', 'error')
+DEFAULT_DUPLICATE_POLICY = 'last'
+
+
+class DuplicateKeyError(ValueError):
+    """Raised by the 'error' policy; ``duplicates`` lists every repeated row."""
+
+    def __init__(self, duplicates):
+        self.duplicates = duplicates
+        super().__init__(f'{len(duplicates)} rows repeat a key that already appears in the sheet')
+
+
+def get_default_policy():
+    return getattr(settings, 'IMPORT_DUPLICATE_POLICY', DEFAULT_DUPLICATE_POLICY)
+
+
+def key_digest(row):
+    """
+    Hash of the normalized unique key of a sheet row, or None when the row
+    has no brand or product name (those rows are left for validation).
+    """
+    parts = [normalize_key_part(row_value(row, field)) for field in KEY_FIELDS]
+    if not parts[0] or not parts[3]:
+        return None
+    return hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=16).digest()
+
+
+def collapse_duplicates(records, policy=None, refs=None):
+    """
+    Collapse rows that repeat a key according to ``policy``.
+
+    ``refs`` identifies each record in the report (defaults to 1-based row
+    numbers). Returns ``(kept_records, kept_refs, collapsed)`` where
+    ``collapsed`` lists the dropped rows and the row that was kept instead.
+    Raises DuplicateKeyError for the 'error' policy when any key repeats.
+    """
+    policy = policy or get_default_policy()
+    if policy not in DUPLICATE_POLICIES:
+        raise ValueError(f"Unknown duplicate policy '{policy}'. Use one of: {', '.join(DUPLICATE_POLICIES)}")
+    if refs is None:
+        refs = list(range(1, len(records) + 1))
+
+    kept_index = {}
+    dropped = set()
+    collapsed = []
+    for index, row in enumerate(records):
+        digest = key_digest(row)
+        if digest is None:
+            continue
+        previous = kept_index.get(digest)
+        if previous is None:
+            kept_index[digest] = index
+            continue
+
+        if policy == 'last':
+            dropped_index, winner = previous, index
+            kept_index[digest] = index
+        else:
+            # 'first' keeps the first row; 'error' reports every repeat against it
+            dropped_index, winner = index, previous
+        dropped.add(dropped_index)
+        collapsed.append({
+            'row': refs[dropped_index],
+            'kept_row': refs[winner],
+            **{field: row_value(records[dropped_index], field) for field in KEY_FIELDS},
+        })
+
+    if policy == 'error' and collapsed:
+        raise DuplicateKeyError(collapsed)
+
+    # With 'last', a key repeated three times names an intermediate row as
+    # kept_row for the first drop; point every entry at the final winner.
+    if policy == 'last':
+        for entry in collapsed:
+            entry['kept_row'] = refs[kept_index[key_digest(entry)]]
+
+    kept_records = [row for index, row in enumerate(records) if index not in dropped]
+    kept_refs = [ref for index, ref in enumerate(refs) if index not in dropped]
+    return kept_records, kept_refs, collapsed
@@ -0,0 +1,92 @@
+"""
+Streaming export of ServicePrice data.
+
+Unlike the django-import-export export (which builds a tablib Dataset and a
+full workbook in memory before sending anything), these helpers iterate the
+queryset in chunks and keep memory flat regardless of the row count:
+
+- CSV is written row by row into a StreamingHttpResponse, so the download
+  starts with the first chunk.
+- XLSX is written with openpyxl's write_only mode into a temporary file and
+  then streamed with a FileResponse (the zip container can only be finalized
+  once all rows are written).
+"""
+
+import csv
+import tempfile
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+# Same columns and headers as ServicePriceResource.get_export_headers()
+EXPORT_FIELDS = (
+    'brand', 'model', 'type', 'product_name',
+    'before_price', 'after_price', 'discounted_price', 'link'
+)
+EXPORT_HEADERS = [
+    'Brand', 'Model', 'Type', 'Product Name',
+    'Before Price', 'After Price', 'Discounted Price', 'Link'
+]
+
+EXPORT_FORMATS = ('csv', 'xlsx')
+DEFAULT_CHUNK_SIZE = 2000
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class Echo:
+    """Pseudo-buffer whose write() returns the value, for streaming csv.writer output."""
+
+    def write(self, value):
+        return value
+
+
+def iter_export_rows(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield export rows as tuples without caching the queryset."""
+    return queryset.values_list(*EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+
+
+def export_filename(extension):
+    return f"service_prices_{timezone.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+
+
+def stream_service_prices_csv(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return a StreamingHttpResponse that writes the queryset as CSV."""
+    writer = csv.writer(Echo())
+
+    def generate():
+        yield writer.writerow(EXPORT_HEADERS)
+        for row in iter_export_rows(queryset, chunk_size):
+            yield writer.writerow(['' if value is None else value for value in row])
+
+    response = StreamingHttpResponse(generate(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{export_filename("csv")}"'
+    return response
+
+
+def service_prices_xlsx_response(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Return a FileResponse with the queryset written by a write-only openpyxl workbook."""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Service Prices')
+    sheet.append(EXPORT_HEADERS)
+    for row in iter_export_rows(queryset, chunk_size):
+        sheet.append(row)
+
+    output = tempfile.TemporaryFile()
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(
+        output,
+        as_attachment=True,
+        filename=export_filename('xlsx'),
+        content_type=XLSX_CONTENT_TYPE
+    )
+
+
+def export_service_prices(queryset, file_format='csv', chunk_size=DEFAULT_CHUNK_SIZE):
+    """Build the streaming export response for the given format ('csv' or 'xlsx')."""
+    if file_format == 'xlsx':
+        return service_prices_xlsx_response(queryset, chunk_size)
+    return stream_service_prices_csv(queryset, chunk_size)
@@ -0,0 +1,155 @@
+"""
+Brand/model facets of the active prices for car selection screens.
+
+PriceFacet keeps, per (brand, model), the number of active prices and the
+lowest/highest price a customer pays (the discounted price, else the after
+price). Instead of recounting the whole table, only the brands touched by a
+write are recomputed, with one GROUP BY bounded by the brand index.
+
+Features:
+- Model saves/deletes mark their brand (and a previous brand) in myapp.signals
+- Bulk and raw SQL writers mark theirs with mark_queryset_brands()
+- Inside a catalog_batch() the brands are collected and refreshed once when
+  the batch ends
+- ``python manage.py refresh_price_facets`` recomputes every brand
+- Facets are upserted, so concurrent refreshes of a brand never collide on
+  (brand, model); on PostgreSQL a per-brand advisory lock also keeps a slower
+  refresh from writing older counts over a newer one
+"""
+
+import hashlib
+import logging
+
+from django.db import connection, transaction
+from django.db.models import Count, Max, Min
+from django.db.models.functions import Coalesce
+
+from .models import PriceFacet, ServicePrice
+from .signals import current_batch
+
+logger = logging.getLogger(__name__)
+
+
+def refresh_facets(brands=None):
+    """Recompute the facets of the given brands (all brands when None)."""
+    prices = ServicePrice.objects.filter(is_active=True)
+    facets = PriceFacet.objects.all()
+    if brands is not None:
+        brands = {brand for brand in brands if brand}
+        if not brands:
+            return 0
+        prices = prices.filter(brand__in=brands)
+        facets = facets.filter(brand__in=brands)
+
+    with transaction.atomic():
+        if brands is not None:
+            _lock_brands(brands)
+        rows = list(prices.order_by().values('brand', 'model').annotate(
+            price_count=Count('id'),
+            min_price=Min(Coalesce('discounted_price', 'after_price')),
+            max_price=Max(Coalesce('discounted_price', 'after_price')),
+        ))
+        current = {(row['brand'], row['model']) for row in rows}
+        stale = [
+            pk for pk, brand, model in facets.values_list('pk', 'brand', 'model')
+            if (brand, model) not in current
+        ]
+        if stale:
+            PriceFacet.objects.filter(pk__in=stale).delete()
+        PriceFacet.objects.bulk_create(
+            [PriceFacet(**row) for row in rows],
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['brand', 'model'],
+            update_fields=['price_count', 'min_price', 'max_price', 'updated_at'],
+        )
+    logger.info(
+        f"🔄 Refreshed {len(rows)} price facets"
+        + (f" for {len(brands)} brands" if brands is not None else "")
+    )
+    return len(rows)
+
+
+def _lock_brands(brands):
+    """Serialize facet refreshes per brand until the transaction ends (PostgreSQL only)."""
+    if connection.vendor != 'postgresql':
+        return
+    lock_ids = sorted(
+        int.from_bytes(hashlib.blake2b(f'facets:{brand}'.encode('utf-8'), digest_size=8).digest(), 'big', signed=True)
+        for brand in brands
+    )
+    with connection.cursor() as cursor:
+        # Sorted, so two refreshes of overlapping brands can't deadlock
+        for lock_id in lock_ids:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [lock_id])
+
+
+def mark_brands_changed(brands):
+    """
+    Refresh the facets of the given brands. Within a catalog_batch() they
+    are refreshed once when the batch ends.
+    """
+    batch = current_batch()
+    if batch is not None:
+        batch.setdefault('facet_brands', set()).update(brand for brand in brands if brand)
+        return
+    refresh_facets(brands)
+
+
+def mark_queryset_brands(queryset):
+    """Refresh the facets of the brands of a queryset's rows (after a bulk write)."""
+    mark_brands_changed(queryset.order_by().values_list('brand', flat=True).distinct())
+
+
+def flush_batch_facets(batch):
+    """Refresh the brands collected by a catalog_batch()."""
+    brands = batch.pop('facet_brands', None)
+    if brands:
+        refresh_facets(brands)
+
+
+def facets_response_data(brand=None):
+    """
+    Brand -> models tree of the facets, and an ETag of its content.
+
+    Returns ``(data, etag)``.
+    """
+    rows = PriceFacet.objects.all()
+    if brand:
+        rows = rows.filter(brand__iexact=brand)
+    rows = list(rows.values_list('brand', 'model', 'price_count', 'min_price', 'max_price'))
+
+    digest = hashlib.blake2b(digest_size=16)
+    brands = {}
+    for brand_name, model, price_count, min_price, max_price in rows:
+        digest.update(repr((brand_name, model, price_count, min_price, max_price)).encode('utf-8'))
+        entry = brands.get(brand_name)
+        if entry is None:
+            entry = brands[brand_name] = {
+                'brand': brand_name, 'price_count': 0, 'min_price': None, 'max_price': None, 'models': []
+            }
+        entry['price_count'] += price_count
+        if min_price is not None and (entry['min_price'] is None or min_price < entry['min_price']):
+            entry['min_price'] = min_price
+        if max_price is not None and (entry['max_price'] is None or max_price > entry['max_price']):
+            entry['max_price'] = max_price
+        entry['models'].append({
+            'model': model,
+            'price_count': price_count,
+            'min_price': _format(min_price),
+            'max_price': _format(max_price),
+        })
+
+    for entry in brands.values():
+        entry['min_price'] = _format(entry['min_price'])
+        entry['max_price'] = _format(entry['max_price'])
+    data = {
+        'brands': list(brands.values()),
+        'total_brands': len(brands),
+        'total_models': len(rows),
+    }
+    return data, f'"{digest.hexdigest()}"'
+
+
+def _format(value):
+    return None if value is None else f'{value:.2f}'
@@ -0,0 +1,232 @@
+"""
+Values-based serialization for the catalog list endpoints.
+
+ServiceSerializer and ServicePriceSerializer build a model instance per row
+and run a Python method (or property) per computed field. The functions here
+read plain ``values_list()`` tuples, with the computed columns stored or annotated in
+SQL, and build the response dicts directly. The output is identical to the
+serializers': field-level formatting is delegated to the serializers' own
+DecimalField/DateTimeField instances.
+
+Features:
+- service_price_rows()/serialize_service_price_rows(): ServicePriceSerializer output
+- service_rows()/serialize_service_rows(): ServiceSerializer output, with the
+  brand/model prices resolved up front (price index or SQL annotations)
+- Both row querysets can be passed through DRF pagination unchanged
+"""
+
+from decimal import ROUND_HALF_UP, Decimal
+from functools import lru_cache
+
+from django.db.models import OuterRef, Q, Subquery
+from django.utils import timezone
+from rest_framework import ISO_8601
+from rest_framework.settings import api_settings
+
+from .models import ServicePrice
+from .price_rows import TWO_PLACES
+from .pricing import resolve_price
+
+SERVICE_PRICE_COLUMNS = (
+    'id', 'brand', 'model', 'type', 'product_name',
+    'before_price', 'after_price', 'discounted_price', 'link',
+    'savings_amount', 'is_active', 'created_at', 'updated_at',
+)
+
+SERVICE_COLUMNS = (
+    'id', 'header', 'details', 'pagedetails', 'price', 'duration', 'image', 'is_featured',
+)
+
+# Annotated per-service price columns, in resolve_price() argument order
+PRICE_COLUMNS = (
+    'model_specific_price', 'model_specific_after_price',
+    'brand_generic_price', 'brand_generic_after_price',
+)
+
+HUNDRED = Decimal(100)
+
+
+@lru_cache(maxsize=None)
+def _fields(serializer_path):
+    """Bound fields of a serializer, built once (used for field formatting only)."""
+    from . import serializers
+
+    return getattr(serializers, serializer_path)().fields
+
+
+def _decimal_formatter(field):
+    """
+    DecimalField.to_representation memoized for one response. Keyed on the
+    value's text, which keeps its scale, so equal prices are formatted once.
+    """
+    to_representation = field.to_representation
+    formatted = {}
+
+    def format_decimal(value):
+        key = str(value)
+        text = formatted.get(key)
+        if text is None:
+            text = formatted[key] = to_representation(value)
+        return text
+    return format_decimal
+
+
+def _datetime_formatter(field):
+    """DateTimeField.to_representation with the format and timezone resolved once."""
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if output_format is None or output_format.lower() != ISO_8601 or field_timezone is None:
+        return field.to_representation
+
+    def format_datetime(value):
+        if not timezone.is_aware(value):
+            return field.to_representation(value)
+        text = value.astimezone(field_timezone).isoformat()
+        if text.endswith('+00:00'):
+            text = text[:-6] + 'Z'
+        return text
+    return format_datetime
+
+
+# ----------------------------------------------------------------------
+# ServicePrice
+# ----------------------------------------------------------------------
+def service_price_rows(queryset):
+    """Row tuples for serialize_service_price_rows(), savings read from the stored column."""
+    return queryset.values_list(*SERVICE_PRICE_COLUMNS)
+
+
+def serialize_service_price_rows(rows):
+    """ServicePriceSerializer(many=True).data for rows from service_price_rows()."""
+    fields = _fields('ServicePriceSerializer')
+    before_field = _decimal_formatter(fields['before_price'])
+    after_field = _decimal_formatter(fields['after_price'])
+    discounted_field = _decimal_formatter(fields['discounted_price'])
+    created_field = _datetime_formatter(fields['created_at'])
+    updated_field = _datetime_formatter(fields['updated_at'])
+
+    data = []
+    append = data.append
+    for (price_id, brand, model, type_, product_name, before, after, discounted, link,
+         savings_amount, is_active, created_at, updated_at) in rows:
+        if before and after:
+            # Same expressions as ServicePrice.savings / .discount_percentage
+            savings = savings_amount
+            discount_percentage = (
+                ((before - after) / before * HUNDRED).quantize(TWO_PLACES, ROUND_HALF_UP) if before > 0 else 0
+            )
+        else:
+            savings = discount_percentage = 0
+        append({
+            'id': price_id,
+            'brand': brand,
+            'model': model,
+            'type': type_,
+            'product_name': product_name,
+            'before_price': None if before is None else before_field(before),
+            'after_price': None if after is None else after_field(after),
+            'discounted_price': None if discounted is None else discounted_field(discounted),
+            'link': link,
+            'savings': savings,
+            'discount_percentage': discount_percentage,
+            'is_active': is_active,
+            'created_at': None if created_at is None else created_field(created_at),
+            'updated_at': None if updated_at is None else updated_field(updated_at),
+        })
+    return data
+
+
+# ----------------------------------------------------------------------
+# Service
+# ----------------------------------------------------------------------
+def annotate_real_prices(queryset, brand, model):
+    """
+    Annotate the first model-specific and brand-generic candidate prices
+    (discounted and after price) of each service for the given brand/model.
+    """
+    model_specific = ServicePrice.objects.filter(
+        brand__iexact=brand,
+        model__iexact=model,
+        matched_services=OuterRef('pk'),
+        is_active=True
+    )
+    brand_generic = ServicePrice.objects.filter(
+        brand__iexact=brand,
+        matched_services=OuterRef('pk'),
+        is_active=True
+    ).filter(
+        Q(model__isnull=True) | Q(model__exact='') | Q(model__iexact='generic')
+    )
+    return queryset.annotate(
+        model_specific_price=Subquery(model_specific.values('discounted_price')[:1]),
+        model_specific_after_price=Subquery(model_specific.values('after_price')[:1]),
+        brand_generic_price=Subquery(brand_generic.values('discounted_price')[:1]),
+        brand_generic_after_price=Subquery(brand_generic.values('after_price')[:1]),
+    )
+
+
+def service_rows(queryset, with_prices=False):
+    """Row tuples for serialize_service_rows()."""
+    columns = SERVICE_COLUMNS + PRICE_COLUMNS if with_prices else SERVICE_COLUMNS
+    return queryset.values_list(*columns)
+
+
+def _candidate(discounted, after, exists):
+    return (discounted, after) if exists else None
+
+
+def serialize_service_rows(rows, brand=None, model=None, resolved_prices=None):
+    """
+    ServiceSerializer(many=True).data for rows from service_rows().
+
+    With a brand and model, the prices come from ``resolved_prices``
+    ({service id: (price, price_status)}, e.g. from the price index) or,
+    when it is None, from the columns added by annotate_real_prices().
+    """
+    price_field = _decimal_formatter(_fields('ServiceSerializer')['price'])
+    priced = bool(brand and model)
+
+    data = []
+    append = data.append
+    for row in rows:
+        service_id, header, details, pagedetails, price, duration, image, is_featured = row[:8]
+
+        real_price = price_status = None
+        if priced:
+            if resolved_prices is not None:
+                real_price, price_status = resolved_prices.get(service_id, (None, None))
+            else:
+                ms_discounted, ms_after, generic_discounted, generic_after = row[8:12]
+                # An after price is NOT NULL, so it tells whether a candidate row exists
+                real_price, price_status = resolve_price(
+                    _candidate(ms_discounted, ms_after, ms_after is not None),
+                    _candidate(generic_discounted, generic_after, generic_after is not None),
+                )
+        # Prices are stored with 2 places, as ServiceSerializer reads them from the model;
+        # some backends lose the scale in subqueries, so restore it
+        real_price = None if real_price is None else str(real_price.quantize(TWO_PLACES))
+        if price_status is None:
+            price_status = 'service_default' if price else 'na'
+
+        if real_price:
+            display_price = real_price
+        elif price:
+            display_price = str(price)
+        else:
+            display_price = None
+
+        append({
+            'id': service_id,
+            'header': header,
+            'details': details,
+            'pagedetails': pagedetails,
+            'details_list': [detail.strip() for detail in details.split(',') if detail.strip()],
+            'price': None if price is None else price_field(price),
+            'real_price': real_price,
+            'display_price': display_price,
+            'price_status': price_status,
+            'duration': duration,
+            'image': image,
+            'is_featured': is_featured,
+        })
+    return data
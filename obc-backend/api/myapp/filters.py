@@ -0,0 +1,61 @@
+"""
+Shared query-parameter filters for ServicePrice and Service listings.
+
+Used by ServicePriceListView and the streaming export so both endpoints
+accept the same filters and return the same rows, and by the sync and
+async variants of the catalog list views.
+"""
+
+from django.db import models
+
+
+def filter_service_prices(queryset, params):
+    """
+    Apply the ServicePrice list filters from request query parameters.
+
+    Supported parameters: brand, model, type (icontains) and search
+    (icontains across brand, model, type and product_name).
+    """
+    brand = params.get('brand', None)
+    model = params.get('model', None)
+    service_type = params.get('type', None)
+    search = params.get('search', None)
+
+    if brand:
+        queryset = queryset.filter(brand__icontains=brand)
+    if model:
+        queryset = queryset.filter(model__icontains=model)
+    if service_type:
+        queryset = queryset.filter(type__icontains=service_type)
+    if search:
+        queryset = queryset.filter(
+            models.Q(brand__icontains=search) |
+            models.Q(model__icontains=search) |
+            models.Q(type__icontains=search) |
+            models.Q(product_name__icontains=search)
+        )
+
+    return queryset.order_by('brand', 'model', 'type', 'product_name')
+
+
+def filter_services(queryset, params):
+    """
+    Apply the Service list filters from request query parameters.
+
+    Supported parameters: category_id, featured ('true') and search
+    (icontains across header and details).
+    """
+    category_id = params.get('category_id', None)
+    is_featured = params.get('featured', None)
+    search = params.get('search', None)
+
+    if category_id:
+        queryset = queryset.filter(category_id=category_id)
+    if is_featured == 'true':
+        queryset = queryset.filter(is_featured=True)
+    if search:
+        queryset = queryset.filter(
+            models.Q(header__icontains=search) |
+            models.Q(details__icontains=search)
+        )
+    return queryset.order_by('-is_featured', 'created_at')
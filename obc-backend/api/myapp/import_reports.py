@@ -0,0 +1,189 @@
+"""
+Bounded, spill-to-disk reports for ServicePrice imports.
+
+Per-row import details (new, updated, skipped, error and collapsed duplicate
+rows) are appended to a JSON-lines file as the import runs instead of being
+collected in memory.
+The HTTP response only carries the counts, a small sample per kind and the
+report id; the full report is read back page by page from
+``GET /api/service-prices/import/reports/<report_id>/``.
+
+Reports older than IMPORT_REPORT_TTL are deleted whenever a report is
+written, and by ``manage.py cleanup_import_reports``.
+
+Settings:
+- IMPORT_REPORT_DIR: directory for report files (default: <tmp>/obc_import_reports)
+- IMPORT_REPORT_SAMPLE_SIZE: rows per kind kept in the response sample (default: 5)
+- IMPORT_REPORT_TTL: seconds a report is kept, None to keep them (default: 7 days)
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+REPORT_KINDS = ('new', 'updated', 'skipped', 'error', 'duplicate')
+REPORT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+REPORT_FILE_PATTERN = re.compile(r'^([0-9a-f]{32})\.(jsonl|meta\.json)$')
+
+DEFAULT_SAMPLE_SIZE = 5
+DEFAULT_TTL = 7 * 24 * 60 * 60
+MAX_PAGE_SIZE = 500
+
+
+def get_report_dir():
+    report_dir = getattr(
+        settings, 'IMPORT_REPORT_DIR',
+        os.path.join(tempfile.gettempdir(), 'obc_import_reports')
+    )
+    os.makedirs(report_dir, exist_ok=True)
+    return report_dir
+
+
+def _report_paths(report_id):
+    if not REPORT_ID_PATTERN.match(report_id or ''):
+        raise ValueError(f"Invalid report id '{report_id}'")
+    report_dir = get_report_dir()
+    return (
+        os.path.join(report_dir, f'{report_id}.jsonl'),
+        os.path.join(report_dir, f'{report_id}.meta.json'),
+    )
+
+
+def cleanup_import_reports(max_age=None):
+    """
+    Delete the report files not written to for ``max_age`` seconds
+    (default: IMPORT_REPORT_TTL). Returns the number of reports deleted.
+    """
+    if max_age is None:
+        max_age = getattr(settings, 'IMPORT_REPORT_TTL', DEFAULT_TTL)
+        if max_age is None:
+            return 0
+    cutoff = time.time() - max_age
+    deleted = set()
+    with os.scandir(get_report_dir()) as entries:
+        for entry in entries:
+            match = REPORT_FILE_PATTERN.match(entry.name)
+            if not match:
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    deleted.add(match.group(1))
+            except FileNotFoundError:
+                # Deleted by a concurrent cleanup
+                continue
+    if deleted:
+        logger.info(f"🧹 Deleted {len(deleted)} expired import reports")
+    return len(deleted)
+
+
+class ImportReport:
+    """
+    Incremental writer for one import run.
+
+    Usage:
+        report = ImportReport()
+        report.add('updated', {'brand': ..., 'changes': [...]})
+        report.close()
+        summary = report.summary()
+    """
+
+    def __init__(self, sample_size=None):
+        self.report_id = uuid.uuid4().hex
+        self.path, self.meta_path = _report_paths(self.report_id)
+        self.sample_size = sample_size if sample_size is not None else getattr(
+            settings, 'IMPORT_REPORT_SAMPLE_SIZE', DEFAULT_SAMPLE_SIZE
+        )
+        self.counts = {kind: 0 for kind in REPORT_KINDS}
+        self.samples = {kind: [] for kind in REPORT_KINDS}
+        self.created_at = timezone.now().isoformat()
+        self._file = None
+
+    def add(self, kind, entry):
+        """Append one row entry of the given kind to the report."""
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        record = {'kind': kind, **entry}
+        self._file.write(json.dumps(record, default=str, ensure_ascii=False))
+        self._file.write('\n')
+
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+        sample = self.samples.setdefault(kind, [])
+        if len(sample) < self.sample_size:
+            # Round-trip through JSON so the sample holds the same values as the file
+            sample.append(json.loads(json.dumps(entry, default=str)))
+
+    def close(self):
+        """Flush the rows and write the report's metadata file."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        with open(self.meta_path, 'w', encoding='utf-8') as meta_file:
+            json.dump({
+                'report_id': self.report_id,
+                'created_at': self.created_at,
+                'counts': self.counts,
+            }, meta_file)
+        try:
+            cleanup_import_reports()
+        except OSError as e:
+            logger.warning(f"⚠️ Could not clean up old import reports: {e}")
+
+    def summary(self):
+        """Counts and the bounded sample, small enough for the HTTP response."""
+        return {
+            'report_id': self.report_id,
+            'counts': dict(self.counts),
+            'sample': {kind: rows for kind, rows in self.samples.items() if rows},
+        }
+
+
+def read_import_report(report_id, kind=None, page=1, page_size=100):
+    """
+    Read one page of a stored import report.
+
+    Raises ValueError for a malformed id and FileNotFoundError for an unknown one.
+    """
+    path, meta_path = _report_paths(report_id)
+    with open(meta_path, encoding='utf-8') as meta_file:
+        meta = json.load(meta_file)
+
+    page = max(int(page), 1)
+    page_size = max(1, min(int(page_size), MAX_PAGE_SIZE))
+    start = (page - 1) * page_size
+
+    results = []
+    matched = 0
+    has_next = False
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as report_file:
+            for line in report_file:
+                record = json.loads(line)
+                if kind and record.get('kind') != kind:
+                    continue
+                if matched >= start + page_size:
+                    has_next = True
+                    break
+                if matched >= start:
+                    results.append(record)
+                matched += 1
+
+    return {
+        'report_id': report_id,
+        'created_at': meta.get('created_at'),
+        'counts': meta.get('counts', {}),
+        'kind': kind,
+        'page': page,
+        'page_size': page_size,
+        'has_next': has_next,
+        'results': results,
+    }
@@ -0,0 +1,100 @@
+"""
+Optional process pool for the Excel import pipeline.
+
+The import endpoint needs pandas, NumPy, openpyxl and django-import-export.
+With IMPORT_WORKER_POOL set, the API worker only reads the upload and hands
+it to a pool of import processes, so those libraries are loaded (and their
+memory held) by the pool instead of by every API worker.
+
+The pool processes are spawned fresh with Django configured; each import
+runs there exactly as in ServicePriceImportAPIView, including its catalog
+batch and change notifications.
+
+Settings:
+- IMPORT_WORKER_POOL: import processes (default: 0, imports run in the request)
+"""
+
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool_size():
+    return getattr(settings, 'IMPORT_WORKER_POOL', 0) or 0
+
+
+def is_enabled():
+    return get_pool_size() > 0
+
+
+def _init_worker():
+    """Process pool initializer: workers are spawned fresh and need Django configured."""
+    import django
+    django.setup()
+
+
+def _get_pool():
+    global _pool
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=get_pool_size(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+            )
+            logger.info(f"🚀 Started import worker pool with {get_pool_size()} processes")
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def process_excel_upload(file_name, content, options):
+    """
+    Run one import in a pool process. Returns ``(response data, status code)``.
+
+    ``options`` are the keyword arguments of
+    ServicePriceImportAPIView._process_excel_file (dry_run, use_mapping, ...).
+    """
+    from django.db import connection
+
+    from .signals import catalog_batch
+    from .views import ServicePriceImportAPIView
+
+    upload = io.BytesIO(content)
+    upload.name = file_name
+    try:
+        with catalog_batch('import', notify=not options['dry_run']):
+            response = ServicePriceImportAPIView()._process_excel_file(upload, **options)
+        return response.data, response.status_code
+    finally:
+        # Don't keep an idle connection open between imports
+        connection.close()
+
+
+def run_import(file, **options):
+    """Import an uploaded file in the worker pool. Returns ``(response data, status code)``."""
+    pool = _get_pool()
+    try:
+        return pool.submit(process_excel_upload, file.name, file.read(), options).result()
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool for the next import
+        _discard_pool(pool)
+        raise
@@ -0,0 +1,154 @@
+"""
+Service ↔ price linkage maintained on write.
+
+A ServicePrice belongs to every Service whose header occurs in its product
+name. The match is computed once when prices are imported or saved and when a
+Service is saved, and stored in ``ServicePrice.matched_services``, so reads are
+an equality join instead of a ``product_name__icontains=header`` scan.
+
+Features:
+- One Aho-Corasick pass per product name over all service headers
+- Incremental relinking of single prices, new import rows or one service
+  (only when its header changes, over the prices containing it)
+- Reporting of services with several candidate prices for the same brand/model,
+  which reads would otherwise resolve silently by taking the first row
+"""
+
+import logging
+
+from django.db.models import Count
+from django.db.models.functions import Lower, Trim
+
+from .matching import HeaderMatcher
+from .models import Service, ServicePrice
+from .signals import current_batch
+
+logger = logging.getLogger(__name__)
+
+MAX_AMBIGUOUS_SAMPLE = 20
+
+ServicePriceLink = ServicePrice.matched_services.through
+
+
+class ServiceHeaderIndex:
+    """Header matcher plus the services carrying each (lower-cased) header."""
+
+    def __init__(self, services):
+        self.services_by_header = {}
+        for service_id, header in services:
+            self.services_by_header.setdefault(header.lower(), []).append(service_id)
+        self.matcher = HeaderMatcher(self.services_by_header)
+
+    def service_ids(self, product_name):
+        return sorted(
+            service_id
+            for header in self.matcher.find(product_name)
+            for service_id in self.services_by_header[header]
+        )
+
+
+def get_header_index():
+    """
+    Matcher over all current service headers. Inside a catalog batch (an
+    import) it is built once and reused for every row.
+    """
+    batch = current_batch()
+    if batch is not None and 'header_index' in batch:
+        return batch['header_index']
+    index = ServiceHeaderIndex(Service.objects.values_list('id', 'header'))
+    if batch is not None:
+        batch['header_index'] = index
+    return index
+
+
+def link_price(price):
+    """Relink one saved ServicePrice."""
+    price.matched_services.set(get_header_index().service_ids(price.product_name))
+
+
+def link_prices(queryset):
+    """
+    Link prices that have no links yet (e.g. rows just inserted in bulk).
+    Returns the number of links created.
+    """
+    header_index = get_header_index()
+    links = [
+        ServicePriceLink(serviceprice_id=price_id, service_id=service_id)
+        for price_id, product_name in queryset.values_list('id', 'product_name').iterator(chunk_size=2000)
+        for service_id in header_index.service_ids(product_name)
+    ]
+    ServicePriceLink.objects.bulk_create(links, batch_size=1000, ignore_conflicts=True)
+    return len(links)
+
+
+def link_service(service):
+    """
+    Relink one saved Service when its header is new or changed. Only the
+    prices whose product name contains the header are read (``icontains``
+    in the database), then checked like the matcher does.
+    """
+    if service.header == getattr(service, '_loaded_header', None):
+        return
+    header = service.header.lower()
+    price_ids = []
+    if header:
+        price_ids = [
+            price_id
+            for price_id, product_name in ServicePrice.objects.filter(
+                product_name__icontains=service.header
+            ).order_by().values_list('id', 'product_name').iterator(chunk_size=2000)
+            if header in product_name.lower()
+        ]
+    service.matched_prices.set(price_ids)
+    service._loaded_header = service.header
+
+
+def relink_all_prices():
+    """Rebuild the whole linkage. Returns the number of links."""
+    ServicePriceLink.objects.all().delete()
+    count = link_prices(ServicePrice.objects.all())
+    logger.info(f"✅ Linked service prices: {count} links")
+    return count
+
+
+def find_ambiguous_matches(brand_keys=None):
+    """
+    Services with more than one active candidate price for the same brand and
+    model. ``brand_keys`` (trimmed, lower-cased brands) limits the check to the
+    brands of an import. Returns ``{'count': n, 'sample': [...]}``.
+    """
+    groups = ServicePriceLink.objects.filter(
+        serviceprice__is_active=True, service__is_active=True
+    ).annotate(
+        brand_key=Lower(Trim('serviceprice__brand')),
+        model_key=Lower(Trim('serviceprice__model')),
+    )
+    if brand_keys is not None:
+        groups = groups.filter(brand_key__in=list(brand_keys))
+    groups = groups.values(
+        'service_id', 'service__header', 'brand_key', 'model_key'
+    ).annotate(candidates=Count('id')).filter(candidates__gt=1).order_by(
+        'brand_key', 'model_key', 'service__header'
+    )
+
+    count = groups.count()
+    sample = []
+    for group in groups[:MAX_AMBIGUOUS_SAMPLE]:
+        product_names = list(
+            ServicePrice.objects.annotate(
+                brand_key=Lower(Trim('brand')), model_key=Lower(Trim('model'))
+            ).filter(
+                matched_services=group['service_id'], is_active=True,
+                brand_key=group['brand_key'], model_key=group['model_key'],
+            ).values_list('product_name', flat=True)
+        )
+        sample.append({
+            'service': group['service__header'],
+            'brand': group['brand_key'],
+            'model': group['model_key'],
+            'candidates': product_names,
+            'chosen': product_names[0] if product_names else None,
+        })
+    if count:
+        logger.warning(f"⚠️ {count} services have several candidate prices for the same brand/model")
+    return {'count': count, 'sample': sample}
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from myapp.snapshot import get_snapshot_path, write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Build the offline catalog snapshot (MessagePack) served at /api/catalog/snapshot/'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Snapshot file to write (default: the CATALOG_SNAPSHOT_PATH setting)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or get_snapshot_path()
+        version, size, sha256 = write_snapshot(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Built catalog snapshot at {path}: version {version}, {size:,} bytes, sha256 {sha256}'
+        ))
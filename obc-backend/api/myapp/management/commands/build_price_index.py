@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from myapp.price_index import build_price_index, get_index_path
+
+
+class Command(BaseCommand):
+    help = 'Build the shared, memory-mapped price index used for brand/model price resolution'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            help='Index file to write (default: the PRICE_INDEX_PATH setting)'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or get_index_path()
+        count = build_price_index(path)
+        self.stdout.write(self.style.SUCCESS(f'Built price index at {path} with {count} entries'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from myapp.changefeed import cleanup_changes
+
+
+class Command(BaseCommand):
+    help = 'Delete catalog change feed entries older than CATALOG_CHANGE_RETENTION'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=None,
+            help='Delete entries older than this many seconds instead'
+        )
+
+    def handle(self, *args, **options):
+        count = cleanup_changes(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} catalog changes'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from myapp.import_reports import cleanup_import_reports
+
+
+class Command(BaseCommand):
+    help = 'Delete import reports older than IMPORT_REPORT_TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=None,
+            help='Delete reports older than this many seconds instead'
+        )
+
+    def handle(self, *args, **options):
+        count = cleanup_import_reports(options['max_age'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} import reports'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from myapp.models import ServiceCategory, ServicePrice
+from myapp.payload_store import get_generation, is_enabled, render_payload
+from myapp.pricing import is_generic_model
+
+
+class Command(BaseCommand):
+    help = 'Render and store the services-by-category payloads of every category and known brand/model'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=None,
+            help='Render at most this many brand/model combinations per category'
+        )
+
+    def handle(self, *args, **options):
+        if not is_enabled():
+            self.stdout.write(self.style.WARNING(
+                'The catalog payload store is disabled or not on a shared cache; nothing to render'
+            ))
+            return
+
+        cars = [
+            (brand, model)
+            for brand, model in ServicePrice.objects.filter(is_active=True).values_list(
+                'brand', 'model'
+            ).distinct().order_by('brand', 'model')
+            if not is_generic_model(model)
+        ]
+        if options['limit'] is not None:
+            cars = cars[:options['limit']]
+
+        generation = get_generation()
+        rendered = 0
+        for slug in ServiceCategory.objects.filter(is_active=True).values_list('slug', flat=True):
+            for brand, model in [(None, None)] + cars:
+                render_payload(slug, brand, model, generation)
+                rendered += 1
+        self.stdout.write(self.style.SUCCESS(f'Rendered {rendered} catalog payloads (generation {generation})'))
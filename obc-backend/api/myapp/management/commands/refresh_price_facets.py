@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from myapp.facets import refresh_facets
+
+
+class Command(BaseCommand):
+    help = 'Recompute the brand/model price facets of every brand'
+
+    def handle(self, *args, **options):
+        count = refresh_facets()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {count} price facets'))
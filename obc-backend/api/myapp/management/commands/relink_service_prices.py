@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from myapp.linkage import find_ambiguous_matches, relink_all_prices
+from myapp.signals import notify_catalog_changed
+
+
+class Command(BaseCommand):
+    help = 'Recompute the service links of every service price and report ambiguous matches'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = relink_all_prices()
+            notify_catalog_changed('relink')
+        self.stdout.write(self.style.SUCCESS(f'Linked service prices: {count} links'))
+
+        ambiguous = find_ambiguous_matches()
+        if ambiguous['count']:
+            self.stdout.write(self.style.WARNING(
+                f"{ambiguous['count']} services have several candidate prices for the same brand/model"
+            ))
+            for match in ambiguous['sample']:
+                self.stdout.write(
+                    f"  {match['service']} ({match['brand']} {match['model']}): "
+                    f"{', '.join(match['candidates'])} -> {match['chosen']}"
+                )
@@ -0,0 +1,68 @@
+"""
+Multi-pattern substring matching (Aho-Corasick).
+
+Used to find every Service header contained in a ServicePrice product name in
+a single pass over the product name, however many headers there are.
+Matching is case-insensitive, like the ``icontains`` lookups it replaces.
+"""
+
+from collections import deque
+
+
+class HeaderMatcher:
+    """
+    Aho-Corasick automaton over a set of patterns.
+
+    Usage:
+        matcher = HeaderMatcher(['Oil Change', 'Wash'])
+        matcher.find('Engine Oil Change')  # {'oil change'}
+    """
+
+    def __init__(self, patterns):
+        self.patterns = sorted({pattern.lower() for pattern in patterns if pattern})
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] = (index,)
+
+        # Breadth-first pass: failure links and inherited outputs
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                self._fail[next_state] = fail
+                if self._output[fail]:
+                    self._output[next_state] = self._output[next_state] + self._output[fail]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def find(self, text):
+        """Set of (lower-cased) patterns that occur in ``text``."""
+        goto, fail, output = self._goto, self._fail, self._output
+        found = set()
+        state = 0
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return {self.patterns[index] for index in found}
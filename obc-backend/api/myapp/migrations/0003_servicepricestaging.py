@@ -0,0 +1,44 @@
+# Generated by Django 5.2 on 2026-10-19 14:04
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_serviceprice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ServicePriceStaging',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('batch_id', models.CharField(max_length=32)),
+                ('row_number', models.PositiveIntegerField()),
+                ('brand', models.CharField(max_length=50)),
+                ('model', models.CharField(blank=True, max_length=50)),
+                ('type', models.CharField(blank=True, max_length=50)),
+                ('product_name', models.CharField(max_length=100)),
+                ('before_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('after_price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('discounted_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('link', models.URLField(blank=True, null=True)),
+                ('brand_key', models.CharField(blank=True, max_length=50)),
+                ('model_key', models.CharField(blank=True, max_length=50)),
+                ('type_key', models.CharField(blank=True, max_length=50)),
+                ('product_key', models.CharField(blank=True, max_length=100)),
+            ],
+            options={
+                'verbose_name': 'Service Price Staging Row',
+                'verbose_name_plural': 'Service Price Staging Rows',
+                'indexes': [models.Index(fields=['batch_id', 'brand_key', 'model_key', 'type_key', 'product_key'], name='staging_batch_key_idx')],
+            },
+        ),
+        # The staged diff joins the live rows on their normalized key
+        migrations.AddIndex(
+            model_name='serviceprice',
+            index=models.Index(django.db.models.functions.text.Lower(django.db.models.functions.text.Trim('brand')), django.db.models.functions.text.Lower(django.db.models.functions.text.Trim('model')), django.db.models.functions.text.Lower(django.db.models.functions.text.Trim('type')), django.db.models.functions.text.Lower(django.db.models.functions.text.Trim('product_name')), name='serviceprice_norm_key_idx'),
+        ),
+    ]
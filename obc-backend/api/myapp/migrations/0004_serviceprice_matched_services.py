@@ -0,0 +1,41 @@
+# Generated by Django 5.2 on 2026-10-19 14:16
+
+from django.db import migrations, models
+
+from myapp.matching import HeaderMatcher
+
+
+def link_existing_prices(apps, schema_editor):
+    Service = apps.get_model('myapp', 'Service')
+    ServicePrice = apps.get_model('myapp', 'ServicePrice')
+    Link = ServicePrice.matched_services.through
+
+    services_by_header = {}
+    for service_id, header in Service.objects.values_list('id', 'header'):
+        services_by_header.setdefault(header.lower(), []).append(service_id)
+    matcher = HeaderMatcher(services_by_header)
+
+    links = []
+    for price_id, product_name in ServicePrice.objects.values_list('id', 'product_name').iterator(chunk_size=2000):
+        for header in matcher.find(product_name):
+            links.extend(
+                Link(serviceprice_id=price_id, service_id=service_id)
+                for service_id in services_by_header[header]
+            )
+    Link.objects.bulk_create(links, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0003_servicepricestaging'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='serviceprice',
+            name='matched_services',
+            field=models.ManyToManyField(blank=True, help_text='Services whose header occurs in the product name (maintained on write)', related_name='matched_prices', to='myapp.service'),
+        ),
+        migrations.RunPython(link_existing_prices, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2 on 2026-10-19 14:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def seed_existing_rows(apps, schema_editor):
+    """Record (and publish) the current catalog, so a sync from 0 returns all of it."""
+    CatalogChange = apps.get_model('myapp', 'CatalogChange')
+    now = django.utils.timezone.now()
+    for entity, model_name in (('category', 'ServiceCategory'), ('service', 'Service'), ('price', 'ServicePrice')):
+        model = apps.get_model('myapp', model_name)
+        CatalogChange.objects.bulk_create(
+            [
+                CatalogChange(
+                    entity=entity, object_id=object_id,
+                    action='upsert' if is_active else 'deactivate', created_at=now
+                )
+                for object_id, is_active in model.objects.order_by('id').values_list('id', 'is_active').iterator()
+            ],
+            batch_size=1000
+        )
+    CatalogChange.objects.update(sequence=models.F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_serviceprice_matched_services'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity', models.CharField(choices=[('category', 'Service Category'), ('service', 'Service'), ('price', 'Service Price')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('action', models.CharField(choices=[('upsert', 'Created or updated'), ('deactivate', 'Deactivated'), ('delete', 'Deleted')], max_length=20)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sequence', models.BigIntegerField(blank=True, help_text='Sync sequence number, assigned after commit (empty until published)', null=True, unique=True)),
+            ],
+            options={
+                'verbose_name': 'Catalog Change',
+                'verbose_name_plural': 'Catalog Changes',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(seed_existing_rows, migrations.RunPython.noop),
+    ]
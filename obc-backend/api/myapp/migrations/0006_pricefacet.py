@@ -0,0 +1,45 @@
+# Generated by Django 5.2 on 2026-10-19 14:31
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min
+from django.db.models.functions import Coalesce
+
+
+def build_facets(apps, schema_editor):
+    ServicePrice = apps.get_model('myapp', 'ServicePrice')
+    PriceFacet = apps.get_model('myapp', 'PriceFacet')
+    rows = ServicePrice.objects.filter(is_active=True).order_by().values('brand', 'model').annotate(
+        price_count=Count('id'),
+        min_price=Min(Coalesce('discounted_price', 'after_price')),
+        max_price=Max(Coalesce('discounted_price', 'after_price')),
+    )
+    PriceFacet.objects.bulk_create([PriceFacet(**row) for row in rows], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_catalogchange'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('brand', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=50)),
+                ('price_count', models.PositiveIntegerField(default=0)),
+                ('min_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('max_price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Price Facet',
+                'verbose_name_plural': 'Price Facets',
+                'ordering': ['brand', 'model'],
+                'unique_together': {('brand', 'model')},
+            },
+        ),
+        migrations.RunPython(build_facets, migrations.RunPython.noop),
+    ]
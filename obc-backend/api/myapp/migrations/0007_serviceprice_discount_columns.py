@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-19 14:32
+
+import django.db.models.expressions
+import django.db.models.functions.math
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_pricefacet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='serviceprice',
+            name='discount_pct',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('before_price__gt', 0), models.Q(('after_price', 0), _negated=True)), then=django.db.models.functions.math.Round(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('before_price'), '-', models.F('after_price')), '*', models.Value(Decimal('100'))), '/', models.F('before_price')), 2)), default=models.Value(Decimal('0')), output_field=models.DecimalField(decimal_places=2, max_digits=7)), help_text='Discount of the after price in percent (database generated)', output_field=models.DecimalField(decimal_places=2, max_digits=7)),
+        ),
+        migrations.AddField(
+            model_name='serviceprice',
+            name='savings_amount',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('before_price', 0), ('after_price', 0), _connector='OR'), then=models.Value(Decimal('0'))), default=django.db.models.expressions.CombinedExpression(models.F('before_price'), '-', models.F('after_price')), output_field=models.DecimalField(decimal_places=2, max_digits=11)), help_text='Before price minus after price (database generated)', output_field=models.DecimalField(decimal_places=2, max_digits=11)),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprice',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-discount_pct', 'id'], name='serviceprice_deals_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprice',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['brand', '-discount_pct', 'id'], name='serviceprice_brand_deals_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='serviceprice',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['brand', 'model', '-discount_pct', 'id'], name='serviceprice_model_deals_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2 on 2026-10-19 14:43
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_serviceprice_discount_columns'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', '-is_featured', 'created_at'], name='service_category_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='service',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-is_featured', 'created_at'], name='service_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='servicecategory',
+            index=models.Index(django.db.models.functions.text.Upper('name'), name='servicecategory_name_upper_idx'),
+        ),
+    ]
@@ -1,8 +1,11 @@
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
+from django.db.models.functions import Lower, Round, Trim, Upper
 from django.contrib.auth.models import User # Or your custom user model
 import random
 from django.utils import timezone
 from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
 
 
 
@@ -51,6 +54,10 @@ class ServiceCategory(models.Model):
     
     class Meta:
         verbose_name_plural = "Service Categories"
+        indexes = [
+            # Category lookup by name (see catalog.get_category); the slug has its unique index
+            models.Index(Upper('name'), name='servicecategory_name_upper_idx'),
+        ]
 
 class Service(models.Model):
     category=models.ForeignKey(ServiceCategory, on_delete=models.CASCADE, related_name='services')
@@ -69,6 +76,28 @@ class Service(models.Model):
     
     def get_details_list(self):
         return [detail.strip() for detail in self.details.split(',') if detail.strip()]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored header, so saves that keep it don't relink the prices
+        if 'header' in field_names:
+            instance._loaded_header = values[field_names.index('header')]
+        return instance
+
+    class Meta:
+        indexes = [
+            # Active services of a category in display order (services by category, category_id filter)
+            models.Index(
+                fields=['category', '-is_featured', 'created_at'],
+                name='service_category_active_idx', condition=Q(is_active=True)
+            ),
+            # All active services in display order, and the featured ones first
+            models.Index(
+                fields=['-is_featured', 'created_at'],
+                name='service_active_idx', condition=Q(is_active=True)
+            ),
+        ]
     
 
 class ServicePrice(models.Model):
@@ -84,19 +113,76 @@ class ServicePrice(models.Model):
     after_price = models.DecimalField(max_digits=10, decimal_places=2, help_text="Price after discount")
     discounted_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Special discounted price")
     link = models.URLField(null=True, blank=True, help_text="URL link for more details")
+    matched_services = models.ManyToManyField(
+        Service, blank=True, related_name='matched_prices',
+        help_text="Services whose header occurs in the product name (maintained on write)"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Stored by the database, so deals can be filtered and ordered with an index.
+    # Same rules as the savings / discount_percentage properties: 0 unless both prices are set,
+    # and halves rounded away from zero like PostgreSQL's ROUND()
+    savings_amount = models.GeneratedField(
+        expression=Case(
+            When(Q(before_price=0) | Q(after_price=0), then=Value(Decimal(0))),
+            default=F('before_price') - F('after_price'),
+            output_field=models.DecimalField(max_digits=11, decimal_places=2),
+        ),
+        output_field=models.DecimalField(max_digits=11, decimal_places=2),
+        db_persist=True,
+        help_text="Before price minus after price (database generated)"
+    )
+    discount_pct = models.GeneratedField(
+        expression=Case(
+            When(Q(before_price__gt=0) & ~Q(after_price=0), then=Round(
+                (F('before_price') - F('after_price')) * Value(Decimal(100)) / F('before_price'), 2
+            )),
+            default=Value(Decimal(0)),
+            output_field=models.DecimalField(max_digits=7, decimal_places=2),
+        ),
+        output_field=models.DecimalField(max_digits=7, decimal_places=2),
+        db_persist=True,
+        help_text="Discount of the after price in percent (database generated)"
+    )
 
     class Meta:
         unique_together = ('brand', 'model', 'type', 'product_name')
         verbose_name = "Service Price"
         verbose_name_plural = "Service Prices"
         ordering = ['brand', 'model', 'type', 'product_name']
+        indexes = [
+            # Top-N deals, overall and per brand / brand+model (see ServicePriceDealsView)
+            models.Index(
+                fields=['-discount_pct', 'id'],
+                name='serviceprice_deals_idx', condition=Q(is_active=True)
+            ),
+            models.Index(
+                fields=['brand', '-discount_pct', 'id'],
+                name='serviceprice_brand_deals_idx', condition=Q(is_active=True)
+            ),
+            models.Index(
+                fields=['brand', 'model', '-discount_pct', 'id'],
+                name='serviceprice_model_deals_idx', condition=Q(is_active=True)
+            ),
+            # Trimmed, case-insensitive key the staged import joins on (see myapp.staging)
+            models.Index(
+                Lower(Trim('brand')), Lower(Trim('model')), Lower(Trim('type')), Lower(Trim('product_name')),
+                name='serviceprice_norm_key_idx'
+            ),
+        ]
 
     def __str__(self):
         return f"{self.brand} {self.model} - {self.product_name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored brand, so moving a row to another brand refreshes both facets
+        if 'brand' in field_names:
+            instance._loaded_brand = values[field_names.index('brand')]
+        return instance
+
     @property
     def savings(self):
         """Calculate savings amount"""
@@ -106,10 +192,111 @@ class ServicePrice(models.Model):
 
     @property
     def discount_percentage(self):
-        """Calculate discount percentage"""
+        """Calculate discount percentage (halves round up, like the discount_pct column)"""
         if self.before_price and self.after_price and self.before_price > 0:
-            return round(((self.before_price - self.after_price) / self.before_price) * 100, 2)
+            discount = (self.before_price - self.after_price) / self.before_price * 100
+            return discount.quantize(Decimal('0.01'), ROUND_HALF_UP)
         return 0
 
 
 
+class ServicePriceStaging(models.Model):
+    """
+    Scratch table used by the staged import mode.
+
+    A sheet is bulk-loaded here under a batch id, diffed against ServicePrice
+    with set-based SQL and merged in a single transaction. Rows are removed
+    once the batch has been merged or discarded.
+    """
+    batch_id = models.CharField(max_length=32)
+    row_number = models.PositiveIntegerField()
+    brand = models.CharField(max_length=50)
+    model = models.CharField(max_length=50, blank=True)
+    type = models.CharField(max_length=50, blank=True)
+    product_name = models.CharField(max_length=100)
+    before_price = models.DecimalField(max_digits=10, decimal_places=2)
+    after_price = models.DecimalField(max_digits=10, decimal_places=2)
+    discounted_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    link = models.URLField(null=True, blank=True)
+    # Normalized (trimmed, lower-cased) copy of the unique key, filled in SQL
+    # so both sides of the diff use the same database LOWER()/TRIM().
+    brand_key = models.CharField(max_length=50, blank=True)
+    model_key = models.CharField(max_length=50, blank=True)
+    type_key = models.CharField(max_length=50, blank=True)
+    product_key = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        verbose_name = "Service Price Staging Row"
+        verbose_name_plural = "Service Price Staging Rows"
+        indexes = [
+            models.Index(
+                fields=['batch_id', 'brand_key', 'model_key', 'type_key', 'product_key'],
+                name='staging_batch_key_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f"[{self.batch_id}] {self.brand} {self.model} - {self.product_name}"
+
+
+class CatalogChange(models.Model):
+    """
+    Append-only change feed of the catalog used by the delta sync endpoint.
+
+    One row is written (in the same transaction) whenever a category, service
+    or price is created, updated, deactivated or deleted. ``sequence`` is the
+    sync sequence handed to clients as their ``since`` token; it is assigned
+    once the row is committed (see myapp.changefeed.publish_changes), so it
+    follows commit order, unlike the primary key.
+    """
+    ENTITY_CHOICES = [
+        ('category', 'Service Category'),
+        ('service', 'Service'),
+        ('price', 'Service Price'),
+    ]
+    ACTION_CHOICES = [
+        ('upsert', 'Created or updated'),
+        ('deactivate', 'Deactivated'),
+        ('delete', 'Deleted'),
+    ]
+
+    entity = models.CharField(max_length=20, choices=ENTITY_CHOICES)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=20, choices=ACTION_CHOICES)
+    created_at = models.DateTimeField(default=timezone.now)
+    sequence = models.BigIntegerField(
+        null=True, blank=True, unique=True,
+        help_text="Sync sequence number, assigned after commit (empty until published)"
+    )
+
+    class Meta:
+        ordering = ['id']
+        verbose_name = "Catalog Change"
+        verbose_name_plural = "Catalog Changes"
+
+    def __str__(self):
+        return f"#{self.pk} {self.entity} {self.object_id} {self.action}"
+
+
+class PriceFacet(models.Model):
+    """
+    Aggregate of the active prices per brand and model, for car selection screens.
+
+    Maintained incrementally: only the brands touched by a save, import or
+    admin action are recomputed (see myapp.facets).
+    """
+    brand = models.CharField(max_length=50)
+    model = models.CharField(max_length=50)
+    price_count = models.PositiveIntegerField(default=0)
+    min_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    max_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('brand', 'model')
+        ordering = ['brand', 'model']
+        verbose_name = "Price Facet"
+        verbose_name_plural = "Price Facets"
+
+    def __str__(self):
+        return f"{self.brand} {self.model} ({self.price_count})"
@@ -0,0 +1,433 @@
+"""
+Parallel, per-brand partitioned import for multi-sheet price workbooks.
+
+Supplier workbooks usually carry one sheet per brand. The partitioned import
+reads every sheet, regroups all rows by normalized brand and then:
+
+1. Validates and diffs the partitions in parallel in a process pool
+   (pure Python, no database access in the workers).
+2. Writes each partition in its own transaction, holding a per-brand lock,
+   with bulk_create / bulk_update.
+
+Because brand is part of the unique key, two partitions can never touch the
+same (brand, model, type, product_name) row, so partitions don't conflict.
+
+Nothing is written when any row of the workbook is invalid. A partition that
+fails while writing is rolled back on its own; the partitions committed before
+it stay committed, the remaining ones are not written, and the response lists
+the write status of every brand.
+
+Settings:
+- IMPORT_PARTITION_WORKERS: processes used for validate/diff (default: CPU count)
+- IMPORT_PARTITION_WRITERS: concurrent partition write transactions (default: 4,
+  always 1 on SQLite, which only allows a single writer)
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.functions import Lower, Trim
+from django.utils import timezone
+
+from .changefeed import record_changes
+from .dedup import collapse_duplicates
+from .facets import mark_queryset_brands
+from .import_reports import ImportReport
+from .linkage import link_prices
+from .models import ServicePrice
+from .price_rows import KEY_FIELDS, VALUE_FIELDS, clean_price_row, normalize_key_part
+from .signals import notify_catalog_changed
+from .staging import MAX_RESPONSE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+EXISTING_FIELDS = ('id',) + KEY_FIELDS + VALUE_FIELDS + ('is_active',)
+
+# Partitions smaller than this are diffed in-process; a pool is not worth its startup cost
+MIN_ROWS_FOR_POOL = 5000
+
+
+def price_key(values):
+    """Normalized unique key of a cleaned row or existing row dict."""
+    return tuple(normalize_key_part(values[field]) for field in KEY_FIELDS)
+
+
+def _init_worker():
+    """Process pool initializer: workers are spawned fresh and need Django configured."""
+    import django
+    django.setup()
+
+
+def diff_partition(brand_key, rows, existing):
+    """
+    Validate and diff one brand partition.
+
+    ``rows`` are (sheet, row_number, raw_row) tuples, ``existing`` are the live
+    rows of the brand as dicts. Returns a plain-data write plan. Runs in a
+    worker process, so it must not touch the database.
+    """
+    existing_by_key = {price_key(row): row for row in existing}
+
+    plan = {
+        'brand_key': brand_key,
+        'rows': len(rows),
+        'creates': [],
+        'updates': [],
+        'unchanged': [],
+        'invalid': [],
+        'duplicates': 0,
+    }
+
+    # Keys were already collapsed across sheets; this only guards bulk_create
+    # against a repeated key (last occurrence wins, earlier copies are counted)
+    cleaned_by_key = {}
+    for sheet, row_number, raw_row in rows:
+        try:
+            cleaned = clean_price_row(raw_row)
+        except ValueError as e:
+            plan['invalid'].append({'sheet': sheet, 'row': row_number, 'errors': [str(e)]})
+            continue
+        key = price_key(cleaned)
+        if key in cleaned_by_key:
+            plan['duplicates'] += 1
+        cleaned_by_key[key] = (sheet, row_number, cleaned)
+
+    for key, (sheet, row_number, cleaned) in cleaned_by_key.items():
+        live = existing_by_key.get(key)
+        if live is None:
+            plan['creates'].append({'sheet': sheet, 'row': row_number, 'values': cleaned})
+            continue
+
+        changes = [
+            {'field': field, 'old': live[field], 'new': cleaned[field]}
+            for field in VALUE_FIELDS
+            if live[field] != cleaned[field]
+        ]
+        if not live['is_active']:
+            changes.append({'field': 'is_active', 'old': False, 'new': True})
+
+        entry = {'sheet': sheet, 'row': row_number, 'id': live['id'], 'values': cleaned}
+        if changes:
+            entry['changes'] = changes
+            plan['updates'].append(entry)
+        else:
+            plan['unchanged'].append(entry)
+
+    return plan
+
+
+class BrandLocks:
+    """
+    Per-brand write locks.
+
+    On PostgreSQL a transaction-scoped advisory lock is taken, which also
+    serializes concurrent imports running in other processes. Elsewhere an
+    in-process lock per brand is used.
+    """
+
+    _guard = threading.Lock()
+    _locks = {}
+
+    @classmethod
+    def acquire(cls, brand_key):
+        """Acquire the brand lock inside the current transaction. Returns a release callable."""
+        if connection.vendor == 'postgresql':
+            lock_id = int.from_bytes(
+                hashlib.blake2b(brand_key.encode('utf-8'), digest_size=8).digest(), 'big', signed=True
+            )
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_xact_lock(%s)', [lock_id])
+            return lambda: None
+
+        with cls._guard:
+            lock = cls._locks.setdefault(brand_key, threading.Lock())
+        lock.acquire()
+        return lock.release
+
+
+class PartitionedServicePriceImport:
+    """
+    Multi-sheet import partitioned by brand.
+
+    Usage:
+        importer = PartitionedServicePriceImport()
+        response_data = importer.run(
+            {'Toyota': records, 'Honda': records}, dry_run=True, duplicate_policy='last'
+        )
+    """
+
+    def __init__(self, max_workers=None, max_writers=None):
+        self.max_workers = max_workers or getattr(
+            settings, 'IMPORT_PARTITION_WORKERS', os.cpu_count() or 1
+        )
+        self.max_writers = max_writers or getattr(settings, 'IMPORT_PARTITION_WRITERS', 4)
+        if connection.vendor == 'sqlite':
+            self.max_writers = 1
+        self.report = ImportReport()
+        self.sheet_rows = {}
+        self.plans = []
+        self.collapsed = []
+        # brand_key -> {'status': 'committed' | 'failed' | 'not_written', 'error': ...}
+        self.write_status = {}
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def run(self, sheets, dry_run=True, duplicate_policy=None):
+        """
+        Partition, diff and (unless dry_run) write the given sheets of records.
+        Raises DuplicateKeyError when ``duplicate_policy`` is 'error' and a key repeats.
+        """
+        try:
+            partitions = self._partition(sheets, duplicate_policy)
+            self.plans = self._diff(partitions)
+            self._write_report()
+            # All or nothing for invalid rows, like the other strategies
+            if not dry_run and not any(plan['invalid'] for plan in self.plans):
+                self._write()
+                if any(entry['status'] == 'committed' for entry in self.write_status.values()):
+                    notify_catalog_changed('partitioned_import')
+        finally:
+            self.report.close()
+        return self.get_response_data(dry_run)
+
+    def get_response_data(self, dry_run):
+        totals = {'new': 0, 'update': 0, 'delete': 0, 'skip': 0, 'error': 0, 'invalid': 0}
+        partitions = []
+        errors = []
+        duplicates = len(self.collapsed)
+        totals['skip'] += duplicates
+        for plan in self.plans:
+            totals['new'] += len(plan['creates'])
+            totals['update'] += len(plan['updates'])
+            totals['skip'] += len(plan['unchanged']) + plan['duplicates']
+            totals['invalid'] += len(plan['invalid'])
+            duplicates += plan['duplicates']
+            errors.extend(plan['invalid'][:MAX_RESPONSE_ERRORS - len(errors)])
+            partition = {
+                'brand': plan['brand_key'],
+                'rows': plan['rows'],
+                'new': len(plan['creates']),
+                'update': len(plan['updates']),
+                'skip': len(plan['unchanged']),
+                'invalid': len(plan['invalid']),
+            }
+            if plan['brand_key'] in self.write_status:
+                partition['write_status'] = self.write_status[plan['brand_key']]
+            partitions.append(partition)
+
+        failed = {
+            brand_key: entry['error'] for brand_key, entry in self.write_status.items() if entry['status'] == 'failed'
+        }
+        report = self.report.summary()
+        response_data = {
+            'status': 'error' if errors or failed else 'success',
+            'dry_run': dry_run,
+            'import_strategy': 'partitioned',
+            'totals': totals,
+            'total_rows': sum(self.sheet_rows.values()),
+            'duplicates_collapsed': duplicates,
+            'collapsed_rows': self.collapsed[:MAX_RESPONSE_ERRORS],
+            'sheets': self.sheet_rows,
+            'partitions': partitions,
+            'detailed_summary': {
+                'new_count': totals['new'],
+                'updated_count': totals['update'],
+                'skipped_count': totals['skip'] - duplicates,
+                'error_count': totals['invalid'],
+                'report_id': report['report_id'],
+                'sample': report['sample'],
+            },
+        }
+
+        summary = (
+            f"{len(self.sheet_rows)} sheets, {len(partitions)} brand partitions: "
+            f"{totals['new']} new, {totals['update']} updated, {totals['skip'] - duplicates} unchanged, "
+            f"{duplicates} duplicates collapsed"
+        )
+        if errors:
+            response_data['errors'] = errors
+            response_data['message'] = (
+                f"❌ {totals['invalid']} rows could not be imported, nothing was imported. {summary}."
+            )
+        elif failed:
+            committed = [brand_key for brand_key, entry in self.write_status.items() if entry['status'] == 'committed']
+            not_written = [brand_key for brand_key, entry in self.write_status.items() if entry['status'] == 'not_written']
+            response_data['write_failed'] = True
+            response_data['message'] = (
+                f"❌ Writing brand(s) {', '.join(failed)} failed: {'; '.join(failed.values())}. "
+                f"Committed: {', '.join(committed) or 'none'}. Not written: {', '.join(not_written) or 'none'}."
+            )
+        elif dry_run:
+            response_data['message'] = f'✅ Validation successful! {summary}. Ready for actual import.'
+        else:
+            response_data['message'] = f'🎉 Import completed successfully! {summary}.'
+        return response_data
+
+    # ------------------------------------------------------------------
+    # Partition and diff
+    # ------------------------------------------------------------------
+    def _partition(self, sheets, duplicate_policy=None):
+        """Collapse repeated keys across all sheets and regroup the rows by normalized brand."""
+        records = []
+        refs = []
+        for sheet, sheet_records in sheets.items():
+            self.sheet_rows[sheet] = len(sheet_records)
+            for row_number, row in enumerate(sheet_records, start=1):
+                records.append(row)
+                refs.append(f'{sheet}:{row_number}')
+
+        records, refs, self.collapsed = collapse_duplicates(records, duplicate_policy, refs=refs)
+        for entry in self.collapsed:
+            self.report.add('duplicate', entry)
+
+        partitions = {}
+        for ref, row in zip(refs, records):
+            sheet, row_number = ref.rsplit(':', 1)
+            row_number = int(row_number)
+            brand = row.get('brand', row.get('Brand'))
+            brand_key = normalize_key_part(brand if brand == brand else '')  # NaN -> ''
+            partitions.setdefault(brand_key, []).append((sheet, row_number, row))
+        logger.info(f"📦 Partitioned {sum(self.sheet_rows.values())} rows from {len(sheets)} sheets into {len(partitions)} brands")
+        return partitions
+
+    def _load_existing(self, brand_keys):
+        """Fetch the live rows of the given brands, grouped by normalized brand."""
+        existing = {brand_key: [] for brand_key in brand_keys}
+        queryset = ServicePrice.objects.annotate(
+            brand_key=Lower(Trim('brand'))
+        ).filter(brand_key__in=list(brand_keys)).values(*EXISTING_FIELDS)
+        for row in queryset.iterator(chunk_size=2000):
+            existing.setdefault(normalize_key_part(row['brand']), []).append(row)
+        return existing
+
+    def _diff(self, partitions):
+        existing = self._load_existing(partitions.keys())
+        total_rows = sum(len(rows) for rows in partitions.values())
+
+        if len(partitions) < 2 or self.max_workers < 2 or total_rows < MIN_ROWS_FOR_POOL:
+            return [
+                diff_partition(brand_key, rows, existing.get(brand_key, []))
+                for brand_key, rows in partitions.items()
+            ]
+
+        # Spawned (not forked) workers never inherit the parent's database connections
+        context = multiprocessing.get_context('spawn')
+        workers = min(self.max_workers, len(partitions))
+        logger.info(f"⚙️ Diffing {len(partitions)} partitions in {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker) as pool:
+            futures = [
+                pool.submit(diff_partition, brand_key, rows, existing.get(brand_key, []))
+                for brand_key, rows in partitions.items()
+            ]
+            return [future.result() for future in futures]
+
+    def _write_report(self):
+        for plan in self.plans:
+            for entry in plan['invalid']:
+                self.report.add('error', entry)
+            for entry in plan['creates']:
+                self.report.add('new', {'sheet': entry['sheet'], 'row': entry['row'], **entry['values']})
+            for entry in plan['updates']:
+                self.report.add('updated', {
+                    'sheet': entry['sheet'], 'row': entry['row'], 'id': entry['id'],
+                    **{field: entry['values'][field] for field in KEY_FIELDS},
+                    'changes': entry['changes'],
+                })
+            for entry in plan['unchanged']:
+                self.report.add('skipped', {
+                    'sheet': entry['sheet'], 'row': entry['row'], 'id': entry['id'],
+                    **{field: entry['values'][field] for field in KEY_FIELDS},
+                    'reason': 'No changes detected',
+                })
+
+    # ------------------------------------------------------------------
+    # Write
+    # ------------------------------------------------------------------
+    def _write(self):
+        """Write the partitions; after a failed partition, the ones not started yet are skipped."""
+        plans = [plan for plan in self.plans if plan['creates'] or plan['updates']]
+        failed = threading.Event()
+
+        def write(plan):
+            if failed.is_set():
+                self.write_status[plan['brand_key']] = {'status': 'not_written', 'error': None}
+                return
+            try:
+                self._write_partition(plan)
+            except Exception as e:
+                failed.set()
+                logger.error(f"❌ Writing partition '{plan['brand_key']}' failed: {str(e)}")
+                self.write_status[plan['brand_key']] = {'status': 'failed', 'error': str(e)}
+            else:
+                self.write_status[plan['brand_key']] = {'status': 'committed', 'error': None}
+
+        if self.max_writers < 2 or len(plans) < 2:
+            for plan in plans:
+                write(plan)
+            return
+
+        def write_in_thread(plan):
+            try:
+                write(plan)
+            finally:
+                # Each writer thread has its own connection; don't leak it
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=min(self.max_writers, len(plans))) as pool:
+            list(pool.map(write_in_thread, plans))
+
+    def _write_partition(self, plan):
+        """Write one brand partition in its own transaction under the brand lock."""
+        now = timezone.now()
+        with transaction.atomic():
+            release = BrandLocks.acquire(plan['brand_key'])
+            try:
+                creates, updates = self._recheck(plan)
+                created = ServicePrice.objects.bulk_create(
+                    [ServicePrice(**values, is_active=True) for values in creates],
+                    batch_size=1000
+                )
+                # Updates never change the key, so only inserted rows need linking
+                link_prices(ServicePrice.objects.filter(pk__in=[price.pk for price in created]))
+                ServicePrice.objects.bulk_update(
+                    [
+                        ServicePrice(id=instance_id, **values, is_active=True, updated_at=now)
+                        for instance_id, values in updates
+                    ],
+                    fields=list(VALUE_FIELDS) + ['is_active', 'updated_at'],
+                    batch_size=1000
+                )
+                written_ids = [price.pk for price in created] + [instance_id for instance_id, _ in updates]
+                record_changes('price', [(instance_id, 'upsert') for instance_id in written_ids])
+                mark_queryset_brands(ServicePrice.objects.filter(pk__in=written_ids))
+            finally:
+                release()
+        logger.info(f"✅ Wrote partition '{plan['brand_key']}': {len(creates)} created, {len(updates)} updated")
+
+    def _recheck(self, plan):
+        """
+        Re-read the brand's keys under the lock so rows created by a concurrent
+        import since the diff turn into updates instead of unique violations.
+        """
+        live_ids = {
+            price_key(row): row['id']
+            for row in ServicePrice.objects.annotate(
+                brand_key=Lower(Trim('brand'))
+            ).filter(brand_key=plan['brand_key']).values('id', *KEY_FIELDS)
+        }
+        creates = []
+        updates = [(entry['id'], entry['values']) for entry in plan['updates']]
+        for entry in plan['creates']:
+            live_id = live_ids.get(price_key(entry['values']))
+            if live_id is None:
+                creates.append(entry['values'])
+            else:
+                updates.append((live_id, entry['values']))
+        return creates, updates
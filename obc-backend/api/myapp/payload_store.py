@@ -0,0 +1,446 @@
+"""
+Pre-rendered, pre-compressed payloads for ServicesByCategoryView.
+
+A (category, brand, model) response only changes with the catalog, so it is
+rendered once, stored with its gzip (and brotli, when installed) compressed
+bytes and an ETag, and served as a byte copy without the ORM or serializers.
+
+Entries are keyed by a catalog generation. Every committed catalog change
+(see myapp.signals) bumps the generation, so stale bytes are never served,
+and re-renders the known combinations in a background thread. A payload that
+did not change keeps its ETag, so clients still get 304 responses for it.
+When the shared price index is enabled, its version is part of the
+generation, so a process never stores a payload priced by an index older
+than the one it is keyed for.
+
+The generation lives in the payload cache, so that cache must be shared by
+every process serving the API (Redis, Memcached, database cache): with a
+per-process cache an invalidation only reaches the process that wrote the
+change, and the others keep serving their old payloads. The store refuses
+to run on LocMemCache or DummyCache unless CATALOG_PAYLOAD_ALLOW_LOCAL_CACHE
+says the deployment (or test run) is a single process.
+
+Only known combinations are stored: an active category by its slug or its
+exact name (spaces or dashes), without a car or with a brand and model
+spelled exactly as PriceFacet lists them. Any other request is rendered
+without the store, so client-supplied strings never become cache keys.
+Known combinations that were requested, or rendered by
+``python manage.py prerender_catalog_payloads``, are re-rendered after a change. The most requested ones are
+re-rendered first, in parallel (see myapp.warming).
+
+Misses are filled single-flight, so the requests arriving right after a
+change don't all run the same catalog queries: the renderer of a payload
+holds a lease in the cache (cross-process) and, within a process, the other
+requests for it wait on an event instead of rendering it again. While it is
+rendered, they are served the previous payload of the combination (stale
+while revalidate); only without one do they wait for the renderer, up to
+CATALOG_PAYLOAD_LEASE_WAIT seconds, before rendering it themselves.
+
+Settings:
+- CATALOG_PAYLOAD_STORE_ENABLED: serve JSON responses from the store (default: False)
+- CATALOG_PAYLOAD_CACHE: cache alias holding the payloads (default: 'default')
+- CATALOG_PAYLOAD_ALLOW_LOCAL_CACHE: allow a per-process cache backend, for
+  single-process servers and tests (default: False)
+- CATALOG_PAYLOAD_TIMEOUT: seconds an entry is kept (default: 86400)
+- CATALOG_PAYLOAD_MAX_ENTRIES: combinations re-rendered after a change (default: 5000)
+- CATALOG_PAYLOAD_LEASE_TIMEOUT: seconds a render lease is held at most (default: 30)
+- CATALOG_PAYLOAD_LEASE_WAIT: seconds a request waits for another renderer (default: 5)
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+from .catalog import build_services_by_category, get_category
+from .models import PriceFacet, ServiceCategory
+from .price_index import get_price_index
+from .renderers import FastJSONRenderer
+from .replicas import primary_reads
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'catalog-payload:generation'
+REGISTRY_KEY = 'catalog-payload:registry'
+
+DEFAULT_TIMEOUT = 60 * 60 * 24
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_LEASE_TIMEOUT = 30
+DEFAULT_LEASE_WAIT = 5
+# Seconds between cache polls while another process renders a payload
+LEASE_POLL_INTERVAL = 0.05
+
+
+def is_enabled():
+    if not getattr(settings, 'CATALOG_PAYLOAD_STORE_ENABLED', False):
+        return False
+    if isinstance(get_cache(), (LocMemCache, DummyCache)) \
+            and not getattr(settings, 'CATALOG_PAYLOAD_ALLOW_LOCAL_CACHE', False):
+        if not _local_cache_warned:
+            _warn_local_cache()
+        return False
+    return True
+
+
+_local_cache_warned = False
+
+
+def _warn_local_cache():
+    global _local_cache_warned
+
+    _local_cache_warned = True
+    logger.warning(
+        "⚠️ Catalog payload store disabled: CATALOG_PAYLOAD_CACHE is a per-process cache, so "
+        "invalidations would not reach the other workers. Configure a shared cache or set "
+        "CATALOG_PAYLOAD_ALLOW_LOCAL_CACHE for a single-process server."
+    )
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_PAYLOAD_CACHE', 'default')]
+
+
+def get_generation():
+    """Current catalog generation; part of every payload key."""
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, 1, timeout=None)
+        generation = cache.get(GENERATION_KEY, 1)
+    price_index = get_price_index()
+    return f'{generation}.{price_index.version if price_index is not None else 0}'
+
+
+def bump_generation():
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 2, timeout=None)
+
+
+# Category spellings and cars that may be stored, loaded once per generation
+_known = {'generation': None, 'categories': frozenset(), 'cars': frozenset()}
+_known_lock = threading.Lock()
+
+
+def _load_known(generation):
+    with _known_lock:
+        if _known['generation'] == generation:
+            return
+        categories = set()
+        with primary_reads():
+            for slug, name in ServiceCategory.objects.filter(is_active=True).values_list('slug', 'name'):
+                categories.update((slug, name, name.replace(' ', '-')))
+            cars = set(PriceFacet.objects.values_list('brand', 'model'))
+        _known.update(generation=generation, categories=frozenset(categories), cars=frozenset(cars))
+
+
+def _is_known(category_identifier, brand, model):
+    if category_identifier not in _known['categories']:
+        return False
+    return (brand is None and model is None) or (brand, model) in _known['cars']
+
+
+def is_known(generation, category_identifier, brand, model):
+    """Whether a combination is kept in the store (see the module docstring)."""
+    _load_known(generation)
+    return _is_known(category_identifier, brand, model)
+
+
+def _combination_digest(category_identifier, brand, model):
+    # None (parameter missing) and '' render differently, so keep them apart
+    parts = [category_identifier] + ['\x00' if value is None else value for value in (brand, model)]
+    return hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=16).hexdigest()
+
+
+def payload_key(generation, category_identifier, brand, model):
+    return f'catalog-payload:{generation}:{_combination_digest(category_identifier, brand, model)}'
+
+
+def stale_key(category_identifier, brand, model):
+    """Key of the latest payload of a combination, whatever its generation."""
+    return f'catalog-payload:latest:{_combination_digest(category_identifier, brand, model)}'
+
+
+def lease_key(generation, category_identifier, brand, model):
+    return f'catalog-payload:lease:{generation}:{_combination_digest(category_identifier, brand, model)}'
+
+
+def render_payload(category_identifier, brand=None, model=None, generation=None):
+    """
+    Render, compress and store one payload. Returns the stored entry.
+    Raises ServiceCategory.DoesNotExist for an unknown category.
+    """
+    generation = generation or get_generation()
+    # Stored under the current generation, so never rendered from a lagging replica
+    with primary_reads():
+        category = get_category(category_identifier)
+        body = FastJSONRenderer().render(build_services_by_category(category, brand, model))
+    entry = {
+        'etag': f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+        'identity': body,
+        'gzip': gzip.compress(body, compresslevel=9, mtime=0),
+        'br': brotli.compress(body) if brotli is not None else None,
+    }
+    get_cache().set_many({
+        payload_key(generation, category_identifier, brand, model): entry,
+        stale_key(category_identifier, brand, model): entry,
+    }, timeout=getattr(settings, 'CATALOG_PAYLOAD_TIMEOUT', DEFAULT_TIMEOUT))
+    _register(category_identifier, brand, model)
+    return entry
+
+
+def get_lease_timeout():
+    return getattr(settings, 'CATALOG_PAYLOAD_LEASE_TIMEOUT', DEFAULT_LEASE_TIMEOUT)
+
+
+def get_lease_wait():
+    return getattr(settings, 'CATALOG_PAYLOAD_LEASE_WAIT', DEFAULT_LEASE_WAIT)
+
+
+# Payloads being rendered by this process: payload key -> threading.Event
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def get_payload(category_identifier, brand=None, model=None):
+    """
+    Stored entry for the combination, rendered single-flight on a miss.
+    None when the combination is not stored; render the response directly.
+    """
+    from .warming import record_request
+
+    generation = get_generation()
+    if not is_known(generation, category_identifier, brand, model):
+        return None
+    record_request(category_identifier, brand, model)
+    key = payload_key(generation, category_identifier, brand, model)
+    entry = get_cache().get(key)
+    if entry is not None:
+        return entry
+
+    with _inflight_lock:
+        done = _inflight.get(key)
+        if done is None:
+            done = _inflight[key] = threading.Event()
+            leader = True
+        else:
+            leader = False
+
+    if leader:
+        try:
+            return _fill_payload(category_identifier, brand, model, generation)
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+            done.set()
+
+    # Another thread of this process renders it
+    entry = get_cache().get(stale_key(category_identifier, brand, model))
+    if entry is not None:
+        return entry
+    done.wait(get_lease_wait())
+    entry = get_cache().get(key)
+    if entry is None:
+        # The renderer failed or is too slow
+        entry = render_payload(category_identifier, brand, model, generation)
+    return entry
+
+
+def _fill_payload(category_identifier, brand, model, generation):
+    """Render a missing payload, unless another process holds its lease."""
+    cache = get_cache()
+    lease = lease_key(generation, category_identifier, brand, model)
+    if cache.add(lease, True, timeout=get_lease_timeout()):
+        try:
+            return render_payload(category_identifier, brand, model, generation)
+        finally:
+            cache.delete(lease)
+
+    entry = cache.get(stale_key(category_identifier, brand, model))
+    if entry is not None:
+        return entry
+    key = payload_key(generation, category_identifier, brand, model)
+    deadline = time.monotonic() + get_lease_wait()
+    while time.monotonic() < deadline:
+        time.sleep(LEASE_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if not cache.get(lease):
+            break
+    return render_payload(category_identifier, brand, model, generation)
+
+
+async def aget_payload(category_identifier, brand=None, model=None):
+    """
+    get_payload() for async views: a hit is served without a database thread.
+    Concurrent misses coalesce on the render lease alone and wait with
+    asyncio.sleep, so the shared database thread is never blocked by a waiter.
+    """
+    from .warming import record_request
+
+    generation = await sync_to_async(get_generation, thread_sensitive=False)()
+    if _known['generation'] != generation:
+        await sync_to_async(_load_known, thread_sensitive=False)(generation)
+    if not _is_known(category_identifier, brand, model):
+        return None
+    record_request(category_identifier, brand, model)
+    cache = get_cache()
+    key = payload_key(generation, category_identifier, brand, model)
+    entry = await cache.aget(key)
+    if entry is not None:
+        return entry
+
+    lease = lease_key(generation, category_identifier, brand, model)
+    if await cache.aadd(lease, True, timeout=get_lease_timeout()):
+        try:
+            return await sync_to_async(render_payload)(category_identifier, brand, model, generation)
+        finally:
+            await cache.adelete(lease)
+
+    entry = await cache.aget(stale_key(category_identifier, brand, model))
+    if entry is not None:
+        return entry
+    deadline = time.monotonic() + get_lease_wait()
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LEASE_POLL_INTERVAL)
+        entry = await cache.aget(key)
+        if entry is not None:
+            return entry
+        if not await cache.aget(lease):
+            break
+    return await sync_to_async(render_payload)(category_identifier, brand, model, generation)
+
+
+def _register(category_identifier, brand, model):
+    cache = get_cache()
+    combination = (category_identifier, brand, model)
+    registry = cache.get(REGISTRY_KEY) or []
+    if combination in registry:
+        return
+    if len(registry) >= getattr(settings, 'CATALOG_PAYLOAD_MAX_ENTRIES', DEFAULT_MAX_ENTRIES):
+        return
+    registry.append(combination)
+    cache.set(REGISTRY_KEY, registry, timeout=None)
+
+
+def _accepted_encoding(request, entry):
+    accepted = set()
+    for token in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = token.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(name.strip().lower())
+    if entry['br'] is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def payload_response(request, entry, content_type='application/json'):
+    """Byte-copy response for a stored entry, honouring If-None-Match and Accept-Encoding."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if if_none_match:
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        if entry['etag'] in tags or '*' in tags:
+            response = HttpResponseNotModified()
+            response['ETag'] = entry['etag']
+            patch_vary_headers(response, ['Accept-Encoding'])
+            return response
+
+    encoding = _accepted_encoding(request, entry)
+    response = HttpResponse(entry[encoding or 'identity'], content_type=content_type)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['ETag'] = entry['etag']
+    patch_vary_headers(response, ['Accept-Encoding'])
+    return response
+
+
+def render_unleased(category_identifier, brand, model, generation):
+    """
+    Render a payload under its lease. Returns False when another request
+    holds the lease (it renders the payload) or the category is gone.
+    """
+    cache = get_cache()
+    lease = lease_key(generation, category_identifier, brand, model)
+    if not cache.add(lease, True, timeout=get_lease_timeout()):
+        return False
+    try:
+        render_payload(category_identifier, brand, model, generation)
+        return True
+    except ServiceCategory.DoesNotExist:
+        return False
+    finally:
+        cache.delete(lease)
+
+
+def rerender_known_payloads():
+    """
+    Render every registered combination at the current generation, the most
+    requested ones first and in parallel.
+    """
+    from .warming import warm_hot_payloads
+
+    generation = get_generation()
+    warmed = set(warm_hot_payloads(generation))
+    registry = get_cache().get(REGISTRY_KEY) or []
+    rendered = 0
+    for category_identifier, brand, model in registry:
+        if (category_identifier, brand, model) in warmed:
+            continue
+        rendered += render_unleased(category_identifier, brand, model, generation)
+    logger.info(f"🔄 Re-rendered {rendered} catalog payloads (generation {generation})")
+    return rendered
+
+
+_rerender_lock = threading.Lock()
+_rerender_state = {'running': False, 'pending': False}
+
+
+def schedule_rerender():
+    """Invalidate all payloads now and re-render the known ones in the background."""
+    bump_generation()
+    with _rerender_lock:
+        if _rerender_state['running']:
+            # The running pass may have read the old catalog; run once more
+            _rerender_state['pending'] = True
+            return
+        _rerender_state['running'] = True
+    threading.Thread(target=_rerender_worker, name='catalog-payload-rerender', daemon=True).start()
+
+
+def _rerender_worker():
+    try:
+        while True:
+            with _rerender_lock:
+                _rerender_state['pending'] = False
+            try:
+                rerender_known_payloads()
+            except Exception as e:
+                logger.error(f"❌ Re-rendering catalog payloads failed: {str(e)}")
+            with _rerender_lock:
+                if not _rerender_state['pending']:
+                    _rerender_state['running'] = False
+                    return
+    finally:
+        # The thread has its own database connection; don't leak it
+        connection.close()
@@ -0,0 +1,366 @@
+"""
+Shared, memory-mapped price index for brand/model price resolution.
+
+The index is a compact binary file built from the active ServicePrice rows and
+their linked services (ServicePrice.matched_services). Every worker process
+memory-maps the same file, so the operating system keeps one shared copy of
+the data in the page cache and a price lookup is a binary search over sorted
+integer keys, without a query.
+
+File layout (little-endian):
+    header       magic (8 bytes), catalog version (uint64), entry count (uint64)
+    keys         count x uint64, sorted 64-bit hashes of the normalized key
+    discounted   count x int64, discounted price in cents (NULL_CENTS when empty)
+    after        count x int64, after price in cents
+
+Keys are (brand, model, service id) for model-specific rows and
+(brand, service id) for brand-generic rows, with brand and model lower-cased
+like the ``iexact`` lookups they replace. The first row in the default
+ServicePrice ordering wins a key, as with ``.first()``.
+
+Every committed catalog change bumps a catalog version kept in the cache
+(see myapp.signals). A file is stamped with the version it was built for;
+get_price_index() compares it with the current version (at most every
+PRICE_INDEX_CHECK_INTERVAL seconds) and treats an older file as stale:
+callers fall back to database pricing while a background thread rebuilds
+it. Rebuilds are debounced by PRICE_INDEX_REBUILD_DELAY seconds, so an
+admin save never pays for one, and a file lock lets one process per host
+build while the others remap the new file. Use a shared cache (Redis,
+Memcached) when several hosts serve the API; with a per-process cache only
+the writing process sees the new version, and the other processes of its
+host only pick up its rebuilt file.
+
+Settings:
+- PRICE_INDEX_ENABLED: use the index in ServicesByCategoryView (default: False)
+- PRICE_INDEX_PATH: index file location (default: <tmp>/obc_price_index.<database>.bin,
+  named after a hash of the default database's vendor, host, port and name)
+- PRICE_INDEX_CACHE: cache alias holding the catalog version (default: 'default')
+- PRICE_INDEX_CHECK_INTERVAL: seconds between version checks per process (default: 1)
+- PRICE_INDEX_REBUILD_DELAY: seconds a rebuild waits for more changes (default: 1)
+"""
+
+import bisect
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: no cross-process build lock
+    fcntl = None
+
+from .pricing import is_generic_model, resolve_price
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'OBCPIDX1'
+HEADER = struct.Struct('<8sQQ')
+NULL_CENTS = -(2 ** 63)
+
+MODEL_SPECIFIC = 'm'
+BRAND_GENERIC = 'g'
+
+VERSION_KEY = 'price-index:version'
+DEFAULT_CHECK_INTERVAL = 1
+DEFAULT_REBUILD_DELAY = 1
+
+
+def is_enabled():
+    return getattr(settings, 'PRICE_INDEX_ENABLED', False)
+
+
+def get_index_path():
+    path = getattr(settings, 'PRICE_INDEX_PATH', None)
+    if path:
+        return path
+    # One file per database, so projects (or test runs) on one host never share an index
+    database = connection.settings_dict
+    identity = '\x1f'.join(
+        str(part) for part in (connection.vendor, database['HOST'], database['PORT'], database['NAME'])
+    )
+    digest = hashlib.blake2b(identity.encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(tempfile.gettempdir(), f'obc_price_index.{digest}.bin')
+
+
+def get_cache():
+    return caches[getattr(settings, 'PRICE_INDEX_CACHE', 'default')]
+
+
+def current_version():
+    """The catalog version an index file must cover to be served."""
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Cold or flushed cache: a fresh (larger) version marks every existing file stale
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version or 0
+
+
+def bump_version():
+    """Mark the index of every process stale after a committed catalog change."""
+    global _checked_at
+
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+    # This process checks the new version on its next lookup
+    _checked_at = None
+
+
+def key_hash(kind, brand, model, service_id):
+    raw = '\x1f'.join((kind, brand.lower(), model.lower(), str(service_id)))
+    return int.from_bytes(hashlib.blake2b(raw.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _to_cents(value):
+    if value is None:
+        return NULL_CENTS
+    return int(Decimal(value).scaleb(2).to_integral_value())
+
+
+def _from_cents(cents):
+    if cents == NULL_CENTS:
+        return None
+    return Decimal(cents).scaleb(-2)
+
+
+def build_price_index(path=None, version=None):
+    """
+    Build the index file from the database and atomically replace the old one.
+    Returns the number of entries written.
+    """
+    from .models import ServicePrice
+    from .replicas import primary_reads
+
+    path = path or get_index_path()
+    # Read before the rows: a change committed meanwhile bumps past it and triggers another build
+    version = current_version() if version is None else version
+    started = time.perf_counter()
+
+    entries = {}
+    rows = ServicePrice.matched_services.through.objects.filter(
+        serviceprice__is_active=True, service__is_active=True
+    ).order_by(
+        *(f'serviceprice__{field}' for field in ServicePrice._meta.ordering)
+    ).values_list(
+        'serviceprice__brand', 'serviceprice__model', 'service_id',
+        'serviceprice__discounted_price', 'serviceprice__after_price'
+    )
+    # The file is shared and kept until the next change, so never built from a lagging replica
+    with primary_reads():
+        for brand, model, service_id, discounted, after in rows.iterator(chunk_size=2000):
+            columns = (_to_cents(discounted), _to_cents(after))
+            entries.setdefault(key_hash(MODEL_SPECIFIC, brand, model or '', service_id), columns)
+            if is_generic_model(model):
+                entries.setdefault(key_hash(BRAND_GENERIC, brand, '', service_id), columns)
+
+    keys = sorted(entries)
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.price_index.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as index_file:
+            index_file.write(HEADER.pack(MAGIC, version, len(keys)))
+            array('Q', keys).tofile(index_file)
+            array('q', (entries[key][0] for key in keys)).tofile(index_file)
+            array('q', (entries[key][1] for key in keys)).tofile(index_file)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    logger.info(f"✅ Built price index with {len(keys)} entries in {time.perf_counter() - started:.3f}s")
+    return len(keys)
+
+
+class PriceIndex:
+    """Read-only view of one memory-mapped index file."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as index_file:
+            stat = os.fstat(index_file.fileno())
+            self._mmap = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+        magic, self.version, count = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or stat.st_size != HEADER.size + count * 24:
+            raise ValueError(f"'{path}' is not a valid price index")
+
+        view = memoryview(self._mmap)
+        start = HEADER.size
+        width = count * 8
+        self._keys = view[start:start + width].cast('Q')
+        self._discounted = view[start + width:start + 2 * width].cast('q')
+        self._after = view[start + 2 * width:start + 3 * width].cast('q')
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, kind, brand, model, service_id):
+        """``(discounted_price, after_price)`` of the first matching row, or None."""
+        key = key_hash(kind, brand, model, service_id)
+        position = bisect.bisect_left(self._keys, key)
+        if position == len(self._keys) or self._keys[position] != key:
+            return None
+        return _from_cents(self._discounted[position]), _from_cents(self._after[position])
+
+    def resolve(self, brand, model, service_id):
+        """``(price, price_status)`` of a service for the given brand/model."""
+        return resolve_price(
+            self.lookup(MODEL_SPECIFIC, brand, model, service_id),
+            self.lookup(BRAND_GENERIC, brand, '', service_id),
+        )
+
+
+def file_version(path):
+    """Catalog version of an index file, or None when it is missing or invalid."""
+    try:
+        with open(path, 'rb') as index_file:
+            magic, version, _ = HEADER.unpack(index_file.read(HEADER.size))
+    except (OSError, struct.error):
+        return None
+    return version if magic == MAGIC else None
+
+
+@contextmanager
+def _build_lock(path):
+    """Non-blocking per-host build lock; yields whether it was acquired."""
+    if fcntl is None:
+        yield True
+        return
+    with open(f'{path}.lock', 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def refresh_price_index(path=None):
+    """
+    Rebuild the file unless it already covers the current version or another
+    process of this host is building it. Returns whether it was rebuilt.
+    """
+    path = path or get_index_path()
+    version = current_version()
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with _build_lock(path) as acquired:
+        if not acquired:
+            return False
+        built = file_version(path)
+        if built is not None and built >= version:
+            return False
+        build_price_index(path, version)
+        return True
+
+
+_rebuild_lock = threading.Lock()
+_rebuild_state = {'scheduled': False}
+
+
+def schedule_rebuild():
+    """
+    Rebuild the index in a background thread after PRICE_INDEX_REBUILD_DELAY
+    seconds; the changes committed in between share the rebuild.
+    """
+    with _rebuild_lock:
+        if _rebuild_state['scheduled']:
+            return
+        _rebuild_state['scheduled'] = True
+    timer = threading.Timer(
+        getattr(settings, 'PRICE_INDEX_REBUILD_DELAY', DEFAULT_REBUILD_DELAY), _rebuild_worker
+    )
+    timer.name = 'price-index-rebuild'
+    timer.daemon = True
+    timer.start()
+
+
+def _rebuild_worker():
+    from .signals import price_index_rebuilt
+
+    with _rebuild_lock:
+        # Changes from now on schedule another rebuild
+        _rebuild_state['scheduled'] = False
+    try:
+        if refresh_price_index():
+            price_index_rebuilt.send(sender=PriceIndex)
+    except Exception as e:
+        logger.error(f"❌ Rebuilding the price index failed: {str(e)}")
+    finally:
+        # The thread has its own database connection; don't leak it
+        connection.close()
+
+
+_current = None
+_current_lock = threading.Lock()
+_checked_at = None
+_checked_version = 0
+
+
+def _wanted_version():
+    """current_version(), read from the cache at most every PRICE_INDEX_CHECK_INTERVAL seconds."""
+    global _checked_at, _checked_version
+
+    now = time.monotonic()
+    checked_at = _checked_at
+    if checked_at is None or now - checked_at >= getattr(settings, 'PRICE_INDEX_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL):
+        _checked_version = current_version()
+        _checked_at = now
+    return _checked_version
+
+
+def get_price_index():
+    """
+    The current index of this process, remapped when the file was replaced.
+    Returns None when the index is disabled, missing, older than the catalog
+    or cannot be loaded, so callers fall back to the database; a missing or
+    stale file is rebuilt in the background.
+    """
+    global _current
+
+    if not is_enabled():
+        return None
+    path = get_index_path()
+    try:
+        wanted = _wanted_version()
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            schedule_rebuild()
+            return None
+
+        index = _current
+        if index is None or index.stamp != (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+            with _current_lock:
+                if _current is None or _current.stamp != (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+                    # The previous mapping stays alive until no lookup uses it anymore
+                    _current = PriceIndex(path)
+                    logger.info(f"🔄 Mapped price index version {_current.version} ({len(_current)} entries)")
+                index = _current
+        if index.version < wanted:
+            schedule_rebuild()
+            return None
+        return index
+    except Exception as e:
+        logger.warning(f"Price index unavailable, falling back to database pricing: {str(e)}")
+        return None
@@ -0,0 +1,102 @@
+"""
+Pure helpers for reading and validating ServicePrice sheet rows.
+
+Shared by the staged, partitioned and duplicate-collapsing import stages.
+Nothing here touches the database, so the helpers are safe to use in
+import worker processes.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+
+# Sheet header for every field, used when the column mapping
+# was not applied and the rows still carry the Excel headers.
+SHEET_COLUMNS = {
+    'brand': 'Brand',
+    'model': 'Model',
+    'type': 'Type',
+    'product_name': 'Product Name',
+    'before_price': 'Before Price',
+    'after_price': 'After Price',
+    'discounted_price': 'Discount Price',
+    'link': 'Link',
+}
+
+KEY_FIELDS = ('brand', 'model', 'type', 'product_name')
+VALUE_FIELDS = ('before_price', 'after_price', 'discounted_price', 'link')
+
+# Column lengths of ServicePrice, checked before rows reach the database
+MAX_LENGTHS = {'brand': 50, 'model': 50, 'type': 50, 'product_name': 100, 'link': 200}
+
+MAX_PRICE = Decimal('99999999.99')
+TWO_PLACES = Decimal('0.01')
+
+
+def clean_cell(value):
+    """Return a stripped string (or the raw number) for a sheet cell, None when empty."""
+    if value is None:
+        return None
+    if isinstance(value, float) and value != value:  # NaN from pandas
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        return value or None
+    return value
+
+
+def row_value(row, field):
+    """Read a field from a row keyed either by model field name or by sheet header."""
+    if field in row:
+        return clean_cell(row[field])
+    return clean_cell(row.get(SHEET_COLUMNS[field]))
+
+
+def normalize_key_part(value):
+    """Normalize one part of the unique key the same way as the SQL side (TRIM + LOWER)."""
+    return str(value or '').strip().lower()
+
+
+def parse_price(value, required=True):
+    """Parse a sheet price into a 2-place Decimal. Raises ValueError on bad input."""
+    if value is None:
+        return Decimal('0.00') if required else None
+    try:
+        price = Decimal(str(value)).quantize(TWO_PLACES)
+    except (InvalidOperation, ValueError):
+        raise ValueError(f"invalid price format '{value}'")
+    if price < 0:
+        raise ValueError(f"negative price '{value}'")
+    if price > MAX_PRICE:
+        raise ValueError(f"price '{value}' is too large")
+    return price
+
+
+def clean_price_row(row):
+    """
+    Validate a sheet row and return its cleaned field values.
+    Raises ValueError with a readable message when the row cannot be imported.
+
+    Pure function (no database access), so it can also run in worker processes.
+    """
+    values = {field: row_value(row, field) for field in KEY_FIELDS + ('link',)}
+    for field in KEY_FIELDS + ('link',):
+        if values[field] is not None:
+            values[field] = str(values[field])
+
+    if not values['brand'] or not values['product_name']:
+        raise ValueError('brand and product name are required')
+
+    for field, max_length in MAX_LENGTHS.items():
+        if values[field] and len(values[field]) > max_length:
+            raise ValueError(f'{field} is longer than {max_length} characters')
+
+    return {
+        'brand': values['brand'],
+        'model': values['model'] or '',
+        'type': values['type'] or '',
+        'product_name': values['product_name'],
+        'before_price': parse_price(row_value(row, 'before_price')),
+        'after_price': parse_price(row_value(row, 'after_price')),
+        'discounted_price': parse_price(row_value(row, 'discounted_price'), required=False),
+        'link': values['link'],
+    }
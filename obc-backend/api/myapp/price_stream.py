@@ -0,0 +1,191 @@
+"""
+Live price deltas for server-sent event (SSE) subscribers.
+
+Open app sessions subscribe to the prices of a car (brand/model), of a
+category, or both (see PriceStreamView), instead of polling
+ServicesByCategoryView.
+
+Every committed price write, whether from an import, an admin edit or any
+worker process, is already recorded in the catalog change feed (see
+myapp.changefeed). That table is the pub/sub channel between processes:
+each worker runs one poller that reads it for all of its subscribers, and
+an in-process broker fans the deltas out to the subscribers whose filter
+matches. A shared broker (e.g. Redis pub/sub) can replace the poller
+without changing the subscribers.
+
+Events carry the change feed sequence number as their id, so a client
+reconnecting with ``Last-Event-ID`` catches up on what it missed, or is
+told to resync when that is older than the retained change feed. Deltas
+arrive within one poll interval of their commit.
+
+Settings:
+- CATALOG_STREAM_POLL_SECONDS: change feed poll interval (default: 1)
+- CATALOG_STREAM_QUEUE_SIZE: deltas buffered per subscriber before it is told to resync (default: 100)
+- CATALOG_STREAM_HEARTBEAT_SECONDS: see myapp.async_views.PriceStreamView
+"""
+
+import asyncio
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .changefeed import ChangesExpired, changes_since, get_max_limit, publish_changes
+from .models import ServicePrice
+from .pricing import is_generic_model
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLL_SECONDS = 1
+DEFAULT_QUEUE_SIZE = 100
+
+# Sent instead of a delta when a subscriber fell too far behind
+RESYNC = object()
+
+
+def latest_change_id():
+    """Sequence number of the newest committed change."""
+    return publish_changes()
+
+
+def price_deltas_since(since):
+    """
+    Price changes after ``since``: ``(next, changed, removed)``. Each changed
+    price carries the ids of the categories of its matched services.
+    """
+    changed, removed = [], []
+    while True:
+        delta = changes_since(since, get_max_limit())
+        changed.extend(delta['prices']['changed'])
+        removed.extend(delta['prices']['removed'])
+        since = delta['next']
+        if not delta['has_more']:
+            break
+
+    categories = {}
+    if changed:
+        for price_id, category_id in ServicePrice.matched_services.through.objects.filter(
+            serviceprice_id__in=[price['id'] for price in changed]
+        ).values_list('serviceprice_id', 'service__category_id'):
+            categories.setdefault(price_id, set()).add(category_id)
+    for price in changed:
+        price['category_ids'] = categories.get(price['id'], set())
+    return since, changed, removed
+
+
+class Subscription:
+    """A subscriber's filter and its queue of pending deltas."""
+
+    def __init__(self, brand=None, model=None, category_id=None):
+        self.brand = brand.lower() if brand else None
+        self.model = (model or '').lower()
+        self.category_id = category_id
+        self.queue = asyncio.Queue(maxsize=getattr(settings, 'CATALOG_STREAM_QUEUE_SIZE', DEFAULT_QUEUE_SIZE))
+
+    def matches(self, price):
+        if self.category_id is not None and self.category_id not in price['category_ids']:
+            return False
+        if self.brand is not None:
+            if price['brand'].lower() != self.brand:
+                return False
+            # Brand-generic prices apply to every model of the brand
+            if (price['model'] or '').lower() != self.model and not is_generic_model(price['model']):
+                return False
+        return True
+
+    def delta(self, version, changed, removed):
+        """The part of a delta this subscriber sees, or None."""
+        matching = [
+            {key: value for key, value in price.items() if key != 'category_ids'}
+            for price in changed if self.matches(price)
+        ]
+        if not matching and not removed:
+            return None
+        # Removed rows can't be matched anymore; their ids are cheap to send to everyone
+        return {'version': version, 'changed': matching, 'removed': removed}
+
+    def offer(self, version, changed, removed):
+        delta = self.delta(version, changed, removed)
+        if delta is None:
+            return
+        try:
+            self.queue.put_nowait(delta)
+        except asyncio.QueueFull:
+            # Too far behind: replace the backlog with a resync request
+            self.offer_resync()
+
+    def offer_resync(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESYNC)
+
+
+class PriceBroker:
+    """In-process fan-out of change feed price deltas to the subscriptions of one event loop."""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.version = None
+        self._poller = None
+
+    async def subscribe(self, subscription, since=None):
+        """
+        Register a subscription. With ``since`` (a Last-Event-ID), the deltas
+        after it are queued first.
+        """
+        if self.version is None:
+            self.version = await sync_to_async(latest_change_id)()
+        if since is not None and since < self.version:
+            try:
+                version, changed, removed = await sync_to_async(price_deltas_since)(since)
+            except ChangesExpired:
+                subscription.offer_resync()
+            else:
+                subscription.offer(version, changed, removed)
+        self.subscriptions.add(subscription)
+        if self._poller is None or self._poller.done():
+            self._poller = asyncio.create_task(self._poll())
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def publish(self, version, changed, removed):
+        for subscription in list(self.subscriptions):
+            subscription.offer(version, changed, removed)
+
+    async def _poll(self):
+        interval = getattr(settings, 'CATALOG_STREAM_POLL_SECONDS', DEFAULT_POLL_SECONDS)
+        # Stops with the last subscriber; the next one restarts it from the current version
+        while self.subscriptions:
+            await asyncio.sleep(interval)
+            try:
+                version, changed, removed = await sync_to_async(price_deltas_since)(self.version)
+            except ChangesExpired:
+                # Polling stalled past the retention: everyone reloads
+                for subscription in list(self.subscriptions):
+                    subscription.offer_resync()
+                self.version = await sync_to_async(latest_change_id)()
+                continue
+            except Exception as e:
+                logger.error(f"❌ Price stream poll failed: {str(e)}")
+                continue
+            if version != self.version:
+                self.version = version
+                if changed or removed:
+                    self.publish(version, changed, removed)
+        self.version = None
+
+
+_brokers = {}
+
+
+def get_broker():
+    """The broker of the running event loop."""
+    loop = asyncio.get_running_loop()
+    broker = _brokers.get(loop)
+    if broker is None:
+        # Drop brokers of closed loops (e.g. asyncio.run() in tests and scripts)
+        for closed in [other for other in _brokers if other.is_closed()]:
+            del _brokers[closed]
+        broker = _brokers[loop] = PriceBroker()
+    return broker
@@ -0,0 +1,38 @@
+"""
+Brand/model price resolution rules for services.
+
+A service is priced from the ServicePrice rows linked to it (the rows whose
+product name contains the service header, see myapp.linkage):
+- the model-specific row's discounted price
+- otherwise the brand-generic row's discounted price (model empty or 'generic')
+- otherwise the model-specific row's after price
+- otherwise the brand-generic row's after price
+
+These are the same rules the queryset annotation in ServicesByCategoryView and
+the ServiceSerializer fallback apply, kept in one place for the price index.
+"""
+
+GENERIC_MODELS = ('', 'generic')
+
+
+def is_generic_model(model):
+    return not model or model.lower() in GENERIC_MODELS
+
+
+def resolve_price(model_specific, brand_generic):
+    """
+    Resolve the real price of a service.
+
+    Both arguments are ``(discounted_price, after_price)`` tuples of the first
+    matching row, or None when there is no such row.
+    Returns ``(price, price_status)``; ``(None, None)`` when nothing matched.
+    """
+    if model_specific is not None and model_specific[0] is not None:
+        return model_specific[0], 'model_specific'
+    if brand_generic is not None and brand_generic[0] is not None:
+        return brand_generic[0], 'brand_generic'
+    if model_specific is not None:
+        return model_specific[1], 'model_specific'
+    if brand_generic is not None:
+        return brand_generic[1], 'brand_generic'
+    return None, None
@@ -0,0 +1,68 @@
+"""
+Fast renderers for the catalog endpoints.
+
+Features:
+- FastJSONRenderer: same output as DRF's JSONRenderer, encoded with orjson
+  (falls back to DRF's encoder when orjson is not installed or an indented
+  response is requested)
+- MessagePackRenderer: compact binary responses for the mobile client,
+  selected with ``Accept: application/msgpack`` or ``?format=msgpack``
+
+Values JSON cannot represent natively (Decimal, lazy strings, dates, UUIDs...)
+go through DRF's JSONEncoder.default, so both renderers produce the same
+values as the default renderer.
+"""
+
+import msgpack
+from rest_framework.renderers import BaseRenderer, BrowsableAPIRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+def encode_default(value):
+    """Convert values the fast encoders don't support, exactly like DRF does."""
+    return _encoder.default(value)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer with orjson doing the encoding."""
+
+    if orjson is not None:
+        # DRF formats datetimes itself (millisecond precision, 'Z' suffix),
+        # so pass them through to encode_default instead of orjson's format.
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        ret = orjson.dumps(data, default=encode_default, option=self.options)
+        # Escape the JavaScript line terminators like JSONRenderer does
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Renders responses as MessagePack."""
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+# Renderers of the catalog views, in content negotiation order
+CATALOG_RENDERER_CLASSES = [FastJSONRenderer, MessagePackRenderer, BrowsableAPIRenderer]
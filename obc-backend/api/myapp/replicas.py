@@ -0,0 +1,194 @@
+"""
+Read-replica routing for the read-only catalog endpoints.
+
+Only views marked with ReplicaReadMixin / AsyncReplicaReadMixin read from a
+replica; every other query, and every write, uses the default database. A
+heavy import on the primary then no longer competes with catalog reads.
+
+Features:
+- One healthy replica is picked per request, so all its reads see one snapshot
+- Replicas lagging more than CATALOG_REPLICA_MAX_LAG seconds (PostgreSQL
+  streaming replicas) or failing their health check are skipped; with none
+  left, reads fall back to the primary
+- A request that writes reads from the primary from then on
+- PrimaryAfterWriteMiddleware keeps a client on the primary for
+  CATALOG_REPLICA_STICKY_SECONDS after its last write, so it reads its writes
+- primary_reads() pins a block to the primary (used for payloads that are
+  stored and served beyond the request, see myapp.payload_store)
+
+Enable it in settings:
+
+    DATABASES = {'default': {...}, 'replica': {...}}
+    DATABASE_ROUTERS = ['myapp.replicas.ReadReplicaRouter']
+    MIDDLEWARE += ['myapp.replicas.PrimaryAfterWriteMiddleware']
+    CATALOG_READ_REPLICAS = ['replica']
+
+A second SQLite file (kept in sync by hand or a copy) or a Postgres replica
+works for local testing; in tests, give the replica ``'TEST': {'MIRROR': 'default'}``.
+
+Settings:
+- CATALOG_READ_REPLICAS: database aliases of the replicas (default: [], no routing)
+- CATALOG_REPLICA_MAX_LAG: seconds of replication lag tolerated (default: 5)
+- CATALOG_REPLICA_CHECK_INTERVAL: seconds a replica's health is cached per process (default: 5)
+- CATALOG_REPLICA_STICKY_SECONDS: seconds a client reads from the primary after a write (default: 10)
+"""
+
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+PRIMARY_COOKIE = 'catalog_primary'
+
+DEFAULT_MAX_LAG = 5
+DEFAULT_CHECK_INTERVAL = 5
+DEFAULT_STICKY_SECONDS = 10
+
+# PostgreSQL: seconds the replica is behind, 0 when it has replayed everything it received
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+# Routing state of the current request: None outside replica-read views
+_routing = ContextVar('catalog_replica_routing', default=None)
+
+_health = {}
+_health_lock = threading.Lock()
+
+
+def get_replicas():
+    return list(getattr(settings, 'CATALOG_READ_REPLICAS', []))
+
+
+def measure_lag(alias):
+    """Replication lag of a replica in seconds, or None when it is unreachable."""
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(POSTGRES_LAG_SQL if connection.vendor == 'postgresql' else 'SELECT 1')
+            row = cursor.fetchone()
+    except DatabaseError as e:
+        logger.warning(f"⚠️ Read replica {alias} unavailable: {str(e)}")
+        return None
+    return float(row[0]) if connection.vendor == 'postgresql' else 0.0
+
+
+def is_healthy(alias):
+    """Whether a replica is reachable and within CATALOG_REPLICA_MAX_LAG (cached per process)."""
+    now = time.monotonic()
+    interval = getattr(settings, 'CATALOG_REPLICA_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+    with _health_lock:
+        checked = _health.get(alias)
+    if checked is not None and now - checked[0] < interval:
+        return checked[1]
+
+    lag = measure_lag(alias)
+    healthy = lag is not None and lag <= getattr(settings, 'CATALOG_REPLICA_MAX_LAG', DEFAULT_MAX_LAG)
+    if lag is not None and not healthy:
+        logger.warning(f"⚠️ Read replica {alias} is {lag:.1f}s behind; reading from the primary")
+    with _health_lock:
+        _health[alias] = (now, healthy)
+    return healthy
+
+
+def pick_replica():
+    """A healthy replica alias, or None to read from the primary."""
+    replicas = get_replicas()
+    random.shuffle(replicas)
+    for alias in replicas:
+        if is_healthy(alias):
+            return alias
+    return None
+
+
+@contextmanager
+def replica_reads(request=None):
+    """Route the reads of the block to a replica, unless the client has just written."""
+    if request is not None and request.COOKIES.get(PRIMARY_COOKIE):
+        alias = None
+    else:
+        alias = pick_replica() if get_replicas() else None
+    token = _routing.set({'replica': alias})
+    try:
+        yield alias
+    finally:
+        _routing.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Route the reads of the block to the primary, also inside replica-read views."""
+    token = _routing.set({'replica': None})
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+class ReadReplicaRouter:
+    """Sends the reads of replica-read views to the request's replica; all else to the primary."""
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or state['replica'] is None:
+            return DEFAULT_DB_ALIAS
+        return state['replica']
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            # Read this request's writes back from the primary
+            state['replica'] = None
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """Serve a (sync) view's reads from a read replica."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(request):
+            return super().dispatch(request, *args, **kwargs)
+
+
+class AsyncReplicaReadMixin:
+    """Serve an async view's reads from a read replica."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        with replica_reads(request):
+            return await super().dispatch(request, *args, **kwargs)
+
+
+class PrimaryAfterWriteMiddleware:
+    """
+    Mark clients that made a successful write request, so their replica-read
+    requests use the primary until the replicas have caught up.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE') and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_COOKIE, '1',
+                max_age=getattr(settings, 'CATALOG_REPLICA_STICKY_SECONDS', DEFAULT_STICKY_SECONDS),
+                httponly=True, samesite='Lax',
+            )
+        return response
@@ -6,6 +6,7 @@ This module defines resource classes that handle the import/update of ServicePri
 from import_export import resources, fields, widgets
 from import_export.widgets import ForeignKeyWidget, DecimalWidget
 from .models import ServicePrice
+from .import_reports import ImportReport
 import logging
 
 logger = logging.getLogger(__name__)
@@ -443,15 +444,15 @@ class ServicePriceResourceSmart(ServicePriceResource):
         self._init_import_summary()
     
     def _init_import_summary(self):
-        """Initialize or reset the import summary."""
+        """
+        Initialize the import summary.
+        Per-row details are written to an on-disk ImportReport; only counters are kept here.
+        """
         if not hasattr(self, 'import_summary'):
             self.import_summary = {
                 'total_processed': 0,
-                'new_records': [],
-                'updated_records': [],
-                'skipped_records': [],
-                'error_records': []
             }
+            self.import_report = ImportReport()
     
     class Meta:
         model = ServicePrice
@@ -571,16 +572,16 @@ class ServicePriceResourceSmart(ServicePriceResource):
         instance_id = row.get('_smart_instance_id')
         
         if row_result.import_type == 'new':
-            self.import_summary['new_records'].append({
+            self.import_report.add('new', {
                 'brand': brand,
                 'model': model,
                 'product_name': product_name,
-                'data': dict(row)
+                'data': {key: value for key, value in row.items() if not str(key).startswith('_smart_')}
             })
             logger.info(f"✅ CREATED: {brand} {model} - {product_name}")
         elif row_result.import_type == 'update':
             if changes:
-                self.import_summary['updated_records'].append({
+                self.import_report.add('updated', {
                     'brand': brand,
                     'model': model,
                     'product_name': product_name,
@@ -589,7 +590,7 @@ class ServicePriceResourceSmart(ServicePriceResource):
                 })
                 logger.info(f"🔄 UPDATED: {brand} {model} - {product_name}")
         elif row_result.import_type == 'skip':
-            self.import_summary['skipped_records'].append({
+            self.import_report.add('skipped', {
                 'brand': brand,
                 'model': model,
                 'product_name': product_name,
@@ -604,16 +605,39 @@ class ServicePriceResourceSmart(ServicePriceResource):
         if '_smart_instance_id' in row:
             del row['_smart_instance_id']
     
+    def import_data(self, *args, **kwargs):
+        """
+        Import as usual, then close the report file. The admin never asks for
+        the summary, so its dry run and confirm steps would leave it open.
+        """
+        try:
+            return super().import_data(*args, **kwargs)
+        finally:
+            self._init_import_summary()
+            self.import_report.close()
+    
+    def record_report_rows(self, kind, rows):
+        """Write rows handled outside the resource (errors, collapsed duplicates) to the report."""
+        self._init_import_summary()
+        for row in rows:
+            self.import_report.add(kind, row)
+    
     def get_import_summary(self):
         """
-        Get detailed summary of the import operation.
+        Get a bounded summary of the import operation.
+        
+        Only counts and a small sample per kind are returned; the full per-row
+        report is stored on disk under ``report_id``.
         """
         self._init_import_summary()  # Ensure summary is initialized
+        self.import_report.close()
+        report = self.import_report.summary()
         return {
             'total_processed': self.import_summary['total_processed'],
-            'new_count': len(self.import_summary['new_records']),
-            'updated_count': len(self.import_summary['updated_records']),
-            'skipped_count': len(self.import_summary['skipped_records']),
-            'error_count': len(self.import_summary['error_records']),
-            'details': self.import_summary
+            'new_count': report['counts']['new'],
+            'updated_count': report['counts']['updated'],
+            'skipped_count': report['counts']['skipped'],
+            'error_count': report['counts']['error'],
+            'report_id': report['report_id'],
+            'sample': report['sample']
         }
@@ -33,6 +33,12 @@ class ServiceSerializer(serializers.ModelSerializer):
     
     def get_real_price(self, obj):
         """Get real price from ServicePrice if available"""
+        # Prices resolved up front from the shared price index
+        resolved_prices = self.context.get('resolved_prices')
+        if resolved_prices is not None:
+            price, _ = resolved_prices.get(obj.id, (None, None))
+            return str(price) if price is not None else None
+        
         # Check if real_price was annotated in the queryset
         if hasattr(obj, 'real_price') and obj.real_price is not None:
             return str(obj.real_price)
@@ -48,7 +54,7 @@ class ServiceSerializer(serializers.ModelSerializer):
                 service_price = ServicePrice.objects.filter(
                     brand__iexact=brand,
                     model__iexact=model,
-                    product_name__icontains=obj.header,
+                    matched_services=obj,
                     is_active=True
                 ).first()
                 
@@ -59,7 +65,7 @@ class ServiceSerializer(serializers.ModelSerializer):
                 from django.db.models import Q
                 service_price = ServicePrice.objects.filter(
                     brand__iexact=brand,
-                    product_name__icontains=obj.header,
+                    matched_services=obj,
                     is_active=True
                 ).filter(
                     Q(model__isnull=True) | Q(model__exact='') | Q(model__iexact='generic')
@@ -94,6 +100,14 @@ class ServiceSerializer(serializers.ModelSerializer):
                 return 'service_default'
             return 'na'
         
+        # Prices resolved up front from the shared price index
+        resolved_prices = context.get('resolved_prices')
+        if resolved_prices is not None:
+            _, price_status = resolved_prices.get(obj.id, (None, None))
+            if price_status:
+                return price_status
+            return 'service_default' if obj.price else 'na'
+        
         # Check if real_price was annotated and has model-specific price
         if hasattr(obj, 'model_specific_price') and obj.model_specific_price is not None:
             return 'model_specific'
@@ -109,7 +123,7 @@ class ServiceSerializer(serializers.ModelSerializer):
                 service_price = ServicePrice.objects.filter(
                     brand__iexact=brand,
                     model__iexact=model,
-                    product_name__icontains=obj.header,
+                    matched_services=obj,
                     is_active=True
                 ).first()
                 
@@ -120,7 +134,7 @@ class ServiceSerializer(serializers.ModelSerializer):
                 from django.db.models import Q
                 service_price = ServicePrice.objects.filter(
                     brand__iexact=brand,
-                    product_name__icontains=obj.header,
+                    matched_services=obj,
                     is_active=True
                 ).filter(
                     Q(model__isnull=True) | Q(model__exact='') | Q(model__iexact='generic')
@@ -164,6 +178,22 @@ class ServicePriceSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at', 'updated_at', 'savings', 'discount_percentage']
 
 
+class PriceQuoteItemSerializer(serializers.Serializer):
+    """
+    One (service, car) pair of a batch price quote.
+    """
+    service_id = serializers.IntegerField(min_value=1)
+    brand = serializers.CharField(required=False, allow_blank=True, default='')
+    model = serializers.CharField(required=False, allow_blank=True, default='')
+
+
+class PriceQuoteSerializer(serializers.Serializer):
+    """
+    Serializer for the batch price quote request.
+    """
+    items = PriceQuoteItemSerializer(many=True, allow_empty=False)
+
+
 class ServicePriceImportSerializer(serializers.Serializer):
     """
     Serializer for handling file upload in the import API.
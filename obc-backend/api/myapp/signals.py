@@ -0,0 +1,214 @@
+"""
+Catalog change notifications.
+
+``catalog_changed`` is sent once a change to the priced catalog (ServicePrice
+rows, Service headers or categories) has been committed. Derived data such as the shared
+price index listens to it instead of to every individual model signal.
+``price_index_rebuilt`` follows once the price index has caught up.
+
+Features:
+- Model saves/deletes are reported after the surrounding transaction commits
+- Bulk and raw SQL import paths report their writes with notify_catalog_changed()
+- catalog_batch() collapses the notifications of a whole import into one
+- Saved prices and services are relinked (see myapp.linkage)
+- Saved and deleted rows are recorded in the sync change feed (see myapp.changefeed),
+  and published once committed
+- Brand/model facets of saved and deleted prices are refreshed (see myapp.facets)
+- Saved and deleted users drop their cached authentication state (see myapp.authentication)
+"""
+
+import logging
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .models import Service, ServiceCategory, ServicePrice
+
+logger = logging.getLogger(__name__)
+
+# Sent with sender=ServicePrice and a ``source`` keyword naming the writer
+catalog_changed = Signal()
+
+# Sent by the background rebuild once a new price index file is in place (see myapp.price_index)
+price_index_rebuilt = Signal()
+
+_batch_state = threading.local()
+
+
+def current_batch():
+    """The state dict of the enclosing catalog_batch(), or None."""
+    return getattr(_batch_state, 'batch', None)
+
+
+def notify_catalog_changed(source):
+    """Send catalog_changed after the current transaction commits."""
+    batch = getattr(_batch_state, 'batch', None)
+    if batch is not None:
+        batch['changed'] = True
+        return
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(
+        getattr(callback, 'catalog_change', False) for _, callback, *_ in connection.run_on_commit
+    ):
+        # Already scheduled for this transaction (e.g. a queryset delete of many rows)
+        return
+    callback = lambda: _send(source)
+    callback.catalog_change = True
+    transaction.on_commit(callback)
+
+
+def _send(source):
+    try:
+        catalog_changed.send(sender=ServicePrice, source=source)
+    except Exception as e:
+        logger.error(f"❌ catalog_changed receiver failed ({source}): {str(e)}")
+
+
+@contextmanager
+def catalog_batch(source, notify=True):
+    """
+    Report all catalog changes made inside the block as a single notification.
+
+    Pass ``notify=False`` for dry runs, whose writes are rolled back.
+    """
+    outer = getattr(_batch_state, 'batch', None)
+    if outer is not None:
+        # Nested batches fold into the outermost one
+        yield outer
+        return
+
+    batch = {'changed': False}
+    _batch_state.batch = batch
+    try:
+        yield batch
+    finally:
+        _batch_state.batch = None
+    if notify:
+        from .changefeed import flush_batch_changes
+        from .facets import flush_batch_facets
+
+        flush_batch_changes(batch)
+        flush_batch_facets(batch)
+        if batch['changed']:
+            notify_catalog_changed(source)
+
+
+@receiver(post_save, sender=ServicePrice)
+def service_price_saved(sender, instance, raw=False, **kwargs):
+    from .changefeed import record_instance_change
+    from .facets import mark_brands_changed
+    from .linkage import link_price
+
+    if not raw:
+        link_price(instance)
+    record_instance_change(instance)
+    mark_brands_changed({instance.brand, getattr(instance, '_loaded_brand', None)})
+    notify_catalog_changed('service_price')
+
+
+@receiver(post_delete, sender=ServicePrice)
+def service_price_deleted(sender, instance, **kwargs):
+    from .changefeed import record_instance_change
+    from .facets import mark_brands_changed
+
+    record_instance_change(instance, deleted=True)
+    mark_brands_changed({instance.brand})
+    notify_catalog_changed('service_price')
+
+
+@receiver(post_save, sender=Service)
+def service_saved(sender, instance, raw=False, **kwargs):
+    from .changefeed import record_instance_change
+    from .linkage import link_service
+
+    if not raw:
+        link_service(instance)
+    record_instance_change(instance)
+    notify_catalog_changed('service')
+
+
+@receiver(post_delete, sender=Service)
+def service_deleted(sender, instance, **kwargs):
+    from .changefeed import record_instance_change
+
+    record_instance_change(instance, deleted=True)
+    notify_catalog_changed('service')
+
+
+@receiver(post_save, sender=ServiceCategory)
+def service_category_saved(sender, instance, **kwargs):
+    from .changefeed import record_instance_change
+
+    record_instance_change(instance)
+    notify_catalog_changed('service_category')
+
+
+@receiver(post_delete, sender=ServiceCategory)
+def service_category_deleted(sender, instance, **kwargs):
+    from .changefeed import record_instance_change
+
+    record_instance_change(instance, deleted=True)
+    notify_catalog_changed('service_category')
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    from .authentication import invalidate_cached_user
+
+    invalidate_cached_user(instance)
+    # A request running before the commit may have cached the old state again
+    transaction.on_commit(lambda: invalidate_cached_user(instance))
+
+
+@receiver(catalog_changed)
+def publish_catalog_changes(sender, source=None, **kwargs):
+    from .changefeed import publish_changes
+
+    # Number the committed entries now, so readers find nothing left to publish
+    publish_changes()
+
+
+@receiver(catalog_changed)
+def rebuild_price_index(sender, source=None, **kwargs):
+    from .price_index import bump_version, is_enabled, schedule_rebuild
+
+    if is_enabled():
+        # Readers fall back to the database until the index is rebuilt off the request path
+        bump_version()
+        schedule_rebuild()
+
+
+@receiver(catalog_changed)
+def rerender_catalog_payloads(sender, source=None, **kwargs):
+    from .payload_store import bump_generation, is_enabled, schedule_rerender
+    from .price_index import is_enabled as price_index_enabled
+
+    if not is_enabled():
+        return
+    if price_index_enabled():
+        # Invalidate now; the payloads are re-rendered once the new index is built
+        bump_generation()
+    else:
+        schedule_rerender()
+
+
+@receiver(catalog_changed)
+def rebuild_catalog_snapshot(sender, source=None, **kwargs):
+    from .snapshot import is_loaded, schedule_rebuild
+
+    # Processes that never served the snapshot pick up the rebuilt file on their next request
+    if is_loaded():
+        schedule_rebuild()
+
+
+@receiver(price_index_rebuilt)
+def rerender_payloads_after_price_index(sender, **kwargs):
+    from .payload_store import is_enabled, schedule_rerender
+
+    if is_enabled():
+        schedule_rerender()
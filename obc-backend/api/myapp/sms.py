@@ -0,0 +1,74 @@
+"""
+Pluggable SMS delivery for OTP messages.
+
+MessaHandler (see myapp.views) hands every message to the backend named by
+SMS_BACKEND, like Django's EMAIL_BACKEND:
+
+- TwilioBackend (default): sends through Twilio with the TWILIO_* settings
+- WebhookBackend: POSTs ``{"to": ..., "body": ...}`` as JSON to
+  SMS_WEBHOOK_URL, e.g. the SMS provider stand-in of loadtest_journey.py.
+  For local and staging load tests only: whoever serves that URL reads
+  every OTP code
+- LocMemBackend: appends the messages to ``myapp.sms.outbox`` (tests)
+
+Settings:
+- SMS_BACKEND: dotted path of the backend class (default: 'myapp.sms.TwilioBackend')
+- SMS_WEBHOOK_URL: URL the WebhookBackend posts to (default: 'http://127.0.0.1:8025/messages')
+- SMS_WEBHOOK_TIMEOUT: seconds the WebhookBackend waits for the stand-in (default: 5)
+"""
+
+import json
+import uuid
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_BACKEND = 'myapp.sms.TwilioBackend'
+DEFAULT_WEBHOOK_URL = 'http://127.0.0.1:8025/messages'
+DEFAULT_WEBHOOK_TIMEOUT = 5
+
+# Messages sent with the LocMemBackend, oldest first
+outbox = []
+
+
+def get_backend():
+    return import_string(getattr(settings, 'SMS_BACKEND', DEFAULT_BACKEND))()
+
+
+def send_sms(to, body):
+    """Send one message with the configured backend. Returns the message id."""
+    return get_backend().send(to, body)
+
+
+class TwilioBackend:
+    def send(self, to, body):
+        from twilio.rest import Client
+
+        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        message = client.messages.create(body=body, from_=settings.TWILIO_PHONE_NUMBER, to=to)
+        return message.sid
+
+
+class WebhookBackend:
+    def send(self, to, body):
+        request = Request(
+            getattr(settings, 'SMS_WEBHOOK_URL', DEFAULT_WEBHOOK_URL),
+            data=json.dumps({'to': to, 'body': body}).encode(),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        # Raises on connection errors and error statuses, like a failed Twilio call
+        with urlopen(request, timeout=getattr(settings, 'SMS_WEBHOOK_TIMEOUT', DEFAULT_WEBHOOK_TIMEOUT)) as response:
+            reply = response.read()
+        try:
+            return json.loads(reply).get('id') or ''
+        except (ValueError, AttributeError):
+            return ''
+
+
+class LocMemBackend:
+    def send(self, to, body):
+        message_id = uuid.uuid4().hex
+        outbox.append({'id': message_id, 'to': to, 'body': body})
+        return message_id
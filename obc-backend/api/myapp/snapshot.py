@@ -0,0 +1,283 @@
+"""
+Offline catalog snapshot for the mobile client.
+
+The whole active catalog (categories, services and the prices of every
+brand/model with their linked services) is packed into one MessagePack blob,
+so the app can download it once and resolve prices locally instead of
+calling ServicesByCategoryView for every category and car.
+
+Blob layout (a MessagePack map):
+    format        snapshot format number (FORMAT)
+    version       catalog change sequence the snapshot is current for; pass it
+                  as ``since`` to /api/catalog/changes/ to stay up to date
+    generated_at  ISO 8601 timestamp
+    categories    {'columns': [...], 'rows': [[...], ...]}
+    services      same layout, with the category id
+    prices        same layout, with the ids of the linked services, in the
+                  ServicePrice ordering: the first matching row wins, like
+                  on the server (see myapp.pricing.resolve_price)
+
+Prices are strings with 2 decimal places, as in the JSON API. The blob's
+SHA-256 is its ETag and is sent in the X-Content-SHA256 header.
+
+The file is built on the first request (or with
+``python manage.py build_catalog_snapshot``) and replaced atomically. After a
+catalog change it is rebuilt in a background thread, like the price index,
+while the previous file is still served: catalog_changed schedules the
+rebuild in the process that made the change, and every process compares the
+served version with the catalog's at most every
+CATALOG_SNAPSHOT_CHECK_INTERVAL seconds for changes made elsewhere. Clients
+catch up on the difference with the change feed.
+
+Settings:
+- CATALOG_SNAPSHOT_PATH: snapshot file location (default: <tmp>/obc_catalog_snapshot.msgpack)
+- CATALOG_SNAPSHOT_CHECK_INTERVAL: seconds between version checks per process (default: 5)
+- CATALOG_SNAPSHOT_REBUILD_DELAY: seconds a rebuild waits for more changes (default: 1)
+"""
+
+import gzip
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import msgpack
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .changefeed import publish_changes
+from .models import Service, ServiceCategory, ServicePrice
+from .price_rows import TWO_PLACES
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+FORMAT = 1
+
+CATEGORY_COLUMNS = ('id', 'name', 'description', 'icon', 'slug')
+SERVICE_COLUMNS = (
+    'id', 'category_id', 'header', 'details', 'pagedetails', 'price', 'duration', 'image', 'is_featured',
+)
+PRICE_COLUMNS = (
+    'id', 'brand', 'model', 'type', 'product_name',
+    'before_price', 'after_price', 'discounted_price', 'link',
+)
+DECIMAL_COLUMNS = {'price', 'before_price', 'after_price', 'discounted_price'}
+
+DEFAULT_CHECK_INTERVAL = 5
+DEFAULT_REBUILD_DELAY = 1
+
+
+def get_snapshot_path():
+    return getattr(
+        settings, 'CATALOG_SNAPSHOT_PATH',
+        os.path.join(tempfile.gettempdir(), 'obc_catalog_snapshot.msgpack')
+    )
+
+
+def current_version():
+    """Latest catalog change sequence number."""
+    return publish_changes()
+
+
+def _table(queryset, columns, extra_column=None, extra=None):
+    decimal_positions = [position for position, column in enumerate(columns) if column in DECIMAL_COLUMNS]
+    rows = []
+    for row in queryset.values_list(*columns).iterator(chunk_size=2000):
+        row = list(row)
+        for position in decimal_positions:
+            if row[position] is not None:
+                row[position] = str(row[position].quantize(TWO_PLACES))
+        if extra_column:
+            row.append(extra.get(row[0], []))
+        rows.append(row)
+    return {
+        'columns': list(columns) + ([extra_column] if extra_column else []),
+        'rows': rows,
+    }
+
+
+def build_snapshot():
+    """Pack the active catalog. Returns (version, blob)."""
+    # Read the version first: changes made while packing are then replayed
+    # by the client's next delta sync, which is idempotent
+    version = current_version()
+
+    linked_services = {}
+    for price_id, service_id in ServicePrice.matched_services.through.objects.filter(
+        serviceprice__is_active=True, service__is_active=True
+    ).order_by('serviceprice_id', 'service_id').values_list('serviceprice_id', 'service_id').iterator(chunk_size=2000):
+        linked_services.setdefault(price_id, []).append(service_id)
+
+    data = {
+        'format': FORMAT,
+        'version': version,
+        'generated_at': timezone.now().isoformat(),
+        'categories': _table(
+            ServiceCategory.objects.filter(is_active=True).order_by('id'), CATEGORY_COLUMNS
+        ),
+        'services': _table(
+            Service.objects.filter(is_active=True).order_by('-is_featured', 'created_at'), SERVICE_COLUMNS
+        ),
+        'prices': _table(
+            ServicePrice.objects.filter(is_active=True), PRICE_COLUMNS,
+            extra_column='service_ids', extra=linked_services
+        ),
+    }
+    return version, msgpack.packb(data, use_bin_type=True)
+
+
+def write_snapshot(path=None):
+    """Build the snapshot and atomically replace the file. Returns (version, size, sha256)."""
+    path = path or get_snapshot_path()
+    started = time.perf_counter()
+    version, blob = build_snapshot()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.catalog_snapshot.', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as snapshot_file:
+            snapshot_file.write(blob)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    sha256 = hashlib.sha256(blob).hexdigest()
+    logger.info(
+        f"✅ Built catalog snapshot version {version} ({len(blob):,} bytes) "
+        f"in {time.perf_counter() - started:.3f}s"
+    )
+    return version, len(blob), sha256
+
+
+def _load(path, stamp):
+    with open(path, 'rb') as snapshot_file:
+        blob = snapshot_file.read()
+    sha256 = hashlib.sha256(blob).hexdigest()
+    return {
+        'stamp': stamp,
+        'version': msgpack.unpackb(blob, raw=False)['version'],
+        'sha256': sha256,
+        'etag': f'"{sha256}"',
+        'identity': blob,
+        'gzip': gzip.compress(blob, compresslevel=9, mtime=0),
+        'br': brotli.compress(blob) if brotli is not None else None,
+    }
+
+
+_current = None
+_current_lock = threading.Lock()
+_checked_at = None
+_checked_version = 0
+
+
+def _reload(path):
+    """The entry of the file at ``path``, reloaded when it was replaced; None when it is missing."""
+    global _current
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    with _current_lock:
+        if _current is None or _current['stamp'] != stamp:
+            _current = _load(path, stamp)
+        return _current
+
+
+def is_loaded():
+    """Whether this process serves a snapshot."""
+    return _current is not None
+
+
+_build_lock = threading.Lock()
+
+
+def refresh_snapshot(path=None):
+    """
+    Rebuild the file unless it already covers the current version. Returns
+    whether it was rebuilt.
+    """
+    path = path or get_snapshot_path()
+    with _build_lock:
+        entry = _reload(path)
+        if entry is not None and entry['version'] >= current_version():
+            return False
+        write_snapshot(path)
+        _reload(path)
+        return True
+
+
+_rebuild_lock = threading.Lock()
+_rebuild_state = {'scheduled': False}
+
+
+def schedule_rebuild():
+    """
+    Rebuild the snapshot in a background thread after
+    CATALOG_SNAPSHOT_REBUILD_DELAY seconds; the changes committed in between
+    share the rebuild.
+    """
+    with _rebuild_lock:
+        if _rebuild_state['scheduled']:
+            return
+        _rebuild_state['scheduled'] = True
+    timer = threading.Timer(
+        getattr(settings, 'CATALOG_SNAPSHOT_REBUILD_DELAY', DEFAULT_REBUILD_DELAY), _rebuild_worker
+    )
+    timer.name = 'catalog-snapshot-rebuild'
+    timer.daemon = True
+    timer.start()
+
+
+def _rebuild_worker():
+    with _rebuild_lock:
+        # Changes from now on schedule another rebuild
+        _rebuild_state['scheduled'] = False
+    try:
+        refresh_snapshot()
+    except Exception as e:
+        logger.error(f"❌ Rebuilding the catalog snapshot failed: {str(e)}")
+    finally:
+        # The thread has its own database connection; don't leak it
+        connection.close()
+
+
+def _wanted_version():
+    """current_version(), read at most every CATALOG_SNAPSHOT_CHECK_INTERVAL seconds."""
+    global _checked_at, _checked_version
+
+    now = time.monotonic()
+    checked_at = _checked_at
+    interval = getattr(settings, 'CATALOG_SNAPSHOT_CHECK_INTERVAL', DEFAULT_CHECK_INTERVAL)
+    if checked_at is None or now - checked_at >= interval:
+        _checked_version = current_version()
+        _checked_at = now
+    return _checked_version
+
+
+def get_snapshot():
+    """
+    The current snapshot entry (same shape as a payload store entry, plus
+    ``version`` and ``sha256``). Only a missing file is built on the request;
+    an older one is served while it is rebuilt in the background.
+    """
+    path = get_snapshot_path()
+    entry = _reload(path)
+    if entry is None:
+        refresh_snapshot(path)
+        return _reload(path)
+    if entry['version'] < _wanted_version():
+        schedule_rebuild()
+    return entry
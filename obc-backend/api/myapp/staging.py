@@ -0,0 +1,398 @@
+"""
+Staged (set-based) import for ServicePrice data.
+
+Instead of looking up and saving every sheet row through the ORM, the staged
+import works in three steps:
+
+1. Bulk-load the validated sheet rows into ServicePriceStaging under a batch id.
+2. Diff the batch against ServicePrice with set-based SQL
+   (anti-join for new keys, UPDATE ... FROM for changed rows).
+3. Apply the whole diff in one short merge transaction, so readers of the
+   catalog and price endpoints see either the old or the new price set,
+   never a half-applied one. The import report is written before the
+   merge, and new rows are linked and facets refreshed after it commits.
+
+Rows are matched on the unique key (brand, model, type, product_name),
+trimmed and case-insensitive.
+"""
+
+import logging
+import uuid
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .changefeed import record_queryset_changes
+from .dedup import collapse_duplicates
+from .facets import mark_queryset_brands
+from .import_reports import ImportReport
+from .linkage import link_prices
+from .models import ServicePrice, ServicePriceStaging
+from .price_rows import KEY_FIELDS, VALUE_FIELDS, clean_price_row
+from .signals import notify_catalog_changed
+
+logger = logging.getLogger(__name__)
+
+# Normalized key columns of the staging table, in KEY_FIELDS order
+KEY_COLUMNS = ('brand_key', 'model_key', 'type_key', 'product_key')
+MAX_RESPONSE_ERRORS = 20
+
+
+def build_staging_row(batch_id, row_number, row):
+    """Validate a sheet row and build the matching ServicePriceStaging instance."""
+    return ServicePriceStaging(batch_id=batch_id, row_number=row_number, **clean_price_row(row))
+
+
+class StagedServicePriceImport:
+    """
+    Set-based import of a price sheet through the staging table.
+
+    A sheet with invalid rows is never merged; the response reports the
+    invalid rows and the diff of the valid ones.
+
+    Usage:
+        importer = StagedServicePriceImport(deactivate_missing=False)
+        response_data = importer.run(records, dry_run=True, duplicate_policy='last')
+
+    When ``deactivate_missing`` is set, live prices of the brands present in
+    the sheet that are not in the sheet are deactivated in the same merge,
+    so the sheet becomes the complete price set for those brands.
+    """
+
+    batch_size = 1000
+
+    def __init__(self, deactivate_missing=False):
+        self.deactivate_missing = deactivate_missing
+        self.batch_id = uuid.uuid4().hex
+        self.invalid_rows = []
+        self.loaded_rows = 0
+        self.duplicate_rows = 0
+        self.collapsed_sample = []
+        self.counts = {'new': 0, 'update': 0, 'skip': 0, 'deactivated': 0}
+        self.report = ImportReport()
+
+        qn = connection.ops.quote_name
+        self.live_table = qn(ServicePrice._meta.db_table)
+        self.staging_table = qn(ServicePriceStaging._meta.db_table)
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def run(self, records, dry_run=True, duplicate_policy=None):
+        """
+        Load, diff and (unless dry_run) merge the given sheet records.
+        Raises DuplicateKeyError when ``duplicate_policy`` is 'error' and a key repeats.
+        """
+        try:
+            records, row_numbers, collapsed = collapse_duplicates(records, duplicate_policy)
+            for entry in collapsed:
+                self.report.add('duplicate', entry)
+            self.duplicate_rows = len(collapsed)
+            self.collapsed_sample = collapsed[:MAX_RESPONSE_ERRORS]
+
+            self._load(records, row_numbers)
+            self._collapse_duplicates()
+            if dry_run or self.invalid_rows:
+                # All or nothing, like the resource based strategies: a sheet with
+                # invalid rows is only diffed, never merged
+                self._count_diff()
+                self._write_report()
+            else:
+                self._merge()
+        finally:
+            self._discard()
+            self.report.close()
+        return self.get_response_data(dry_run)
+
+    def get_response_data(self, dry_run):
+        """Format the result the same way as the resource based import strategies."""
+        errors = [
+            {'row': row_number, 'errors': [message]}
+            for row_number, message in self.invalid_rows[:MAX_RESPONSE_ERRORS]
+        ]
+        report = self.report.summary()
+        response_data = {
+            'status': 'error' if errors else 'success',
+            'dry_run': dry_run,
+            'import_strategy': 'staged',
+            'totals': {
+                'new': self.counts['new'],
+                'update': self.counts['update'],
+                'delete': self.counts['deactivated'],
+                'skip': self.counts['skip'] + self.duplicate_rows,
+                'error': 0,
+                'invalid': len(self.invalid_rows),
+            },
+            'total_rows': self.loaded_rows + self.duplicate_rows + len(self.invalid_rows),
+            'duplicates_collapsed': self.duplicate_rows,
+            'collapsed_rows': self.collapsed_sample,
+            'detailed_summary': {
+                'new_count': self.counts['new'],
+                'updated_count': self.counts['update'],
+                'skipped_count': self.counts['skip'],
+                'error_count': len(self.invalid_rows),
+                'report_id': report['report_id'],
+                'sample': report['sample'],
+            },
+        }
+
+        message_parts = []
+        if self.counts['new']:
+            message_parts.append(f"{self.counts['new']} new records")
+        if self.counts['update']:
+            message_parts.append(f"{self.counts['update']} updated records")
+        if self.counts['skip']:
+            message_parts.append(f"{self.counts['skip']} unchanged records")
+        if self.counts['deactivated']:
+            message_parts.append(f"{self.counts['deactivated']} deactivated records")
+        summary = ', '.join(message_parts) if message_parts else 'No changes detected'
+
+        if errors:
+            response_data['errors'] = errors
+            response_data['message'] = (
+                f'❌ {len(self.invalid_rows)} rows could not be staged, nothing was imported. '
+                f'Valid rows: {summary}.'
+            )
+        elif dry_run:
+            response_data['message'] = f'✅ Validation successful! {summary}. Ready for actual import.'
+        else:
+            response_data['message'] = f'🎉 Price set swapped in atomically! {summary}.'
+        return response_data
+
+    # ------------------------------------------------------------------
+    # Staging
+    # ------------------------------------------------------------------
+    def _load(self, records, row_numbers):
+        """Validate the sheet rows and bulk-load them into the staging table."""
+        pending = []
+        # Row numbers are 1-based sheet data rows, matching the import-export error report
+        for row_number, row in zip(row_numbers, records):
+            try:
+                pending.append(build_staging_row(self.batch_id, row_number, row))
+            except ValueError as e:
+                self.invalid_rows.append((row_number, str(e)))
+                self.report.add('error', {'row': row_number, 'errors': [str(e)]})
+                continue
+
+            if len(pending) >= self.batch_size:
+                ServicePriceStaging.objects.bulk_create(pending)
+                self.loaded_rows += len(pending)
+                pending = []
+
+        if pending:
+            ServicePriceStaging.objects.bulk_create(pending)
+            self.loaded_rows += len(pending)
+
+        # Normalize the keys with the database's own TRIM/LOWER so the diff
+        # compares like with like on both sides of the join.
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {self.staging_table} SET "
+                "brand_key = LOWER(TRIM(brand)), model_key = LOWER(TRIM(model)), "
+                "type_key = LOWER(TRIM(type)), product_key = LOWER(TRIM(product_name)) "
+                "WHERE batch_id = %s",
+                [self.batch_id]
+            )
+        logger.info(f"📥 Staged {self.loaded_rows} rows in batch {self.batch_id} ({len(self.invalid_rows)} invalid)")
+
+    def _collapse_duplicates(self):
+        """
+        Safety net after the in-sheet duplicate collapsing: keep only the last
+        staged row for any key that is still repeated under the database's
+        TRIM/LOWER (which can differ from Python's for non-ASCII text).
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {self.staging_table} WHERE batch_id = %s AND row_number < ("
+                f"SELECT MAX(dup.row_number) FROM {self.staging_table} dup "
+                f"WHERE dup.batch_id = {self.staging_table}.batch_id AND "
+                + " AND ".join(f"dup.{column} = {self.staging_table}.{column}" for column in KEY_COLUMNS)
+                + ")",
+                [self.batch_id]
+            )
+            collapsed = max(cursor.rowcount, 0)
+        self.duplicate_rows += collapsed
+        self.loaded_rows -= collapsed
+        if collapsed:
+            logger.info(f"🔁 Collapsed {collapsed} duplicate rows in batch {self.batch_id}")
+
+    def _after_merge(self, merged_at):
+        """Link the inserted rows and refresh the facets of the merged brands."""
+        # Updates never change the key, so only inserted rows need linking
+        link_prices(ServicePrice.objects.filter(created_at=merged_at))
+        mark_queryset_brands(ServicePrice.objects.filter(updated_at=merged_at))
+
+    def _discard(self):
+        """Remove the batch from the staging table."""
+        ServicePriceStaging.objects.filter(batch_id=self.batch_id).delete()
+
+    # ------------------------------------------------------------------
+    # Set-based diff and merge
+    # ------------------------------------------------------------------
+    def _key_match(self, live_alias, staging_alias, search_staging=False):
+        """
+        SQL predicate matching live and staged rows on the normalized key.
+
+        By default the live rows are looked up by serviceprice_norm_key_idx;
+        appending '' drops the staging column's type affinity, without which
+        SQLite won't use that index. With ``search_staging`` the staged rows
+        are looked up by staging_batch_key_idx instead.
+        """
+        if search_staging:
+            return " AND ".join(
+                f"{staging_alias}.{column} = LOWER(TRIM({live_alias}.{field}))"
+                for field, column in zip(KEY_FIELDS, KEY_COLUMNS)
+            )
+        return " AND ".join(
+            f"LOWER(TRIM({live_alias}.{field})) = {staging_alias}.{column} || ''"
+            for field, column in zip(KEY_FIELDS, KEY_COLUMNS)
+        )
+
+    def _changed(self, live_alias, staging_alias):
+        """SQL predicate that is true when a live row differs from its staged row."""
+        checks = [
+            f"({live_alias}.{field} <> {staging_alias}.{field} OR "
+            f"({live_alias}.{field} IS NULL) <> ({staging_alias}.{field} IS NULL))"
+            for field in VALUE_FIELDS
+        ]
+        checks.append(f"NOT {live_alias}.is_active")
+        return "(" + " OR ".join(checks) + ")"
+
+    def _count_diff(self):
+        """Count new, changed, unchanged and (optionally) deactivated rows."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {self.staging_table} st WHERE st.batch_id = %s AND NOT EXISTS ("
+                f"SELECT 1 FROM {self.live_table} sp WHERE {self._key_match('sp', 'st')})",
+                [self.batch_id]
+            )
+            self.counts['new'] = cursor.fetchone()[0]
+
+            cursor.execute(
+                f"SELECT COUNT(*) FROM {self.staging_table} st WHERE st.batch_id = %s AND EXISTS ("
+                f"SELECT 1 FROM {self.live_table} sp WHERE {self._key_match('sp', 'st')} "
+                f"AND {self._changed('sp', 'st')})",
+                [self.batch_id]
+            )
+            self.counts['update'] = cursor.fetchone()[0]
+
+            if self.deactivate_missing:
+                cursor.execute(
+                    f"SELECT COUNT(*) FROM {self.live_table} sp WHERE {self._missing_from_batch('sp')}",
+                    [self.batch_id, self.batch_id]
+                )
+                self.counts['deactivated'] = cursor.fetchone()[0]
+
+        self.counts['skip'] = self.loaded_rows - self.counts['new'] - self.counts['update']
+
+    def _write_report(self):
+        """Stream the per-row diff of the batch into the import report."""
+        key_columns = ", ".join(f"st.{field}" for field in KEY_FIELDS)
+        live_values = ", ".join(f"sp.{field}" for field in VALUE_FIELDS)
+        staged_values = ", ".join(f"st.{field}" for field in VALUE_FIELDS)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT st.row_number, {key_columns}, {staged_values} FROM {self.staging_table} st "
+                f"WHERE st.batch_id = %s AND NOT EXISTS ("
+                f"SELECT 1 FROM {self.live_table} sp WHERE {self._key_match('sp', 'st')}) "
+                "ORDER BY st.row_number",
+                [self.batch_id]
+            )
+            for row in self._fetch_in_chunks(cursor):
+                keys = dict(zip(KEY_FIELDS, row[1:5]))
+                self.report.add('new', {**keys, 'row': row[0], 'data': dict(zip(VALUE_FIELDS, row[5:]))})
+
+            cursor.execute(
+                f"SELECT st.row_number, sp.id, {key_columns}, {live_values}, {staged_values}, "
+                f"{self._changed('sp', 'st')} FROM {self.staging_table} st "
+                f"JOIN {self.live_table} sp ON {self._key_match('sp', 'st')} "
+                "WHERE st.batch_id = %s ORDER BY st.row_number",
+                [self.batch_id]
+            )
+            value_count = len(VALUE_FIELDS)
+            for row in self._fetch_in_chunks(cursor):
+                keys = dict(zip(KEY_FIELDS, row[2:6]))
+                old_values = row[6:6 + value_count]
+                new_values = row[6 + value_count:6 + 2 * value_count]
+                if row[-1]:
+                    changes = [
+                        {'field': field, 'old': old, 'new': new}
+                        for field, old, new in zip(VALUE_FIELDS, old_values, new_values)
+                        if old != new
+                    ]
+                    self.report.add('updated', {**keys, 'row': row[0], 'id': row[1], 'changes': changes})
+                else:
+                    self.report.add('skipped', {**keys, 'row': row[0], 'id': row[1], 'reason': 'No changes detected'})
+
+    def _fetch_in_chunks(self, cursor, size=1000):
+        while True:
+            rows = cursor.fetchmany(size)
+            if not rows:
+                break
+            yield from rows
+
+    def _missing_from_batch(self, live_alias):
+        """Predicate for active live rows of the batch's brands that are absent from the batch."""
+        return (
+            f"{live_alias}.is_active AND LOWER(TRIM({live_alias}.brand)) IN ("
+            f"SELECT brand_key || '' FROM {self.staging_table} WHERE batch_id = %s) "
+            f"AND NOT EXISTS (SELECT 1 FROM {self.staging_table} st "
+            f"WHERE st.batch_id = %s AND {self._key_match(live_alias, 'st', search_staging=True)})"
+        )
+
+    def _merge(self):
+        """
+        Apply the staged batch to ServicePrice in one short transaction. The
+        report is written before it; linking and facets run after the commit.
+        """
+        merged_at = timezone.now()
+        now = connection.ops.adapt_datetimefield_value(merged_at)
+
+        self._count_diff()
+        self._write_report()
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # UPDATE ... FROM: changed rows take the staged values
+                cursor.execute(
+                    f"UPDATE {self.live_table} AS sp SET "
+                    + ", ".join(f"{field} = st.{field}" for field in VALUE_FIELDS)
+                    + ", is_active = %s, updated_at = %s "
+                    f"FROM {self.staging_table} st WHERE st.batch_id = %s "
+                    f"AND {self._key_match('sp', 'st')} AND {self._changed('sp', 'st')}",
+                    [True, now, self.batch_id]
+                )
+                self.counts['update'] = cursor.rowcount
+
+                # INSERT ... SELECT with an anti-join: keys that are not live yet
+                columns = KEY_FIELDS + VALUE_FIELDS
+                cursor.execute(
+                    f"INSERT INTO {self.live_table} ("
+                    + ", ".join(columns) + ", is_active, created_at, updated_at) "
+                    "SELECT " + ", ".join(f"st.{column}" for column in columns) + ", %s, %s, %s "
+                    f"FROM {self.staging_table} st WHERE st.batch_id = %s AND NOT EXISTS ("
+                    f"SELECT 1 FROM {self.live_table} sp WHERE {self._key_match('sp', 'st')})",
+                    [True, now, now, self.batch_id]
+                )
+                self.counts['new'] = cursor.rowcount
+
+                if self.deactivate_missing:
+                    cursor.execute(
+                        f"UPDATE {self.live_table} AS sp SET is_active = %s, updated_at = %s "
+                        f"WHERE {self._missing_from_batch('sp')}",
+                        [False, now, self.batch_id, self.batch_id]
+                    )
+                    self.counts['deactivated'] = cursor.rowcount
+            # The counts of the statements themselves, in case the live rows moved since the diff
+            self.counts['skip'] = self.loaded_rows - self.counts['new'] - self.counts['update']
+
+            # Inserted, updated and deactivated rows all carry the merge timestamp
+            record_queryset_changes(ServicePrice.objects.filter(updated_at=merged_at))
+            transaction.on_commit(lambda: self._after_merge(merged_at))
+            notify_catalog_changed('staged_import')
+
+        logger.info(
+            f"✅ Merged batch {self.batch_id}: {self.counts['new']} new, "
+            f"{self.counts['update']} updated, {self.counts['skip']} unchanged, "
+            f"{self.counts['deactivated']} deactivated"
+        )
@@ -1,3 +1,1861 @@
-from django.test import TestCase
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.renderers import JSONRenderer
+from rest_framework.throttling import BaseThrottle
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from . import (
+    authentication, changefeed, import_worker, payload_store, price_index, price_stream, replicas, sms, snapshot,
+    warming,
+)
+from .admin import TypeInputFilter
+from .async_views import AsyncServiceCategoryListView, PriceStreamView
+from .authentication import CachedJWTAuthentication
+from .catalog import _resolve_from_database
+from .changefeed import changes_since, publish_changes
+from .dedup import DuplicateKeyError, collapse_duplicates
+from .exports import EXPORT_HEADERS, XLSX_CONTENT_TYPE
+from .facets import refresh_facets
+from .fast_serializers import (
+    annotate_real_prices, serialize_service_price_rows, serialize_service_rows, service_price_rows, service_rows,
+)
+from .import_reports import ImportReport, cleanup_import_reports, read_import_report
+from .linkage import find_ambiguous_matches
+from .matching import HeaderMatcher
+from .partitioned_import import PartitionedServicePriceImport
+from .renderers import FastJSONRenderer
+from .serializers import ServicePriceSerializer, ServiceSerializer
+from .signals import catalog_changed
+from .staging import StagedServicePriceImport
+from .models import OTP, CatalogChange, PriceFacet, Service, ServiceCategory, ServicePrice
+
+# The replica routing tests need a second alias, e.g. 'TEST': {'MIRROR': 'default'}
+HAS_REPLICA = 'replica' in settings.DATABASES
+
+
+def explain(sql, params=()):
+    """The query plan of a statement as text."""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Test tables are tiny; make the planner show the index it would use at scale
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute(f'EXPLAIN {sql}', params)
+        else:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, CATALOG_READ_REPLICAS=[])
+class CatalogIndexTests(TestCase):
+    """The catalog views' Service/ServiceCategory queries are served by their indexes, in index order."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.categories = [
+            ServiceCategory.objects.create(name=f'Car Wash {i}', slug=f'wash-{i}', is_active=i % 5 != 0)
+            for i in range(20)
+        ]
+        Service.objects.bulk_create([
+            Service(
+                category=cls.categories[i % 20], header=f'Service {i}', details='a, b',
+                is_featured=i % 7 == 0, is_active=i % 3 != 0,
+            )
+            for i in range(400)
+        ])
+
+    def assertViewUsesIndex(self, url, table, index_name, ordered=True, match=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        statements = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql'] and match in query['sql']
+        ]
+        self.assertTrue(statements, f'no {table} query for {url}')
+        for sql in statements:
+            plan = explain(sql)
+            self.assertIn(index_name, plan, f'{sql}\n{plan}')
+            if ordered:
+                self.assertIsNone(re.search(r'TEMP B-TREE|\bSort\b', plan), f'{sql}\n{plan}')
+
+    def test_services_by_category(self):
+        self.assertViewUsesIndex(
+            reverse('services-by-category', args=['wash-1']), 'myapp_service', 'service_category_active_idx'
+        )
+
+    def test_category_by_name(self):
+        self.assertViewUsesIndex(
+            reverse('services-by-category', args=['car-wash-1']), 'myapp_servicecategory',
+            'servicecategory_name_upper_idx', ordered=False, match='UPPER'
+        )
+
+    def test_all_services(self):
+        self.assertViewUsesIndex(reverse('all-services'), 'myapp_service', 'service_active_idx')
+
+    def test_featured_services(self):
+        self.assertViewUsesIndex(reverse('all-services') + '?featured=true', 'myapp_service', 'service_active_idx')
+
+    def test_services_of_category(self):
+        self.assertViewUsesIndex(
+            reverse('all-services') + f'?category_id={self.categories[1].pk}',
+            'myapp_service', 'service_category_active_idx'
+        )
+
+
+def price_sheet(rows, name='prices.xlsx'):
+    """An uploaded workbook with one sheet per ``{sheet name: rows}`` entry (or one sheet of rows)."""
+    import pandas as pd
+
+    sheets = rows if isinstance(rows, dict) else {'Prices': rows}
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+        for sheet_name, sheet_rows in sheets.items():
+            pd.DataFrame(sheet_rows, columns=[
+                'Brand', 'Model', 'Type', 'Product Name', 'Before Price', 'After Price', 'Discount Price'
+            ]).to_excel(writer, sheet_name=sheet_name, index=False)
+    return SimpleUploadedFile(
+        name, buffer.getvalue(),
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class StagedImportTests(TestCase):
+    def setUp(self):
+        self.oil = ServicePrice.objects.create(
+            brand='Toyota', model='Innova', type='Service', product_name='Oil Change',
+            before_price=100, after_price=90,
+        )
+        self.wash = ServicePrice.objects.create(
+            brand='Toyota', model='Innova', type='Service', product_name='Wash',
+            before_price=50, after_price=40,
+        )
+        self.rows = [
+            # Matched trimmed and case-insensitively: changed price
+            [' toyota ', 'INNOVA', 'service', 'oil change', 100, 80, None],
+            ['Toyota', 'Innova', 'Service', 'Wash', 50, 40, None],
+            ['Toyota', 'Innova', 'Service', 'Brake Pads', 300, 250, 240],
+        ]
+
+    def import_sheet(self, rows, dry_run):
+        return self.client.post(reverse('service-prices-import'), {
+            'file': price_sheet(rows), 'import_strategy': 'staged', 'dry_run': 'true' if dry_run else 'false',
+        })
+
+    def snapshot(self):
+        return list(ServicePrice.objects.order_by('id').values_list(
+            'brand', 'model', 'type', 'product_name', 'before_price', 'after_price', 'discounted_price',
+            'is_active', 'updated_at',
+        ))
+
+    def test_import_merges_diff(self):
+        response = self.import_sheet(self.rows, dry_run=False)
+        self.assertEqual(response.status_code, 200, response.json())
+        data = response.json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual((data['totals']['new'], data['totals']['update'], data['totals']['skip']), (1, 1, 1))
+        self.assertEqual(data['totals']['invalid'], 0)
+
+        oil = ServicePrice.objects.get(pk=self.oil.pk)
+        wash = ServicePrice.objects.get(pk=self.wash.pk)
+        self.assertEqual(oil.after_price, Decimal('80.00'))
+        # The key keeps its stored spelling
+        self.assertEqual((oil.brand, oil.product_name), ('Toyota', 'Oil Change'))
+        self.assertGreater(oil.updated_at, self.oil.updated_at)
+        self.assertEqual(wash.updated_at, self.wash.updated_at)
+        brakes = ServicePrice.objects.get(product_name='Brake Pads')
+        self.assertEqual(
+            (brakes.before_price, brakes.after_price, brakes.discounted_price, brakes.is_active),
+            (Decimal('300.00'), Decimal('250.00'), Decimal('240.00'), True)
+        )
+        self.assertEqual(ServicePrice.objects.count(), 3)
+
+    def test_dry_run_leaves_prices_untouched(self):
+        before = self.snapshot()
+        response = self.import_sheet(self.rows, dry_run=True)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['dry_run'])
+        self.assertEqual((data['totals']['new'], data['totals']['update'], data['totals']['skip']), (1, 1, 1))
+        self.assertEqual(self.snapshot(), before)
+
+    def test_invalid_rows_block_the_merge(self):
+        before = self.snapshot()
+        response = self.import_sheet(self.rows + [['Toyota', 'Innova', 'Service', 'Tyres', 100, 'abc', None]], dry_run=False)
+        self.assertEqual(response.status_code, 400)
+        data = response.json()
+        self.assertEqual(data['status'], 'error')
+        self.assertEqual(data['totals']['invalid'], 1)
+        self.assertEqual(data['errors'][0]['row'], 4)
+        self.assertEqual((data['totals']['new'], data['totals']['update'], data['totals']['skip']), (1, 1, 1))
+        self.assertEqual(self.snapshot(), before)
+
+    def test_linking_and_facets_wait_for_the_commit(self):
+        service = Service.objects.create(
+            category=ServiceCategory.objects.create(name='Brakes', slug='brakes'), header='Brake Pads', details='a, b'
+        )
+        records = [dict(zip(
+            ['Brand', 'Model', 'Type', 'Product Name', 'Before Price', 'After Price', 'Discount Price'], row
+        )) for row in self.rows]
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            data = StagedServicePriceImport().run(records, dry_run=False)
+        self.assertEqual((data['totals']['new'], data['totals']['update'], data['totals']['skip']), (1, 1, 1))
+        # Merged, but not linked or counted in the facets yet
+        brakes = ServicePrice.objects.get(product_name='Brake Pads')
+        self.assertFalse(brakes.matched_services.exists())
+        self.assertEqual(PriceFacet.objects.get(brand='Toyota', model='Innova').price_count, 2)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(list(brakes.matched_services.all()), [service])
+        self.assertEqual(PriceFacet.objects.get(brand='Toyota', model='Innova').price_count, 3)
+
+    def test_diff_uses_normalized_key_index(self):
+        importer = StagedServicePriceImport()
+        anti_join = (
+            f"SELECT st.id FROM {importer.staging_table} st WHERE st.batch_id = %s AND NOT EXISTS ("
+            f"SELECT 1 FROM {importer.live_table} sp WHERE {importer._key_match('sp', 'st')})"
+        )
+        join = (
+            f"SELECT st.id, sp.id FROM {importer.staging_table} st "
+            f"JOIN {importer.live_table} sp ON {importer._key_match('sp', 'st')} WHERE st.batch_id = %s"
+        )
+        for sql in (anti_join, join):
+            plan = explain(sql, [importer.batch_id])
+            self.assertIn('serviceprice_norm_key_idx', plan, f'{sql}\n{plan}')
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class PartitionedImportTests(TestCase):
+    sheets = {
+        'Toyota': [['Toyota', 'Innova', 'Service', 'Oil Change', 100, 90, None]],
+        'Honda': [['Honda', 'City', 'Service', 'Oil Change', 80, 70, None]],
+        'Suzuki': [['Suzuki', 'Swift', 'Service', 'Oil Change', 60, 50, None]],
+    }
+
+    def import_workbook(self, sheets, dry_run=False):
+        return self.client.post(reverse('service-prices-import'), {
+            'file': price_sheet(sheets), 'import_strategy': 'partitioned', 'dry_run': 'true' if dry_run else 'false',
+        })
+
+    def test_import_writes_every_brand(self):
+        response = self.import_workbook(self.sheets)
+        self.assertEqual(response.status_code, 200, response.json())
+        self.assertEqual(response.json()['totals']['new'], 3)
+        self.assertEqual(
+            [partition['write_status']['status'] for partition in response.json()['partitions']],
+            ['committed'] * 3
+        )
+        self.assertEqual(ServicePrice.objects.count(), 3)
+
+    def test_bad_row_blocks_every_sheet(self):
+        sheets = dict(self.sheets, Honda=self.sheets['Honda'] + [['Honda', 'City', 'Service', 'Wash', 'abc', 70, None]])
+        response = self.import_workbook(sheets)
+        self.assertEqual(response.status_code, 400)
+        data = response.json()
+        self.assertEqual(data['status'], 'error')
+        self.assertEqual(data['totals']['invalid'], 1)
+        self.assertEqual(data['errors'][0]['sheet'], 'Honda')
+        self.assertEqual(data['totals']['new'], 3)
+        self.assertFalse(ServicePrice.objects.exists())
+
+    def test_failed_partition_reports_write_status(self):
+        write_partition = PartitionedServicePriceImport._write_partition
+
+        def fail_honda(importer, plan):
+            if plan['brand_key'] == 'honda':
+                raise RuntimeError('connection lost')
+            return write_partition(importer, plan)
+
+        with mock.patch.object(PartitionedServicePriceImport, '_write_partition', autospec=True, side_effect=fail_honda):
+            response = self.import_workbook(self.sheets)
+        self.assertEqual(response.status_code, 500)
+        data = response.json()
+        self.assertTrue(data['write_failed'])
+        self.assertEqual(
+            {partition['brand']: partition['write_status']['status'] for partition in data['partitions']},
+            {'toyota': 'committed', 'honda': 'failed', 'suzuki': 'not_written'}
+        )
+        self.assertIn('connection lost', data['message'])
+        self.assertEqual(list(ServicePrice.objects.values_list('brand', flat=True)), ['Toyota'])
+
+
+class DuplicateCollapseTests(TestCase):
+    rows = [
+        {'Brand': 'Toyota', 'Model': 'Innova', 'Type': 'Service', 'Product Name': 'Oil Change', 'After Price': 90},
+        {'Brand': 'Honda', 'Model': 'City', 'Type': 'Service', 'Product Name': 'Oil Change', 'After Price': 70},
+        # Same key as row 1 once trimmed and lower-cased
+        {'Brand': ' toyota', 'Model': 'INNOVA', 'Type': 'service', 'Product Name': 'Oil Change ', 'After Price': 80},
+        {'Brand': 'Toyota', 'Model': 'Innova', 'Type': 'Service', 'Product Name': 'Oil Change', 'After Price': 70},
+        # No brand: left for validation, never collapsed
+        {'Brand': None, 'Model': 'Innova', 'Type': 'Service', 'Product Name': 'Oil Change', 'After Price': 60},
+        {'Brand': None, 'Model': 'Innova', 'Type': 'Service', 'Product Name': 'Oil Change', 'After Price': 50},
+    ]
+
+    def test_last_occurrence_wins(self):
+        records, refs, collapsed = collapse_duplicates(self.rows, 'last')
+        self.assertEqual(refs, [2, 4, 5, 6])
+        self.assertEqual([row['After Price'] for row in records], [70, 70, 60, 50])
+        self.assertEqual([(entry['row'], entry['kept_row']) for entry in collapsed], [(1, 4), (3, 4)])
+
+    def test_first_occurrence_wins(self):
+        records, refs, collapsed = collapse_duplicates(self.rows, 'first', refs=['a', 'b', 'c', 'd', 'e', 'f'])
+        self.assertEqual(refs, ['a', 'b', 'e', 'f'])
+        self.assertEqual([row['After Price'] for row in records], [90, 70, 60, 50])
+        self.assertEqual([(entry['row'], entry['kept_row']) for entry in collapsed], [('c', 'a'), ('d', 'a')])
+        self.assertEqual(collapsed[0]['brand'], 'toyota')
+
+    def test_error_policy_rejects_repeats(self):
+        with self.assertRaises(DuplicateKeyError) as raised:
+            collapse_duplicates(self.rows, 'error')
+        self.assertEqual([(entry['row'], entry['kept_row']) for entry in raised.exception.duplicates], [(3, 1), (4, 1)])
+
+        records, refs, collapsed = collapse_duplicates(self.rows[:2], 'error')
+        self.assertEqual((refs, collapsed), ([1, 2], []))
+
+    def test_unknown_policy(self):
+        with self.assertRaises(ValueError):
+            collapse_duplicates(self.rows, 'newest')
+
+    @override_settings(IMPORT_DUPLICATE_POLICY='first')
+    def test_default_policy_setting(self):
+        _, refs, _ = collapse_duplicates(self.rows)
+        self.assertEqual(refs, [1, 2, 5, 6])
+
+    @override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+    def test_import_with_error_policy(self):
+        response = self.client.post(reverse('service-prices-import'), {
+            'file': price_sheet([
+                ['Toyota', 'Innova', 'Service', 'Oil Change', 100, 90, None],
+                ['Toyota', 'Innova', 'Service', 'oil change', 100, 80, None],
+            ]),
+            'dry_run': 'false', 'duplicate_policy': 'error',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'row': 2, 'errors': ['Duplicate of row 1']}])
+        self.assertFalse(ServicePrice.objects.exists())
+
+    @override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+    def test_errors_name_sheet_rows_after_collapsing(self):
+        sheet = [
+            ['Toyota', 'Innova', 'Service', 'Oil Change', 100, 90, None],
+            ['Toyota', 'Innova', 'Service', 'oil change', 100, 80, None],
+            ['Toyota', 'Innova', 'Service', 'Wash', 'abc', 40, None],
+        ]
+        for strategy in ('smart', 'standard', 'staged'):
+            with self.subTest(strategy=strategy):
+                response = self.client.post(reverse('service-prices-import'), {
+                    'file': price_sheet(sheet), 'import_strategy': strategy,
+                    'use_mapping': 'false', 'dry_run': 'true',
+                })
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual([error['row'] for error in response.json()['errors']], [3])
+
+
+class HeaderMatcherTests(TestCase):
+    def test_finds_every_pattern_in_one_pass(self):
+        matcher = HeaderMatcher(['he', 'She', 'his', 'hers', '', 'SHE'])
+        self.assertEqual(len(matcher), 4)
+        self.assertEqual(matcher.find('USHERS'), {'she', 'he', 'hers'})
+        self.assertEqual(matcher.find('this'), {'his'})
+        self.assertEqual(matcher.find('xyz'), set())
+
+    def test_overlapping_headers(self):
+        matcher = HeaderMatcher(['Car Wash', 'Wash', 'Foam Wash', 'Wax'])
+        self.assertEqual(matcher.find('Premium Foam Car Wash'), {'car wash', 'wash'})
+        self.assertEqual(matcher.find('Foam Wash + Wax'), {'foam wash', 'wash', 'wax'})
+
+    def test_matches_like_icontains(self):
+        headers = ['Oil Change', 'AC Service', 'Brake Pads', 'Pad', 'Change']
+        product_names = ['Engine OIL CHANGE', 'Front brake pads', 'AC service & gas', 'Wiper Blades', 'Change Oil']
+        matcher = HeaderMatcher(headers)
+        for product_name in product_names:
+            self.assertEqual(
+                matcher.find(product_name),
+                {header.lower() for header in headers if header.lower() in product_name.lower()},
+            )
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class ServiceLinkageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ServiceCategory.objects.create(name='Car Wash', slug='car-wash')
+        cls.prices = {
+            (brand, model, product_name): ServicePrice.objects.create(
+                brand=brand, model=model, type='Service', product_name=product_name,
+                before_price=Decimal('1000'), after_price=Decimal(after),
+            )
+            for brand, model, product_name, after in (
+                ('Toyota', 'Innova', 'Foam Wash', '800'),
+                ('Toyota', 'Innova', 'Premium FOAM WASH', '900'),
+                ('Toyota', 'Innova', 'Interior Clean', '500'),
+                ('Honda', 'City', 'Foam Wash', '700'),
+            )
+        }
+
+    def linked(self, service):
+        return sorted(service.matched_prices.values_list('product_name', 'brand'))
+
+    def test_link_service_reads_only_matching_prices(self):
+        with CaptureQueriesContext(connection) as queries:
+            service = Service.objects.create(category=self.category, header='Foam Wash', details='a, b')
+        self.assertEqual(self.linked(service), [
+            ('Foam Wash', 'Honda'), ('Foam Wash', 'Toyota'), ('Premium FOAM WASH', 'Toyota'),
+        ])
+        price_reads = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and 'FROM "myapp_serviceprice"' in query['sql']
+        ]
+        # The prices containing the header, and the service's current links; never a full scan
+        self.assertTrue(price_reads)
+        self.assertTrue(all(' WHERE ' in sql for sql in price_reads), price_reads)
+        self.assertTrue(any(' LIKE ' in sql for sql in price_reads), price_reads)
+
+        # Renamed: relinked to the prices with the new header only
+        service.header = 'Interior'
+        service.save()
+        self.assertEqual(self.linked(service), [('Interior Clean', 'Toyota')])
+
+        service.header = ''
+        service.save()
+        self.assertEqual(self.linked(service), [])
+
+    def test_unchanged_header_is_not_relinked(self):
+        service = Service.objects.create(category=self.category, header='Foam Wash', details='a, b')
+        service = Service.objects.get(pk=service.pk)
+        service.is_featured = True
+        with CaptureQueriesContext(connection) as queries:
+            service.save()
+        self.assertFalse([
+            query for query in queries.captured_queries if 'myapp_serviceprice' in query['sql']
+        ])
+        self.assertEqual(len(self.linked(service)), 3)
+
+    def test_ambiguous_matches_are_reported(self):
+        Service.objects.create(category=self.category, header='Foam Wash', details='a, b')
+        Service.objects.create(category=self.category, header='Interior Clean', details='a, b')
+
+        ambiguous = find_ambiguous_matches()
+        self.assertEqual(ambiguous['count'], 1)
+        self.assertEqual(len(ambiguous['sample']), 1)
+        sample = ambiguous['sample'][0]
+        self.assertEqual((sample['service'], sample['brand'], sample['model']), ('Foam Wash', 'toyota', 'innova'))
+        self.assertEqual(sorted(sample['candidates']), ['Foam Wash', 'Premium FOAM WASH'])
+        self.assertIn(sample['chosen'], sample['candidates'])
+
+        self.assertEqual(find_ambiguous_matches({'honda'})['count'], 0)
+        self.prices['Toyota', 'Innova', 'Premium FOAM WASH'].is_active = False
+        self.prices['Toyota', 'Innova', 'Premium FOAM WASH'].save()
+        self.assertEqual(find_ambiguous_matches()['count'], 0)
+
+
+def without_report_ids(data):
+    """Response data without the (random) import report ids."""
+    if isinstance(data, dict):
+        return {key: without_report_ids(value) for key, value in data.items() if key != 'report_id'}
+    if isinstance(data, list):
+        return [without_report_ids(value) for value in data]
+    return data
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class ImportWorkerTests(TestCase):
+    def setUp(self):
+        # bulk_create: no catalog change is pending before the import
+        ServicePrice.objects.bulk_create([ServicePrice(
+            brand='Toyota', model='Innova', type='Service', product_name='Oil Change',
+            before_price=100, after_price=90,
+        )])
+        self.rows = [
+            ['Toyota', 'Innova', 'Service', 'Oil Change', 100, 80, 75],
+            ['Toyota', 'Innova', 'Service', 'Wash', 50, 40, 40],
+            ['Toyota', 'Innova', 'Service', 'Wash', 50, 45, 45],
+            ['Honda', 'City', 'Service', 'Tyres', 100, 'abc', 90],
+        ]
+
+    def in_request(self, options):
+        response = self.client.post(reverse('service-prices-import'), {
+            'file': price_sheet(self.rows),
+            **{name: str(value).lower() for name, value in options.items()},
+        })
+        return response.json(), response.status_code
+
+    def in_worker(self, options):
+        upload = price_sheet(self.rows)
+        options = {'deactivate_missing': False, 'duplicate_policy': 'last', **options}
+        # The worker closes its connection after each import; keep the test transaction's
+        with mock.patch.object(connection, 'close') as close:
+            result = import_worker.process_excel_upload(upload.name, upload.read(), options)
+        close.assert_called_once_with()
+        return result
+
+    def test_worker_matches_the_request(self):
+        for strategy in ('smart', 'standard', 'staged', 'partitioned'):
+            options = {'dry_run': True, 'use_mapping': False, 'import_strategy': strategy}
+            data, status_code = self.in_request(options)
+            self.assertEqual(
+                (without_report_ids(data), status_code),
+                tuple(map(without_report_ids, self.in_worker(options))), strategy
+            )
+
+    def test_worker_import_is_one_catalog_change(self):
+        self.rows.pop()
+        with self.captureOnCommitCallbacks() as callbacks:
+            data, status_code = self.in_worker({'dry_run': False, 'use_mapping': False, 'import_strategy': 'smart'})
+        self.assertEqual((data['status'], status_code), ('success', 200))
+        self.assertEqual(
+            sorted(ServicePrice.objects.values_list('product_name', 'after_price')),
+            [('Oil Change', Decimal('80.00')), ('Wash', Decimal('45.00'))]
+        )
+        changes = [callback for callback in callbacks if getattr(callback, 'catalog_change', False)]
+        self.assertEqual(len(changes), 1)
+        with mock.patch.object(catalog_changed, 'send') as send:
+            changes[0]()
+        send.assert_called_once_with(sender=ServicePrice, source='import')
+
+
+class WorkerStartupTests(SimpleTestCase):
+    def test_api_only_worker_skips_the_import_libraries(self):
+        # A fresh interpreter: this one has loaded them already
+        script = textwrap.dedent("""
+            import sys
+            from django.conf import settings
+            settings.SERVICE_PRICE_ADMIN_IMPORT_EXPORT = False
+            settings.INSTALLED_APPS = [app for app in settings.INSTALLED_APPS if app != 'import_export']
+            import django
+            django.setup()
+            import api.urls
+            print(' '.join(sorted(
+                name for name in ('import_export', 'pandas', 'tablib', 'twilio') if name in sys.modules
+            )))
+        """)
+        result = subprocess.run(
+            [sys.executable, '-c', script], capture_output=True, text=True, timeout=120,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'api.settings')},
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), '')
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class ImportReportTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.report_dir = directory.name
+        settings_override = override_settings(IMPORT_REPORT_DIR=self.report_dir, IMPORT_REPORT_TTL=3600)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_report(self):
+        report = ImportReport()
+        report.add('new', {'brand': 'Toyota'})
+        report.close()
+        return report.report_id
+
+    def age_report(self, report_id, seconds):
+        then = time.time() - seconds
+        for name in (f'{report_id}.jsonl', f'{report_id}.meta.json'):
+            os.utime(os.path.join(self.report_dir, name), (then, then))
+
+    def test_expired_reports_are_deleted_on_write(self):
+        old_report = self.write_report()
+        recent_report = self.write_report()
+        self.age_report(old_report, 7200)
+        self.age_report(recent_report, 60)
+
+        new_report = self.write_report()
+        with self.assertRaises(FileNotFoundError):
+            read_import_report(old_report)
+        for report_id in (recent_report, new_report):
+            self.assertEqual(read_import_report(report_id)['counts']['new'], 1)
+
+        with override_settings(IMPORT_REPORT_TTL=None):
+            self.assertEqual(cleanup_import_reports(), 0)
+        self.assertEqual(cleanup_import_reports(max_age=30), 1)
+        self.assertEqual(sorted(os.listdir(self.report_dir)), [f'{new_report}.jsonl', f'{new_report}.meta.json'])
+
+    def test_admin_import_closes_the_report(self):
+        from import_export.formats.base_formats import XLSX
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        model_admin = admin.site._registry[ServicePrice]
+        # Dry run with the smart resource; the admin never asks for the import summary
+        response = self.client.post(reverse('admin:myapp_serviceprice_import'), {
+            'resource': 0,
+            'format': model_admin.get_import_formats().index(XLSX),
+            'import_file': price_sheet([['Toyota', 'Innova', 'Service', 'Oil Change', 100, 90, None]]),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['result'].has_errors())
+
+        # Closed: the metadata is written, so the report can be read
+        reports = [
+            read_import_report(name[:-len('.meta.json')])
+            for name in os.listdir(self.report_dir) if name.endswith('.meta.json')
+        ]
+        self.assertEqual([report['counts']['new'] for report in reports], [1])
+
+    def test_report_view_pages(self):
+        report = ImportReport()
+        for row in range(1, 8):
+            report.add('error' if row % 3 == 0 else 'new', {'row': row, 'product_name': f'"kind": "error" {row}'})
+        report.close()
+        url = reverse('service-prices-import-report', args=[report.report_id])
+
+        def rows(**params):
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            return [result['row'] for result in data['results']], data['has_next']
+
+        self.assertEqual(rows(), ([1, 2, 3, 4, 5, 6, 7], False))
+        self.assertEqual(rows(page_size=3), ([1, 2, 3], True))
+        self.assertEqual(rows(page=3, page_size=3), ([7], False))
+        self.assertEqual(rows(page=4, page_size=3), ([], False))
+        self.assertEqual(rows(kind='error'), ([3, 6], False))
+        self.assertEqual(rows(kind='new', page=2, page_size=2), ([4, 5], True))
+        # Out-of-range values are clamped
+        self.assertEqual(rows(page=0, page_size=0), ([1], True))
+        response = self.client.get(url, {'page_size': 10 ** 6})
+        self.assertEqual(response.json()['page_size'], 500)
+
+        for params in ({'page': 'x'}, {'page_size': '1.5'}, {'kind': 'collapsed'}):
+            self.assertEqual(self.client.get(url, params).status_code, 400, params)
+        self.assertEqual(self.client.get(reverse('service-prices-import-report', args=['x' * 32])).status_code, 400)
+        missing = reverse('service-prices-import-report', args=['0' * 32])
+        self.assertEqual(self.client.get(missing).status_code, 404)
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class ServicePriceAdminActionTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.prices = [
+            ServicePrice.objects.create(
+                brand='Toyota', model=f'Model {i}', type='Service', product_name='Oil Change',
+                before_price=100, after_price=90,
+            )
+            for i in range(3)
+        ]
+        CatalogChange.objects.all().delete()
+
+    def run_action(self, action, query=''):
+        return self.client.post(reverse('admin:myapp_serviceprice_changelist') + query, {
+            'action': action, '_selected_action': [price.pk for price in self.prices[:2]],
+        })
+
+    def test_deactivate_from_filtered_changelist_records_changes(self):
+        # The changelist is filtered to active rows, which the update makes inactive
+        response = self.run_action('deactivate_selected', '?is_active__exact=1')
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(ServicePrice.objects.filter(is_active=False).count(), 2)
+        self.assertEqual(
+            sorted(CatalogChange.objects.filter(entity='price').values_list('object_id', 'action')),
+            sorted((price.pk, 'deactivate') for price in self.prices[:2])
+        )
+        self.assertEqual(list(PriceFacet.objects.values_list('model', flat=True)), ['Model 2'])
+
+    def test_activate_from_filtered_changelist_records_changes(self):
+        ServicePrice.objects.update(is_active=False)
+        response = self.run_action('activate_selected', '?is_active__exact=0')
+        self.assertEqual(response.status_code, 302)
+
+        self.assertEqual(
+            sorted(CatalogChange.objects.filter(entity='price').values_list('object_id', 'action')),
+            sorted((price.pk, 'upsert') for price in self.prices[:2])
+        )
+        self.assertEqual(sorted(PriceFacet.objects.values_list('model', flat=True)), ['Model 0', 'Model 1'])
+
+    def test_filters_list_brands_without_active_prices(self):
+        ServicePrice.objects.create(
+            brand='Honda', model='City', type='Service', product_name='Oil Change',
+            before_price=100, after_price=90, is_active=False,
+        )
+        response = self.client.get(reverse('admin:myapp_serviceprice_changelist'))
+        choices = {
+            spec.title: [choice['display'] for choice in spec.choices(response.context['cl'])]
+            for spec in response.context['cl'].filter_specs
+        }
+        self.assertIn('Honda', choices['brand'])
+        self.assertIn('City', choices['model'])
+
+        response = self.client.get(reverse('admin:myapp_serviceprice_changelist') + '?brand=Honda')
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_export_selected_csv(self):
+        response = self.run_action('export_selected_csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(read_csv_export(response), [
+            ['Toyota', 'Model 0', 'Service', 'Oil Change', '100.00', '90.00', '', ''],
+            ['Toyota', 'Model 1', 'Service', 'Oil Change', '100.00', '90.00', '', ''],
+        ])
+
+    def test_export_selected_xlsx(self):
+        response = self.run_action('export_selected_xlsx')
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        self.assertEqual(
+            [row[:2] for row in read_xlsx_export(response)], [('Toyota', 'Model 0'), ('Toyota', 'Model 1')]
+        )
+
+
+@override_settings(
+    CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False, SERVICE_PRICE_ADMIN_FAST_MODE=True,
+    SERVICE_PRICE_ADMIN_EXACT_COUNT_LIMIT=100,
+)
+class ServicePriceAdminFastModeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        for brand, model, service_type, after_price in (
+            ('Toyota', 'Innova', 'SUV', 90),
+            ('Toyota', 'Innova', 'Sedan', 50),
+            ('Toyota', 'Corolla', 'SUV', 75),
+            ('Honda', 'City', 'SUV', 100),
+        ):
+            ServicePrice.objects.create(
+                brand=brand, model=model, type=service_type, product_name=f'Wash {after_price}',
+                before_price=100, after_price=after_price,
+            )
+
+    def setUp(self):
+        self.client.force_login(self.admin_user)
+        cache.delete(TypeInputFilter.cache_key)
+
+    def changelist(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:myapp_serviceprice_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries.captured_queries]
+
+    def products(self, response):
+        return [price.product_name for price in response.context['cl'].result_list]
+
+    def test_page_renders_text_box_filters(self):
+        response, _ = self.changelist()
+        self.assertEqual(response.context['cl'].result_count, 4)
+        self.assertIn('discount', response.context['cl'].list_display)
+        self.assertContains(response, '<datalist id="brand-suggestions">')
+        self.assertContains(response, '<option value="Honda">')
+        # Models are only suggested for the selected brand
+        self.assertNotContains(response, '<option value="Innova">')
+        self.assertContains(self.client.get(
+            reverse('admin:myapp_serviceprice_changelist'), {'brand': 'Toyota'}
+        ), '<option value="Innova">')
+
+    def test_typed_filters_apply(self):
+        response, _ = self.changelist(brand='Toyota', model='Innova', type='SUV')
+        self.assertEqual(self.products(response), ['Wash 90'])
+        response, _ = self.changelist(brand='Toyota', type='SUV')
+        self.assertEqual(sorted(self.products(response)), ['Wash 75', 'Wash 90'])
+        self.assertContains(response, '<input type="hidden" name="type" value="SUV">')
+
+    def test_only_the_bounded_count_runs(self):
+        _, queries = self.changelist(brand='Toyota')
+        counts = [sql for sql in queries if 'COUNT(' in sql]
+        self.assertEqual(len(counts), 1, counts)
+        self.assertIn('LIMIT 101', counts[0])
+        self.assertIn('"brand" = ', counts[0])
+
+    def test_discount_column_sorts_by_discount_pct(self):
+        response, _ = self.changelist()
+        column = response.context['cl'].list_display.index('discount')
+        response, queries = self.changelist(o=f'-{column}')
+        self.assertEqual(self.products(response), ['Wash 50', 'Wash 75', 'Wash 90', 'Wash 100'])
+        self.assertTrue(any('ORDER BY "myapp_serviceprice"."discount_pct" DESC' in sql for sql in queries))
+
+
+def read_csv_export(response):
+    """The data rows of a CSV export response, after checking its header row."""
+    rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+    assert rows[0] == EXPORT_HEADERS, rows[0]
+    return rows[1:]
+
+
+def read_xlsx_export(response):
+    """The data rows of an XLSX export response, after checking its header row."""
+    from openpyxl import load_workbook
+
+    sheet = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)['Service Prices']
+    rows = list(sheet.iter_rows(values_only=True))
+    assert list(rows[0]) == EXPORT_HEADERS, rows[0]
+    return rows[1:]
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class ServicePriceExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        ServicePrice.objects.create(
+            brand='Toyota', model='Innova', type='SUV', product_name='Foam Wash',
+            before_price=Decimal('1000'), after_price=Decimal('800'), discounted_price=Decimal('750'),
+            link='https://example.com/foam',
+        )
+        ServicePrice.objects.create(
+            brand='Honda', model='City', type='Sedan', product_name='Oil Change',
+            before_price=Decimal('500'), after_price=Decimal('450'),
+        )
+        ServicePrice.objects.create(
+            brand='Toyota', model='Corolla', type='Sedan', product_name='Oil Change',
+            before_price=Decimal('500'), after_price=Decimal('400'), is_active=False,
+        )
+
+    def export(self, **params):
+        return self.client.get(reverse('service-prices-export'), params)
+
+    def test_csv_export_of_active_prices(self):
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="service_prices_', response['Content-Disposition'])
+        self.assertEqual(sorted(read_csv_export(response)), [
+            ['Honda', 'City', 'Sedan', 'Oil Change', '500.00', '450.00', '', ''],
+            ['Toyota', 'Innova', 'SUV', 'Foam Wash', '1000.00', '800.00', '750.00', 'https://example.com/foam'],
+        ])
+
+    def test_filters_are_applied(self):
+        self.assertEqual([row[1] for row in read_csv_export(self.export(brand='toyota'))], ['Innova'])
+        self.assertEqual([row[1] for row in read_csv_export(self.export(type='sedan'))], ['City'])
+        self.assertEqual([row[1] for row in read_csv_export(self.export(search='foam', chunk_size='x'))], ['Innova'])
+
+    def test_xlsx_export(self):
+        response = self.export(file_format='XLSX', brand='Toyota')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        self.assertEqual(read_xlsx_export(response), [
+            ('Toyota', 'Innova', 'SUV', 'Foam Wash', 1000, 800, 750, 'https://example.com/foam'),
+        ])
+
+    def test_invalid_file_format(self):
+        response = self.export(file_format='pdf')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['status'], 'error')
+
+
+@skipUnless(HAS_REPLICA, "needs a 'replica' database")
+@override_settings(
+    DATABASE_ROUTERS=['myapp.replicas.ReadReplicaRouter'],
+    MIDDLEWARE=[*settings.MIDDLEWARE, 'myapp.replicas.PrimaryAfterWriteMiddleware'],
+    CATALOG_READ_REPLICAS=['replica'],
+    CATALOG_PAYLOAD_STORE_ENABLED=False,
+)
+class ReadReplicaRoutingTests(TransactionTestCase):
+    # Committed rows, so the replica connection (a mirror of default) sees them
+    databases = {'default', 'replica'} if HAS_REPLICA else {'default'}
+
+    def setUp(self):
+        replicas._health.clear()
+        self.category = ServiceCategory.objects.create(name='Car Wash', slug='car-wash')
+        self.service = Service.objects.create(category=self.category, header='Wash', details='a, b')
+
+    def get_queries(self, url):
+        """(primary, replica) query counts of a GET request."""
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        return len(primary), len(replica)
+
+    def test_catalog_reads_use_replica(self):
+        for url in [
+            reverse('service-categories'), reverse('services-by-category', args=['car-wash']),
+            reverse('all-services'), reverse('service-prices-list'),
+        ]:
+            primary, replica = self.get_queries(url)
+            self.assertEqual(primary, 0, url)
+            self.assertGreater(replica, 0, url)
+
+    def test_client_reads_primary_after_write(self):
+        response = self.client.post(
+            reverse('services-price-quote'), {'items': [{'service_id': self.service.pk}]},
+            content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        primary, replica = self.get_queries(reverse('service-categories'))
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+    def test_lagging_replica_falls_back_to_primary(self):
+        with mock.patch.object(replicas, 'measure_lag', return_value=60.0):
+            primary, replica = self.get_queries(reverse('service-categories'))
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+    def test_writes_in_request_read_from_primary(self):
+        with replicas.replica_reads() as alias:
+            self.assertEqual(alias, 'replica')
+            self.assertEqual(ServiceCategory.objects.all().db, 'replica')
+            ServiceCategory.objects.create(name='Tyres', slug='tyres')
+            self.assertEqual(ServiceCategory.objects.all().db, 'default')
+
+
+@override_settings(SMS_BACKEND='myapp.sms.LocMemBackend')
+class OTPSignInTests(TestCase):
+    def setUp(self):
+        sms.outbox.clear()
+
+    def test_sign_in_with_sms_backend(self):
+        response = self.client.post(reverse('request_otp'), {'phone_number': '+15550000001'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(sms.outbox), 1)
+        message = sms.outbox[0]
+        self.assertEqual(message['to'], '+15550000001')
+        code = re.search(r'code is: (\d+)', message['body']).group(1)
+
+        response = self.client.post(reverse('verify_otp'), {'phone_number': '+15550000001', 'otp_code': code})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['is_new_user'])
+        self.assertTrue(response.json()['access'])
+
+    def test_failed_send_allows_retry(self):
+        with mock.patch.object(sms.LocMemBackend, 'send', side_effect=OSError('provider down')):
+            response = self.client.post(reverse('request_otp'), {'phone_number': '+15550000001'})
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(OTP.objects.filter(phone_number='+15550000001').exists())
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        authentication.get_cache().clear()
+        self.user = User.objects.create_user('driver', password='secret')
+
+    def authenticate(self, user=None):
+        token = RefreshToken.for_user(user or self.user).access_token
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CachedJWTAuthentication().authenticate(request)[0]
+
+    def test_cached_user_needs_no_query(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.authenticate().pk, self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.authenticate()
+        self.assertEqual((user.pk, user.username, user.is_active), (self.user.pk, 'driver', True))
+
+    def test_deactivated_user_is_rejected_on_the_next_request(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate()
+        self.assertEqual(raised.exception.get_codes(), 'user_inactive')
+
+    def test_deleted_user_is_rejected(self):
+        self.authenticate()
+        user = User.objects.get(pk=self.user.pk)
+        user.delete()
+        with self.assertRaises(AuthenticationFailed) as raised:
+            self.authenticate(self.user)
+        self.assertEqual(raised.exception.get_codes(), 'user_not_found')
+
+    def test_password_change_revokes_tokens(self):
+        # The object CachedJWTAuthentication and the tokens read their settings from
+        with mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = RefreshToken.for_user(self.user).access_token
+            request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+            CachedJWTAuthentication().authenticate(request)
+            # From the cache: the revoke claim still matches
+            with self.assertNumQueries(0):
+                CachedJWTAuthentication().authenticate(request)
+
+            self.user.set_password('changed')
+            self.user.save()
+            with self.assertRaises(AuthenticationFailed) as raised:
+                CachedJWTAuthentication().authenticate(request)
+            self.assertEqual(raised.exception.get_codes(), 'password_changed')
+            # A token issued after the change is accepted
+            self.assertEqual(self.authenticate().pk, self.user.pk)
+
+    def test_password_is_loaded_on_access(self):
+        self.authenticate()
+        user = self.authenticate()
+        self.assertEqual(user.get_deferred_fields(), {'password'})
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('secret'))
+        self.assertEqual(user.password, self.user.password)
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class PriceFacetTests(TestCase):
+    def create_price(self, model, type, after_price):
+        return ServicePrice.objects.create(
+            brand='Toyota', model=model, type=type, product_name='Foam Wash',
+            before_price=Decimal('1000'), after_price=Decimal(after_price),
+        )
+
+    def facets(self):
+        return list(PriceFacet.objects.values_list('brand', 'model', 'price_count', 'min_price', 'max_price'))
+
+    def test_refresh_tracks_saves(self):
+        price = self.create_price('Innova', 'SUV', '800')
+        self.create_price('Innova', 'MPV', '700')
+        self.create_price('Corolla', 'Sedan', '500')
+        self.assertEqual(self.facets(), [
+            ('Toyota', 'Corolla', 1, Decimal('500'), Decimal('500')),
+            ('Toyota', 'Innova', 2, Decimal('700'), Decimal('800')),
+        ])
+
+        price.model = 'Corolla'
+        price.save()
+        ServicePrice.objects.filter(model='Innova').update(is_active=False)
+        refresh_facets({'Toyota'})
+        self.assertEqual(self.facets(), [('Toyota', 'Corolla', 2, Decimal('500'), Decimal('800'))])
+
+    def test_concurrent_refresh_does_not_collide(self):
+        self.create_price('Innova', 'SUV', '800')
+        PriceFacet.objects.all().delete()
+        bulk_create = PriceFacet.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # Another refresh of the brand commits its rows first
+            PriceFacet.objects.create(brand='Toyota', model='Innova', price_count=7)
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(PriceFacet.objects, 'bulk_create', side_effect=racing_bulk_create):
+            self.assertEqual(refresh_facets({'Toyota'}), 1)
+        self.assertEqual(self.facets(), [('Toyota', 'Innova', 1, Decimal('800'), Decimal('800'))])
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class GeneratedDiscountTests(TestCase):
+    def test_columns_match_properties(self):
+        for type, before, after in (
+            ('Hatchback', '1000', '750'),   # typical discount
+            ('Sedan', '900', '0'),          # no after price
+            ('SUV', '0', '500'),            # no before price
+            ('MPV', '0', '0'),
+            ('Coupe', '500', '500'),        # no discount
+            ('Pickup', '400', '600'),       # after price above before price
+            ('Van', '1200', '999.99'),
+        ):
+            ServicePrice.objects.create(
+                brand='Toyota', model='Innova', type=type, product_name='Foam Wash',
+                before_price=Decimal(before), after_price=Decimal(after),
+            )
+
+        prices = ServicePrice.objects.all()
+        self.assertEqual(len(prices), 7)
+        for price in prices:
+            with self.subTest(type=price.type):
+                self.assertEqual(price.savings_amount, price.savings)
+                self.assertEqual(price.discount_pct, price.discount_percentage)
+
+    def test_half_cent_discounts_round_up(self):
+        price = ServicePrice.objects.create(
+            brand='Toyota', model='Innova', type='SUV', product_name='Foam Wash',
+            before_price=Decimal('200'), after_price=Decimal('199.99'),
+        )
+        # Exactly 0.005%: round() would give 0.00 (half to even)
+        self.assertEqual(price.discount_percentage, Decimal('0.01'))
+        self.assertEqual(
+            serialize_service_price_rows(service_price_rows(ServicePrice.objects.all()))[0]['discount_percentage'],
+            Decimal('0.01'),
+        )
+        if connection.vendor == 'postgresql':
+            # SQLite computes the column in floating point, short of the exact half
+            price.refresh_from_db()
+            self.assertEqual(price.discount_pct, price.discount_percentage)
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class FastSerializerParityTests(TestCase):
+    """The values-based serializers and FastJSONRenderer render the serializers' exact bytes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ServiceCategory.objects.create(name='Car Wash', slug='car-wash')
+        for header, price, is_featured in (
+            ('Foam Wash', Decimal('499'), True),
+            ('Interior Clean', Decimal('650.5'), False),
+            ('Polish', None, False),
+            ('Wax\u2028Coat', Decimal('1200.00'), False),
+        ):
+            Service.objects.create(
+                category=cls.category, header=header, details='Shampoo, Rinse ,, Dry',
+                price=price, is_featured=is_featured,
+            )
+        for brand, model, type, product_name, before, after, discounted in (
+            ('Toyota', 'Innova', 'SUV', 'Foam Wash', '1000', '750', '700.5'),
+            ('Toyota', '', 'Any', 'Foam Wash', '900', '850', None),
+            ('Toyota', 'Generic', 'Any', 'Interior Clean', '1200', '999.99', None),
+            ('Toyota', 'Innova', 'MPV', 'Polish', '0', '500', None),
+            ('Honda', 'City', 'Sedan', 'Polish', '300', '0', '250'),
+            ('Honda', 'City', 'Hatchback', 'Wax\u2028Coat', '400', '600', None),
+            ('Honda', 'City', 'Coupe', 'Foam Wash', '333.33', '111.11', None),
+            ('Honda', 'Jazz', 'Hatchback', 'Ceramic\u2028Coat \u00e9', '2000', '1500', None),
+        ):
+            ServicePrice.objects.create(
+                brand=brand, model=model, type=type, product_name=product_name,
+                before_price=Decimal(before), after_price=Decimal(after),
+                discounted_price=discounted and Decimal(discounted),
+            )
+
+    def assertSameBytes(self, serializer_data, fast_data):
+        expected = JSONRenderer().render(serializer_data)
+        self.assertEqual(FastJSONRenderer().render(fast_data), expected)
+        self.assertEqual(JSONRenderer().render(fast_data), expected)
+
+    def test_service_prices(self):
+        prices = ServicePrice.objects.all()
+        self.assertSameBytes(
+            ServicePriceSerializer(prices, many=True).data,
+            serialize_service_price_rows(service_price_rows(prices)),
+        )
+
+    def test_services(self):
+        services = Service.objects.order_by('-is_featured', 'created_at')
+        self.assertSameBytes(ServiceSerializer(services, many=True).data, serialize_service_rows(service_rows(services)))
+
+        for brand, model in (('Toyota', 'Innova'), ('toyota', 'CAMRY'), ('Honda', 'City'), ('Tata', 'Nexon')):
+            with self.subTest(brand=brand, model=model):
+                context = {'brand': brand, 'model': model}
+                serializer_data = ServiceSerializer(services, many=True, context=context).data
+                rows = service_rows(annotate_real_prices(services, brand, model), with_prices=True)
+                self.assertSameBytes(serializer_data, serialize_service_rows(rows, brand, model))
+
+                # Prices resolved up front, as with the price index
+                resolved_prices = dict(
+                    ((service_id, price) for (service_id, _, _), price in _resolve_from_database(
+                        [(service.id, brand, model) for service in services]
+                    ).items())
+                )
+                serializer_data = ServiceSerializer(
+                    services, many=True, context={**context, 'resolved_prices': resolved_prices}
+                ).data
+                fast_data = serialize_service_rows(service_rows(services), brand, model, resolved_prices)
+                self.assertSameBytes(serializer_data, fast_data)
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False)
+class PriceIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ServiceCategory.objects.create(name='Car Wash', slug='car-wash')
+        cls.service = Service.objects.create(category=cls.category, header='Foam Wash', details='a, b')
+        cls.price = ServicePrice.objects.create(
+            brand='Toyota', model='Innova', type='SUV', product_name='Foam Wash',
+            before_price=Decimal('1000'), after_price=Decimal('800'),
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'prices.bin')
+        settings_override = override_settings(
+            PRICE_INDEX_ENABLED=True, PRICE_INDEX_PATH=self.path, PRICE_INDEX_CHECK_INTERVAL=0
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for name, value in (('_current', None), ('_checked_at', None)):
+            patcher = mock.patch.object(price_index, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(price_index, 'schedule_rebuild')
+        self.schedule_rebuild = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_missing_index_is_built_in_the_background(self):
+        self.assertIsNone(price_index.get_price_index())
+        self.schedule_rebuild.assert_called_once_with()
+        self.assertFalse(os.path.exists(self.path))
+
+        self.assertTrue(price_index.refresh_price_index())
+        self.assertFalse(price_index.refresh_price_index())
+        index = price_index.get_price_index()
+        self.assertEqual(index.version, price_index.current_version())
+        self.assertEqual(index.resolve('Toyota', 'Innova', self.service.id)[0], Decimal('800'))
+
+    def test_catalog_change_marks_the_index_stale(self):
+        price_index.refresh_price_index()
+        old_version = price_index.get_price_index().version
+
+        self.price.after_price = Decimal('700')
+        self.price.save()
+        # What the save sends once its transaction commits
+        catalog_changed.send(sender=ServicePrice, source='test')
+        # Served from the database until the rebuild, never from the stale file
+        self.assertIsNone(price_index.get_price_index())
+        self.schedule_rebuild.assert_called()
+
+        self.assertTrue(price_index.refresh_price_index())
+        index = price_index.get_price_index()
+        self.assertGreater(index.version, old_version)
+        self.assertEqual(index.resolve('Toyota', 'Innova', self.service.id)[0], Decimal('700'))
+
+    def test_concurrent_rebuild_is_skipped(self):
+        with price_index._build_lock(self.path) as acquired:
+            self.assertTrue(acquired)
+            self.assertFalse(price_index.refresh_price_index())
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_default_path_is_per_database(self):
+        with override_settings(PRICE_INDEX_PATH=None):
+            path = price_index.get_index_path()
+            with mock.patch.dict(connection.settings_dict, NAME='other'):
+                self.assertNotEqual(price_index.get_index_path(), path)
+
+    def test_resolve_matches_database(self):
+        interior = Service.objects.create(category=self.category, header='Interior Clean', details='a, b')
+        polish = Service.objects.create(category=self.category, header='Polish', details='a, b')
+        for brand, model, type, product_name, after, discounted, is_active in (
+            ('Toyota', 'Innova', 'SUV', 'Foam Wash Deluxe', '780', '750', True),
+            ('Toyota', '', 'Any', 'Foam Wash', '900', '850', True),
+            ('Toyota', 'Innova', 'SUV', 'Interior Clean', '600', None, True),
+            ('Toyota', 'Generic', 'Any', 'Interior Clean', '500', '450', True),
+            # The first row in the default ordering wins, whatever the insertion order
+            ('Honda', 'City', 'B', 'Polish', '300', None, True),
+            ('Honda', 'City', 'A', 'Polish', '350', None, True),
+            ('Honda', 'Jazz', 'A', 'Polish', '200', '150', False),
+        ):
+            ServicePrice.objects.create(
+                brand=brand, model=model, type=type, product_name=product_name,
+                before_price=Decimal('1000'), after_price=Decimal(after),
+                discounted_price=discounted and Decimal(discounted), is_active=is_active,
+            )
+        cars = [('Toyota', 'Innova'), ('tOYOTA', 'INNOVA'), ('Toyota', 'Corolla'),
+                ('Honda', 'City'), ('Honda', 'Jazz'), ('Tata', 'Nexon')]
+        items = [
+            (service.id, brand, model)
+            for service in (self.service, interior, polish) for brand, model in cars
+        ]
+
+        price_index.refresh_price_index()
+        index = price_index.get_price_index()
+        expected = _resolve_from_database(items)
+        self.assertEqual({item: index.resolve(item[1], item[2], item[0]) for item in items}, expected)
+        self.assertEqual(expected[(interior.id, 'Toyota', 'Innova')], (Decimal('450'), 'brand_generic'))
+        self.assertEqual(expected[(polish.id, 'Honda', 'City')], (Decimal('350'), 'model_specific'))
+        self.assertEqual(expected[(polish.id, 'Honda', 'Jazz')], (None, None))
+
+        # The category view serves the same prices with and without the index
+        for brand, model in cars:
+            url = reverse('services-by-category', args=['car-wash'])
+            with_index = self.client.get(url, {'brand': brand, 'model': model}).json()
+            with override_settings(PRICE_INDEX_ENABLED=False):
+                without_index = self.client.get(url, {'brand': brand, 'model': model}).json()
+            self.assertEqual(with_index, without_index)
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False, PRICE_INDEX_ENABLED=False)
+class PriceQuoteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        wash = ServiceCategory.objects.create(name='Car Wash', slug='car-wash')
+        care = ServiceCategory.objects.create(name='Car Care', slug='car-care')
+        cls.foam = Service.objects.create(category=wash, header='Foam Wash', details='a', price=Decimal('500'))
+        cls.oil = Service.objects.create(category=care, header='Oil Change', details='a', price=Decimal('300'))
+        cls.polish = Service.objects.create(category=care, header='Polish', details='a')
+        cls.retired = Service.objects.create(category=wash, header='Wax', details='a', is_active=False)
+        for brand, model, product_name, after_price, discounted_price in (
+            ('Toyota', 'Innova', 'Foam Wash', '800', None),
+            ('Toyota', '', 'Oil Change', '400', '350'),
+            ('Honda', 'City', 'Oil Change', '420', None),
+            ('Honda', 'City', 'Wax', '200', None),
+        ):
+            ServicePrice.objects.create(
+                brand=brand, model=model, type='SUV', product_name=product_name, before_price=Decimal('1000'),
+                after_price=Decimal(after_price), discounted_price=discounted_price and Decimal(discounted_price),
+            )
+
+    def quote(self, items):
+        return self.client.post(reverse('services-price-quote'), {'items': items}, content_type='application/json')
+
+    def test_quotes_match_the_service_serializer(self):
+        cars = [('Toyota', 'Innova'), ('toyota', 'INNOVA'), ('Honda', 'City'), ('Tata', 'Nexon'), ('', '')]
+        services = [self.foam, self.oil, self.polish]
+        items = [
+            {'service_id': service.pk, 'brand': brand, 'model': model}
+            for brand, model in cars for service in services
+        ]
+        response = self.quote(items)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['not_found'], [])
+        self.assertEqual(
+            [(quote['service_id'], quote['brand'], quote['model']) for quote in data['quotes']],
+            [(item['service_id'], item['brand'], item['model']) for item in items]
+        )
+        for quote in data['quotes']:
+            service = Service.objects.get(pk=quote['service_id'])
+            expected = ServiceSerializer(service, context={'brand': quote['brand'], 'model': quote['model']}).data
+            for field in ('header', 'price', 'real_price', 'display_price', 'price_status'):
+                self.assertEqual(quote[field], expected[field], (quote, field))
+
+        statuses = {(quote['service_id'], quote['brand']): quote['price_status'] for quote in data['quotes']}
+        self.assertEqual(statuses[(self.foam.pk, 'Toyota')], 'model_specific')
+        self.assertEqual(statuses[(self.oil.pk, 'toyota')], 'brand_generic')
+        self.assertEqual(statuses[(self.oil.pk, 'Honda')], 'model_specific')
+        self.assertEqual(statuses[(self.foam.pk, 'Tata')], 'service_default')
+        self.assertEqual(statuses[(self.polish.pk, 'Tata')], 'na')
+        self.assertEqual(statuses[(self.oil.pk, '')], 'service_default')
+
+    def test_unknown_and_inactive_services(self):
+        response = self.quote([
+            {'service_id': 999999, 'brand': 'Toyota', 'model': 'Innova'},
+            {'service_id': self.foam.pk, 'brand': 'Toyota', 'model': 'Innova'},
+            {'service_id': self.retired.pk, 'brand': 'Honda', 'model': 'City'},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([quote['service_id'] for quote in data['quotes']], [self.foam.pk])
+        self.assertEqual(data['quotes'][0]['real_price'], '800.00')
+        self.assertEqual(data['not_found'], [999999, self.retired.pk])
+
+    def test_invalid_requests(self):
+        item = {'service_id': self.foam.pk, 'brand': 'Toyota', 'model': 'Innova'}
+        with override_settings(CATALOG_QUOTE_MAX_ITEMS=2):
+            self.assertEqual(self.quote([item] * 2).status_code, 200)
+            response = self.quote([item] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('At most 2 items', response.json()['message'])
+
+        for items in ([], [{'service_id': 0}], [{'brand': 'Toyota'}]):
+            self.assertEqual(self.quote(items).status_code, 400, items)
+
+
+class DenyThrottle(BaseThrottle):
+    def allow_request(self, request, view):
+        return False
+
+    def wait(self):
+        return 30
+
+
+@override_settings(CATALOG_PAYLOAD_STORE_ENABLED=False)
+class AsyncViewPolicyTests(TestCase):
+    """The async catalog views apply DRF's authentication, permission and throttle classes."""
+
+    def setUp(self):
+        ServiceCategory.objects.create(name='Car Wash', slug='car-wash')
+        self.factory = RequestFactory()
+
+    def get(self, view_class, path='/', headers=None, **initkwargs):
+        request = self.factory.get(path, headers=headers)
+        request.session = {}
+        return async_to_sync(view_class.as_view(**initkwargs))(request)
+
+    def test_public_by_default(self):
+        response = self.get(AsyncServiceCategoryListView)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content)[0]['name'], 'Car Wash')
+
+    def test_authentication_and_permission_classes(self):
+        policies = {'authentication_classes': [JWTAuthentication], 'permission_classes': [IsAuthenticated]}
+        response = self.get(AsyncServiceCategoryListView, **policies)
+        self.assertEqual(response.status_code, 401)
+        self.assertIn('Bearer', response['WWW-Authenticate'])
+
+        token = RefreshToken.for_user(User.objects.create_user('driver')).access_token
+        response = self.get(AsyncServiceCategoryListView, headers={'Authorization': f'Bearer {token}'}, **policies)
+        self.assertEqual(response.status_code, 200)
+
+    def test_throttle_classes(self):
+        response = self.get(PriceStreamView, path='/?brand=Toyota', throttle_classes=[DenyThrottle])
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '30')
+
+
+def price(brand, model, category_ids=()):
+    return {'id': 1, 'brand': brand, 'model': model, 'category_ids': set(category_ids)}
+
+
+class PriceStreamTests(TestCase):
+    def test_not_routed_without_async_views(self):
+        self.assertEqual(self.client.get('/api/service-prices/stream/?brand=Toyota').status_code, 404)
+
+    def test_car_subscription_matches_model_and_brand_generic_prices(self):
+        subscription = price_stream.Subscription('toyota', 'INNOVA')
+        self.assertTrue(subscription.matches(price('Toyota', 'Innova')))
+        self.assertTrue(subscription.matches(price('Toyota', '')))
+        self.assertTrue(subscription.matches(price('Toyota', 'Generic')))
+        self.assertFalse(subscription.matches(price('Toyota', 'Corolla')))
+        self.assertFalse(subscription.matches(price('Honda', 'Innova')))
+
+    def test_category_subscription(self):
+        subscription = price_stream.Subscription(category_id=1)
+        self.assertTrue(subscription.matches(price('Honda', 'City', [1, 2])))
+        self.assertFalse(subscription.matches(price('Honda', 'City', [2])))
+
+        subscription = price_stream.Subscription('Toyota', 'Innova', category_id=1)
+        self.assertTrue(subscription.matches(price('Toyota', 'Innova', [1])))
+        self.assertFalse(subscription.matches(price('Toyota', 'Innova', [2])))
+        self.assertFalse(subscription.matches(price('Honda', 'City', [1])))
+
+    @override_settings(CATALOG_STREAM_QUEUE_SIZE=2)
+    def test_overflow_replaces_backlog_with_resync(self):
+        subscription = price_stream.Subscription('Toyota', 'Innova')
+        subscription.offer(1, [price('Toyota', 'Innova')], [])
+        subscription.offer(2, [price('Honda', 'City')], [])
+        self.assertEqual(subscription.queue.qsize(), 1)
+        subscription.offer(3, [price('Toyota', '')], [])
+        subscription.offer(4, [], [9])
+        self.assertEqual(subscription.queue.qsize(), 1)
+        self.assertIs(subscription.queue.get_nowait(), price_stream.RESYNC)
+
+    def test_price_deltas_since_reads_every_page(self):
+        category = ServiceCategory.objects.create(name='Car Wash', slug='car-wash')
+        service = Service.objects.create(category=category, header='Foam Wash', details='a, b')
+        since = publish_changes()
+        prices = [
+            ServicePrice.objects.create(
+                brand='Toyota', model=f'Model {i}', type='SUV', product_name='Foam Wash',
+                before_price=Decimal('1000'), after_price=Decimal('800'),
+            )
+            for i in range(5)
+        ]
+        removed_id = prices.pop().pk
+        ServicePrice.objects.filter(pk=removed_id).delete()
+
+        with mock.patch.object(price_stream, 'get_max_limit', return_value=2):
+            version, changed, removed = price_stream.price_deltas_since(since)
+        self.assertEqual(version, publish_changes())
+        self.assertEqual(sorted(item['id'] for item in changed), [price.pk for price in prices])
+        self.assertEqual(removed, [removed_id])
+        self.assertTrue(all(item['category_ids'] == {category.pk} for item in changed))
+
+
+@override_settings(
+    CATALOG_PAYLOAD_STORE_ENABLED=True, CATALOG_PAYLOAD_ALLOW_LOCAL_CACHE=True, PRICE_INDEX_ENABLED=False
+)
+class PayloadStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ServiceCategory.objects.create(name='Car Wash', slug='car-wash')
+        Service.objects.create(category=category, header='Foam Wash', details='a, b')
+        cls.price = ServicePrice.objects.create(
+            brand='Toyota', model='Innova', type='SUV', product_name='Foam Wash',
+            before_price=Decimal('1000'), after_price=Decimal('800'),
+        )
+
+    def setUp(self):
+        payload_store.get_cache().clear()
+        # The background re-render pass is not needed: the next request renders the payload
+        for patcher in (
+            mock.patch.object(payload_store, '_rerender_worker'),
+            mock.patch.dict(payload_store._known, generation=None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def get(self):
+        response = self.client.get(
+            reverse('services-by-category', args=['car-wash']), {'brand': 'Toyota', 'model': 'Innova'}
+        )
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_price_save_changes_next_payload(self):
+        first = self.get()
+        self.assertEqual(first.json()['services'][0]['real_price'], '800.00')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get()['ETag'], first['ETag'])
+
+        self.price.after_price = Decimal('700')
+        self.price.save()
+        # What the save sends once its transaction commits
+        catalog_changed.send(sender=ServicePrice, source='test')
+
+        second = self.get()
+        self.assertEqual(second.json()['services'][0]['real_price'], '700.00')
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_unknown_spellings_are_not_stored(self):
+        url = reverse('services-by-category', args=['car-wash'])
+        for brand, model in (('toyota', 'INNOVA'), ('Toyota', 'x' * 200), ('Tata', 'Nexon')):
+            response = self.client.get(url, {'brand': brand, 'model': model})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['pricing_context']['brand'], brand)
+            self.assertIsNone(payload_store.get_payload('car-wash', brand, model))
+        self.assertEqual(self.client.get(url.replace('car-wash', 'CAR-WASH')).status_code, 200)
+        self.assertIsNone(payload_store.get_payload('CAR-WASH'))
+        self.assertIsNone(payload_store.get_cache().get(payload_store.REGISTRY_KEY))
+
+        self.get()
+        self.assertEqual(
+            payload_store.get_cache().get(payload_store.REGISTRY_KEY), [('car-wash', 'Toyota', 'Innova')]
+        )
+
+    def test_concurrent_misses_render_once(self):
+        entry = {'etag': '"payload"', 'identity': b'{}', 'gzip': b'', 'br': None}
+        renders = []
+
+        def render_payload(category_identifier, brand=None, model=None, generation=None):
+            renders.append(generation)
+            time.sleep(0.2)
+            payload_store.get_cache().set(
+                payload_store.payload_key(generation, category_identifier, brand, model), entry
+            )
+            return entry
+
+        # Loaded here: the worker threads have no test database
+        self.assertTrue(payload_store.is_known(payload_store.get_generation(), 'car-wash', 'Toyota', 'Innova'))
+        barrier = threading.Barrier(8)
+
+        def request():
+            barrier.wait()
+            return payload_store.get_payload('car-wash', 'Toyota', 'Innova')
+
+        with mock.patch.object(payload_store, 'render_payload', side_effect=render_payload), \
+                ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda _: request(), range(8)))
+        self.assertEqual(len(renders), 1)
+        self.assertEqual(results, [entry] * 8)
+
+    def test_refuses_per_process_cache(self):
+        self.assertTrue(payload_store.is_enabled())
+        with override_settings(CATALOG_PAYLOAD_ALLOW_LOCAL_CACHE=False), \
+                mock.patch.object(payload_store, '_local_cache_warned', False), \
+                self.assertLogs('myapp.payload_store', 'WARNING'):
+            self.assertFalse(payload_store.is_enabled())
+
+    @skipUnless(payload_store.brotli, 'brotli is not installed')
+    def test_brotli_encoding(self):
+        identity = self.get().content
+        response = self.client.get(
+            reverse('services-by-category', args=['car-wash']), {'brand': 'Toyota', 'model': 'Innova'},
+            HTTP_ACCEPT_ENCODING='gzip, br',
+        )
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(payload_store.brotli.decompress(response.content), identity)
+
+    def test_gzip_without_brotli(self):
+        identity = self.get().content
+        payload_store.get_cache().clear()
+        with mock.patch.object(payload_store, 'brotli', None):
+            response = self.client.get(
+                reverse('services-by-category', args=['car-wash']), {'brand': 'Toyota', 'model': 'Innova'},
+                HTTP_ACCEPT_ENCODING='br, gzip',
+            )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), identity)
+
+
+@override_settings(
+    CATALOG_PAYLOAD_STORE_ENABLED=True, CATALOG_PAYLOAD_ALLOW_LOCAL_CACHE=True, PRICE_INDEX_ENABLED=False,
+    CATALOG_WARM_FLUSH_SECONDS=0,
+)
+class WarmingTests(TransactionTestCase):
+    """A TransactionTestCase: the warming threads only see committed rows."""
+
+    def setUp(self):
+        payload_store.get_cache().clear()
+        for patcher in (
+            mock.patch.object(warming, '_local_counts', Counter()),
+            mock.patch.object(payload_store, '_rerender_worker'),
+            mock.patch.dict(payload_store._known, generation=None),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def record(self, counts):
+        for combination, count in counts.items():
+            for _ in range(count):
+                warming.record_request(*combination)
+
+    def test_hot_combinations_follow_traffic(self):
+        self.record({
+            ('car-wash', 'Toyota', 'Innova'): 2, ('car-wash', None, None): 5, ('car-care', 'Honda', 'City'): 3,
+        })
+        self.assertEqual(warming.hot_combinations(), [
+            ('car-wash', None, None), ('car-care', 'Honda', 'City'), ('car-wash', 'Toyota', 'Innova'),
+        ])
+        self.assertEqual(warming.hot_combinations(1), [('car-wash', None, None)])
+
+    @override_settings(CATALOG_WARM_FLUSH_SECONDS=3600)
+    def test_counts_are_merged_when_flushed(self):
+        self.record({('car-wash', None, None): 2})
+        self.assertIsNone(payload_store.get_cache().get(warming.COUNTS_KEY))
+        self.assertEqual(warming.hot_combinations(), [('car-wash', None, None)])
+        self.assertEqual(payload_store.get_cache().get(warming.COUNTS_KEY), {('car-wash', None, None): 2})
+
+    @override_settings(CATALOG_WARM_TRACKED=2)
+    def test_counts_are_trimmed_to_the_tracked_combinations(self):
+        self.record({('a', None, None): 4, ('b', None, None): 3, ('c', None, None): 1})
+        self.assertEqual(
+            payload_store.get_cache().get(warming.COUNTS_KEY), {('a', None, None): 4, ('b', None, None): 3}
+        )
+
+    def test_decay_halves_the_counts(self):
+        self.record({('a', None, None): 5, ('b', None, None): 2, ('c', None, None): 1})
+        warming.flush_counts()
+        warming.decay_counts()
+        self.assertEqual(
+            payload_store.get_cache().get(warming.COUNTS_KEY), {('a', None, None): 2, ('b', None, None): 1}
+        )
+        self.assertEqual(warming.hot_combinations(), [('a', None, None), ('b', None, None)])
+
+    @override_settings(CATALOG_WARM_TOP_N=2, CATALOG_WARM_WORKERS=2)
+    def test_hot_payloads_are_rendered_after_an_import(self):
+        category = ServiceCategory.objects.create(name='Car Wash', slug='car-wash')
+        Service.objects.create(category=category, header='Foam Wash', details='a, b')
+        cars = [('Toyota', 'Innova'), ('Honda', 'City'), ('Tata', 'Nexon')]
+        for brand, model in cars:
+            ServicePrice.objects.create(
+                brand=brand, model=model, type='SUV', product_name='Foam Wash',
+                before_price=Decimal('1000'), after_price=Decimal('800'),
+            )
+        url = reverse('services-by-category', args=['car-wash'])
+        for (brand, model), requests in zip(cars, (3, 5, 1)):
+            for _ in range(requests):
+                self.assertEqual(self.client.get(url, {'brand': brand, 'model': model}).status_code, 200)
+
+        # The import's writes, then the re-render pass its catalog_changed starts
+        ServicePrice.objects.update(after_price=Decimal('700'))
+        payload_store.bump_generation()
+        generation = payload_store.get_generation()
+        with mock.patch.object(warming, 'render_unleased', wraps=warming.render_unleased) as warmed:
+            payload_store.rerender_known_payloads()
+        self.assertEqual(
+            sorted(call.args[1:3] for call in warmed.call_args_list), [('Honda', 'City'), ('Toyota', 'Innova')]
+        )
+
+        for brand, model in cars:
+            entry = payload_store.get_cache().get(
+                payload_store.payload_key(generation, 'car-wash', brand, model)
+            )
+            self.assertIsNotNone(entry, brand)
+            self.assertEqual(json.loads(entry['identity'])['services'][0]['real_price'], '700.00')
+        # Decayed after the warm-up
+        self.assertEqual(payload_store.get_cache().get(warming.COUNTS_KEY), {
+            ('car-wash', 'Honda', 'City'): 2, ('car-wash', 'Toyota', 'Innova'): 1,
+        })
+
+
+@override_settings(PRICE_INDEX_ENABLED=False)
+class CatalogSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = ServiceCategory.objects.create(name='Car Wash', slug='car-wash')
+        Service.objects.create(category=category, header='Foam Wash', details='a, b')
+        ServicePrice.objects.create(
+            brand='Toyota', model='Innova', type='SUV', product_name='Foam Wash',
+            before_price=Decimal('1000'), after_price=Decimal('800'),
+        )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'catalog.msgpack')
+        settings_override = override_settings(CATALOG_SNAPSHOT_PATH=self.path, CATALOG_SNAPSHOT_CHECK_INTERVAL=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        for name, value in (('_current', None), ('_checked_at', None)):
+            patcher = mock.patch.object(snapshot, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(snapshot, 'schedule_rebuild')
+        self.schedule_rebuild = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, **headers):
+        response = self.client.get(reverse('catalog-snapshot'), **headers)
+        self.assertIn(response.status_code, (200, 304))
+        return response
+
+    def test_blob_layout(self):
+        response = self.get()
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        data = msgpack.unpackb(response.content, raw=False)
+        self.assertEqual(data['format'], snapshot.FORMAT)
+        self.assertEqual(data['version'], snapshot.current_version())
+        self.assertEqual(response['X-Catalog-Version'], str(data['version']))
+
+        category = ServiceCategory.objects.get()
+        service = Service.objects.get()
+        price = ServicePrice.objects.get()
+        self.assertEqual(data['categories']['columns'], list(snapshot.CATEGORY_COLUMNS))
+        self.assertEqual(data['categories']['rows'], [[category.pk, 'Car Wash', '', '', 'car-wash']])
+        self.assertEqual(data['services']['columns'], list(snapshot.SERVICE_COLUMNS))
+        self.assertEqual(data['services']['rows'][0][:4], [service.pk, category.pk, 'Foam Wash', 'a, b'])
+        self.assertEqual(data['prices']['columns'], list(snapshot.PRICE_COLUMNS) + ['service_ids'])
+        self.assertEqual(data['prices']['rows'], [[
+            price.pk, 'Toyota', 'Innova', 'SUV', 'Foam Wash', '1000.00', '800.00', None, price.link, [service.pk],
+        ]])
+
+    def test_etag_is_the_blob_hash(self):
+        response = self.get()
+        sha256 = hashlib.sha256(response.content).hexdigest()
+        self.assertEqual(response['X-Content-SHA256'], sha256)
+        self.assertEqual(response['ETag'], f'"{sha256}"')
+        # Unchanged catalog: served from memory, without a rebuild
+        version = int(response['X-Catalog-Version'])
+        with self.assertNumQueries(0), mock.patch.object(snapshot, 'current_version', return_value=version):
+            not_modified = self.get(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.schedule_rebuild.assert_not_called()
+
+    def test_catalog_change_is_rebuilt_in_the_background(self):
+        first = self.get()
+        price = ServicePrice.objects.get()
+        price.after_price = Decimal('700')
+        price.save()
+        # What the save sends once its transaction commits
+        catalog_changed.send(sender=ServicePrice, source='test')
+        self.schedule_rebuild.assert_called()
+
+        # The previous snapshot is served until the rebuild
+        stale = self.get()
+        self.assertEqual(stale.content, first.content)
+        self.assertEqual(stale['X-Catalog-Version'], first['X-Catalog-Version'])
+
+        self.assertTrue(snapshot.refresh_snapshot())
+        self.assertFalse(snapshot.refresh_snapshot())
+        second = self.get()
+        self.assertGreater(int(second['X-Catalog-Version']), int(first['X-Catalog-Version']))
+        self.assertNotEqual(second['ETag'], first['ETag'])
+        self.assertEqual(msgpack.unpackb(second.content, raw=False)['prices']['rows'][0][6], '700.00')
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_rebuild_is_only_scheduled_where_the_snapshot_is_served(self):
+        catalog_changed.send(sender=ServicePrice, source='test')
+        self.schedule_rebuild.assert_not_called()
+
+    @skipUnless(snapshot.brotli, 'brotli is not installed')
+    def test_brotli_encoding(self):
+        identity = self.get().content
+        response = self.get(HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(snapshot.brotli.decompress(response.content), identity)
+
+    def test_gzip_without_brotli(self):
+        identity = self.get().content
+        with mock.patch.object(snapshot, 'brotli', None), mock.patch.object(snapshot, '_current', None):
+            response = self.get(HTTP_ACCEPT_ENCODING='br, gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), identity)
+
+
+class ChangeFeedTests(TestCase):
+    def setUp(self):
+        self.prices = [
+            ServicePrice.objects.create(
+                brand='Toyota', model=f'Model {i}', type='SUV', product_name='Foam Wash',
+                before_price=Decimal('1000'), after_price=Decimal('800'),
+            )
+            for i in range(3)
+        ]
+
+    def test_late_commit_is_not_skipped(self):
+        # A transaction took a lower id than the others but commits after they were read
+        late = CatalogChange.objects.get(entity='price', object_id=self.prices[0].pk)
+        CatalogChange.objects.filter(pk=late.pk).delete()
+        delta = changes_since(0)
+        self.assertEqual([price['id'] for price in delta['prices']['changed']], [p.pk for p in self.prices[1:]])
+
+        late.save()
+        delta = changes_since(delta['next'])
+        self.assertEqual([price['id'] for price in delta['prices']['changed']], [self.prices[0].pk])
+        self.assertGreater(delta['next'], delta['since'])
+        self.assertEqual(changes_since(delta['next'])['prices']['changed'], [])
+
+    def test_sync_endpoint_pages_in_sequence_order(self):
+        url = reverse('catalog-changes')
+        first = self.client.get(url, {'limit': 2}).json()
+        self.assertTrue(first['has_more'])
+        second = self.client.get(url, {'since': first['next'], 'limit': 2}).json()
+        self.assertFalse(second['has_more'])
+        self.assertEqual(
+            [price['id'] for page in (first, second) for price in page['prices']['changed']],
+            [price.pk for price in self.prices]
+        )
+
+    def test_publishing_nothing_opens_no_transaction(self):
+        latest = publish_changes()
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(publish_changes(), latest)
+        self.assertEqual(len(queries), 2)
+        self.assertFalse([query for query in queries.captured_queries if 'SAVEPOINT' in query['sql']])
+
+    def test_catalog_change_publishes_entries(self):
+        self.assertTrue(CatalogChange.objects.filter(sequence__isnull=True).exists())
+        # What the saves send once their transaction commits
+        catalog_changed.send(sender=ServicePrice, source='test')
+        self.assertFalse(CatalogChange.objects.filter(sequence__isnull=True).exists())
+
+    def age_changes(self, **filters):
+        CatalogChange.objects.filter(**filters).update(created_at=timezone.now() - timedelta(days=2))
+
+    def test_cleanup_keeps_the_newest_expired_entry(self):
+        publish_changes()
+        self.age_changes()
+        self.prices[0].save()
+        publish_changes()
+        sequences = list(CatalogChange.objects.order_by('sequence').values_list('sequence', flat=True))
+
+        with override_settings(CATALOG_CHANGE_RETENTION=None):
+            self.assertEqual(changefeed.cleanup_changes(), 0)
+        with override_settings(CATALOG_CHANGE_RETENTION=24 * 60 * 60):
+            self.assertEqual(changefeed.cleanup_changes(), len(sequences) - 2)
+            self.assertEqual(changefeed.cleanup_changes(), 0)
+        self.assertEqual(list(CatalogChange.objects.values_list('sequence', flat=True)), sequences[-2:])
+
+        # Up to date past the horizon: still served
+        delta = changes_since(sequences[-2] - 1)
+        self.assertEqual(
+            [price['id'] for price in delta['prices']['changed']], [self.prices[0].pk, self.prices[-1].pk]
+        )
+        with self.assertRaises(changefeed.ChangesExpired):
+            changes_since(sequences[-2] - 2)
+
+    def test_expired_token_gets_gone(self):
+        url = reverse('catalog-changes')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        publish_changes()
+        self.age_changes(object_id__in=[price.pk for price in self.prices[:2]])
+        out = io.StringIO()
+        call_command('cleanup_catalog_changes', '--max-age', '3600', stdout=out)
+        self.assertIn('Deleted 1 catalog changes', out.getvalue())
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 410)
+        self.assertTrue(response.json()['resync'])
+        self.assertEqual(self.client.get(url, {'since': publish_changes()}).status_code, 200)
+
+    def test_expired_stream_subscription_resyncs(self):
+        broker = price_stream.PriceBroker()
+        broker.version = 10
+        subscription = price_stream.Subscription('Toyota', 'Innova')
+        with mock.patch.object(price_stream, 'price_deltas_since', side_effect=changefeed.ChangesExpired), \
+                mock.patch.object(price_stream.PriceBroker, '_poll', new_callable=mock.AsyncMock):
+            async_to_sync(broker.subscribe)(subscription, since=1)
+        self.assertIs(subscription.queue.get_nowait(), price_stream.RESYNC)
+        self.assertIn(subscription, broker.subscriptions)
@@ -1,6 +1,19 @@
+from django.conf import settings
 from django.urls import path
 from .views import *
 
+ASYNC_VIEWS = getattr(settings, 'CATALOG_ASYNC_VIEWS', False)
+
+if ASYNC_VIEWS:
+    # Native async catalog views for the ASGI stack (see myapp.async_views)
+    from .async_views import (
+        AsyncAllServicesView as AllServicesView,
+        AsyncServiceCategoryListView as ServiceCategoryListView,
+        AsyncServicePriceListView as ServicePriceListView,
+        AsyncServicesByCategoryView as ServicesByCategoryView,
+        PriceStreamView,
+    )
+
 urlpatterns = [
     path('userprofiles/', UserProfileList.as_view(), name='user-list-create'),
     path('userprofiles/<int:pk>/', UserProfileRetrieveUpdateDestroyView.as_view(), name='userprofile-detail'),
@@ -9,7 +22,18 @@ urlpatterns = [
     path('services/categories/', ServiceCategoryListView.as_view(), name='service-categories'),
     path('services/categories/<str:category_identifier>/', ServicesByCategoryView.as_view(), name='services-by-category'),
     path('services/all/', AllServicesView.as_view(), name='all-services'),
+    path('services/quote/', PriceQuoteView.as_view(), name='services-price-quote'),
+    path('catalog/changes/', CatalogChangesView.as_view(), name='catalog-changes'),
+    path('catalog/snapshot/', CatalogSnapshotView.as_view(), name='catalog-snapshot'),
     # ServicePrice API endpoints
     path('service-prices/', ServicePriceListView.as_view(), name='service-prices-list'),
+    path('service-prices/facets/', PriceFacetView.as_view(), name='service-prices-facets'),
+    path('service-prices/deals/', ServicePriceDealsView.as_view(), name='service-prices-deals'),
     path('service-prices/import/', ServicePriceImportAPIView.as_view(), name='service-prices-import'),
-]
\ No newline at end of file
+    path('service-prices/import/reports/<str:report_id>/', ServicePriceImportReportView.as_view(), name='service-prices-import-report'),
+    path('service-prices/export/', ServicePriceExportView.as_view(), name='service-prices-export'),
+]
+
+if ASYNC_VIEWS:
+    # A stream holds its worker for as long as it is open, so it is only routed under ASGI
+    urlpatterns.append(path('service-prices/stream/', PriceStreamView.as_view(), name='service-prices-stream'))
@@ -11,11 +11,20 @@ from rest_framework import status
 from .models import OTP
 from .serializers import *# Create these serializers
 from django.conf import settings
-from twilio.rest import Client
 from django.utils import timezone
 from django.contrib.auth.models import User # Or your custom user model
-# Potentially import your UserSerializer and token generation (e.g., SimpleJWT)
-from rest_framework_simplejwt.tokens import RefreshToken
+# twilio (via myapp.sms), SimpleJWT, pandas, tablib and django-import-export are imported in the
+# methods that use them, so workers serving the catalog never load them
+from .renderers import CATALOG_RENDERER_CLASSES, FastJSONRenderer
+from .fast_serializers import (
+    service_rows,
+    serialize_service_rows,
+    service_price_rows,
+    serialize_service_price_rows,
+)
+from .catalog import build_price_quotes, build_services_by_category, get_category
+from .payload_store import get_payload, payload_response, is_enabled as payload_store_enabled
+from .replicas import ReplicaReadMixin
 
 
 class UserProfileList(generics.ListCreateAPIView):
@@ -38,7 +47,8 @@ class MessaHandler:
         self.app_hash = app_hash
     
     def send_otp_on_phone(self):
-        client = Client(settings.TWILIO_ACCOUNT_SID, settings.TWILIO_AUTH_TOKEN)
+        from .sms import send_sms
+
         try:
             # Format message for SMS Retriever API if app_hash is provided
             if self.app_hash:
@@ -47,12 +57,9 @@ class MessaHandler:
             else:
                 message_body = f"Your OTP code is: {self.otp}"
                 
-            message = client.messages.create(
-                body=message_body,
-                from_=settings.TWILIO_PHONE_NUMBER,
-                to=self.phone_number
-            )
-            print(f"OTP sent to {self.phone_number}. Message SID: {message.sid}")
+            # Twilio unless SMS_BACKEND names another backend (see myapp.sms)
+            message_id = send_sms(self.phone_number, message_body)
+            print(f"OTP sent to {self.phone_number}. Message SID: {message_id}")
             return True
         except Exception as e:
             print(f"Error sending OTP: {e}")
@@ -77,7 +84,7 @@ class RequestOTPView(APIView):
                 otp_code=otp_code
             )
             
-            # Send OTP via Twilio
+            # Send OTP via the SMS backend (Twilio by default)
             try:
                 message_handler = MessaHandler(phone_number=phone_number, otp=otp_code, app_hash=app_hash)
                 message_handler.send_otp_on_phone()
@@ -117,6 +124,8 @@ class VerifyOTPView(APIView):
                     # You might want to collect more user details here or in a subsequent step.
 
                 # Generate JWT tokens for the user
+                from rest_framework_simplejwt.tokens import RefreshToken
+
                 refresh = RefreshToken.for_user(user)
                 return Response({
                     'message': 'OTP verified successfully.',
@@ -135,99 +144,30 @@ class VerifyOTPView(APIView):
 
 
 #Generic views for ServiceCategory and Service 
-class ServiceCategoryListView(generics.ListAPIView):
+class ServiceCategoryListView(ReplicaReadMixin, generics.ListAPIView):
+    renderer_classes = CATALOG_RENDERER_CLASSES
     queryset = ServiceCategory.objects.filter(is_active=True)
     serializer_class = ServiceCategorySerializer
 
-class ServicesByCategoryView(APIView):
+class ServicesByCategoryView(ReplicaReadMixin, APIView):
+    renderer_classes = CATALOG_RENDERER_CLASSES
     def get(self,request,category_identifier):
         try:
-            try:
-                category = ServiceCategory.objects.get(
-                    slug=category_identifier,
-                    is_active=True
-                )
-            except ServiceCategory.DoesNotExist:
-                #if slug not found, try by name
-                category = ServiceCategory.objects.get(
-                    name__iexact=category_identifier.replace('-', ' '),
-                    is_active=True
-                )
-
             # Get query parameters for brand/model pricing
             brand = request.query_params.get('brand')
             model = request.query_params.get('model')
             
-            services = Service.objects.filter(
-                category=category,
-                is_active=True
-            ).select_related('category')
-            
-            # If brand and model are provided, annotate with real prices
-            if brand and model:
-                try:
-                    from django.db.models import OuterRef, Subquery, Case, When, Value
-                    
-                    # First try to get model-specific price
-                    model_specific_price = ServicePrice.objects.filter(
-                        brand__iexact=brand,
-                        model__iexact=model,
-                        product_name__icontains=OuterRef('header'),
-                        is_active=True
-                    ).values('discounted_price')[:1]
-                    
-                    # Fallback to brand-generic price (where model is empty or null)
-                    brand_generic_price = ServicePrice.objects.filter(
-                        brand__iexact=brand,
-                        product_name__icontains=OuterRef('header'),
-                        is_active=True
-                    ).filter(
-                        Q(model__isnull=True) | Q(model__exact='') | Q(model__iexact='generic')
-                    ).values('discounted_price')[:1]
-                    
-                    services = services.annotate(
-                        model_specific_price=Subquery(model_specific_price),
-                        brand_generic_price=Subquery(brand_generic_price),
-                        # Use model-specific price if available, otherwise brand-generic
-                        real_price=Case(
-                            When(model_specific_price__isnull=False, then='model_specific_price'),
-                            default='brand_generic_price'
-                        )
-                    )
-                except Exception as e:
-                    # Log the error but continue with fallback pricing
-                    import logging
-                    logger = logging.getLogger(__name__)
-                    logger.warning(f"Error fetching real-time prices: {str(e)}")
-                    brand = None
-                    model = None
-            
-            services = services.order_by('-is_featured','created_at')
-            
-            # Use context to pass brand/model info to serializer
-            serializer_context = {
-                'request': request,
-                'brand': brand,
-                'model': model
-            }
-            serializer = ServiceSerializer(services, many=True, context=serializer_context)
+            # Plain JSON responses are served pre-rendered from the payload store
+            if self._use_payload_store(request):
+                entry = get_payload(category_identifier, brand, model)
+                if entry is not None:
+                    return payload_response(request, entry)
             
-            return Response({
-                'category':{
-                    'id': category.id,
-                    'name': category.name,
-                    'description': category.description,
-                    'icon': category.icon,
-                    'slug': category.slug,
-                },
-                'services': serializer.data,
-                'total_services': services.count(),
-                'pricing_context': {
-                    'brand': brand,
-                    'model': model,
-                    'has_real_pricing': bool(brand and model)
-                }
-            }, status=status.HTTP_200_OK)
+            category = get_category(category_identifier)
+            return Response(
+                build_services_by_category(category, brand, model),
+                status=status.HTTP_200_OK
+            )
         
         except ServiceCategory.DoesNotExist:
             return Response({
@@ -237,49 +177,75 @@ class ServicesByCategoryView(APIView):
             return Response({
                 'error': str(e)
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+    def _use_payload_store(self, request):
+        renderer = getattr(request, 'accepted_renderer', None)
+        return (
+            payload_store_enabled()
+            and isinstance(renderer, FastJSONRenderer)
+            and not renderer.get_indent(request.accepted_media_type, {})
+        )
 
 #returns all active services
-class AllServicesView(generics.ListAPIView):
+class AllServicesView(ReplicaReadMixin, generics.ListAPIView):
+    renderer_classes = CATALOG_RENDERER_CLASSES
     queryset= Service.objects.filter(is_active=True).select_related('category')
     serializer_class = ServiceSerializer
 
     def get_queryset(self):
         queryset = super().get_queryset()
+        return filter_services(queryset, self.request.query_params)
 
-        category_id = self.request.query_params.get('category_id', None)
-        is_featured = self.request.query_params.get('featured', None)
-        search = self.request.query_params.get('search', None)
-
-        if category_id:
-            queryset= queryset.filter(category_id=category_id)
-        if is_featured == 'true':
-            queryset = queryset.filter(is_featured=True)
-        if search:
-            queryset = queryset.filter(
-                models.Q(header__icontains=search) |
-                models.Q(details__icontains=search)
-            )
-        return queryset.order_by('-is_featured','created_at')
+    def list(self, request, *args, **kwargs):
+        # Values-based fast path; same output as ServiceSerializer
+        rows = service_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_service_rows(page))
+        return Response(serialize_service_rows(rows))
 
 
 # Import functionality for ServicePrice
 from rest_framework.parsers import MultiPartParser, FileUploadParser
 from django.core.files.storage import default_storage
 from django.core.files.base import ContentFile
-import pandas as pd
-from tablib import Dataset
-from .resources import (
-    ServicePriceResource, 
-    ServicePriceResourceWithMapping,
-    ServicePriceResourceSmart
-)
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control
 from .models import ServicePrice
+from .staging import StagedServicePriceImport
+from .partitioned_import import PartitionedServicePriceImport
+from .dedup import DUPLICATE_POLICIES, DuplicateKeyError, collapse_duplicates, get_default_policy
+from .filters import filter_service_prices, filter_services
+from .exports import EXPORT_FORMATS, DEFAULT_CHUNK_SIZE, export_service_prices
+from .import_reports import REPORT_KINDS, read_import_report
+from .signals import catalog_batch
+from .import_worker import is_enabled as import_worker_enabled, run_import
+from .snapshot import get_snapshot
+from .facets import facets_response_data
+from .changefeed import (
+    DEFAULT_LIMIT as DEFAULT_SYNC_LIMIT, ChangesExpired, changes_since, get_max_limit as get_sync_max_limit,
+)
+from .linkage import find_ambiguous_matches
+from .price_rows import normalize_key_part, row_value
 import logging
 import os
 import tempfile
 
 logger = logging.getLogger(__name__)
 
+# Row errors returned inline in import responses; the rest stay in the import report
+MAX_RESPONSE_ERRORS = 20
+
+# Largest batch POST /api/services/quote/ accepts (CATALOG_QUOTE_MAX_ITEMS)
+DEFAULT_QUOTE_MAX_ITEMS = 500
+
+# Cache-Control max-age of the facets endpoint (CATALOG_FACETS_MAX_AGE)
+DEFAULT_FACETS_MAX_AGE = 300
+
+# Deals returned by default / at most (CATALOG_DEALS_MAX_LIMIT)
+DEFAULT_DEALS_LIMIT = 10
+DEFAULT_DEALS_MAX_LIMIT = 100
+
 
 class ServicePriceImportAPIView(APIView):
     """
@@ -302,7 +268,10 @@ class ServicePriceImportAPIView(APIView):
         - file: Excel file (.xlsx or .xls)
         - dry_run: boolean (optional, default: True for validation)
         - use_mapping: boolean (optional, use flexible column mapping)
-        - import_strategy: string (optional, 'smart', 'standard', 'mapping', 'always_new')
+        - import_strategy: string (optional, 'smart', 'standard', 'mapping', 'always_new', 'staged', 'partitioned')
+        - deactivate_missing: boolean (optional, staged strategy only, default: False)
+        - duplicate_policy: string (optional, 'last', 'first' or 'error', default: 'last')
+          how rows repeating the same (brand, model, type, product_name) are collapsed
         """
         try:
             # Validate file upload
@@ -326,11 +295,29 @@ class ServicePriceImportAPIView(APIView):
             dry_run = request.data.get('dry_run', 'true').lower() == 'true'
             use_mapping = request.data.get('use_mapping', 'true').lower() == 'true'
             import_strategy = request.data.get('import_strategy', 'smart').lower()
+            deactivate_missing = request.data.get('deactivate_missing', 'false').lower() == 'true'
+            duplicate_policy = request.data.get('duplicate_policy', get_default_policy()).lower()
+            if duplicate_policy not in DUPLICATE_POLICIES:
+                return Response({
+                    'status': 'error',
+                    'message': f'Invalid duplicate_policy. Use one of: {", ".join(DUPLICATE_POLICIES)}'
+                }, status=status.HTTP_400_BAD_REQUEST)
             
-            logger.info(f"Processing file: {file.name}, dry_run: {dry_run}, use_mapping: {use_mapping}, strategy: {import_strategy}")
+            logger.info(f"Processing file: {file.name}, dry_run: {dry_run}, use_mapping: {use_mapping}, strategy: {import_strategy}, duplicates: {duplicate_policy}")
             
-            # Process the Excel file
-            return self._process_excel_file(file, dry_run, use_mapping, import_strategy)
+            # With an import worker pool, pandas & co. are only loaded by the pool processes
+            if import_worker_enabled():
+                data, status_code = run_import(
+                    file, dry_run=dry_run, use_mapping=use_mapping, import_strategy=import_strategy,
+                    deactivate_missing=deactivate_missing, duplicate_policy=duplicate_policy
+                )
+                return Response(data, status=status_code)
+            
+            # Process the Excel file; the whole import is reported as one catalog change
+            with catalog_batch('import', notify=not dry_run):
+                return self._process_excel_file(
+                    file, dry_run, use_mapping, import_strategy, deactivate_missing, duplicate_policy
+                )
             
         except Exception as e:
             logger.error(f"Unexpected error in ServicePriceImportAPIView: {str(e)}")
@@ -339,11 +326,24 @@ class ServicePriceImportAPIView(APIView):
                 'message': f'An unexpected error occurred: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
-    def _process_excel_file(self, file, dry_run=True, use_mapping=True, import_strategy='smart'):
+    def _process_excel_file(self, file, dry_run=True, use_mapping=True, import_strategy='smart',
+                            deactivate_missing=False, duplicate_policy='last'):
         """
         Process the uploaded Excel file and import data with selected strategy.
         """
+        import pandas as pd
+        from tablib import Dataset
+        from .resources import (
+            ServicePriceResource, 
+            ServicePriceResourceWithMapping,
+            ServicePriceResourceSmart
+        )
+        
         try:
+            # Partitioned strategy: every sheet is read and the rows are regrouped by brand
+            if import_strategy == 'partitioned':
+                return self._process_partitioned(file, dry_run, use_mapping, duplicate_policy)
+            
             # Read Excel file using pandas for better error handling
             df = pd.read_excel(file, engine='openpyxl')
             
@@ -361,9 +361,26 @@ class ServicePriceImportAPIView(APIView):
             if use_mapping:
                 df = self._apply_column_mapping(df)
             
-            # Convert DataFrame to tablib Dataset
+            # Staged strategy: bulk-load into the staging table and merge set-based
+            if import_strategy == 'staged':
+                importer = StagedServicePriceImport(deactivate_missing=deactivate_missing)
+                records = df.to_dict('records')
+                response_data = importer.run(records, dry_run=dry_run, duplicate_policy=duplicate_policy)
+                self._report_ambiguous_matches(response_data, records, dry_run)
+                logger.info(f"Import result: {response_data}")
+                if response_data['status'] == 'error':
+                    return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+                return Response(response_data, status=status.HTTP_200_OK)
+            
+            # Collapse rows repeating the same key so each key is written once;
+            # row_refs keeps the sheet row of each remaining record
+            records, row_refs, collapsed = collapse_duplicates(df.to_dict('records'), duplicate_policy)
+            if collapsed:
+                logger.info(f"Collapsed {len(collapsed)} duplicate rows (policy: {duplicate_policy})")
+            
+            # Convert records to tablib Dataset
             dataset = Dataset()
-            dataset.load(df.to_dict('records'))
+            dataset.dict = records
             
             # Choose appropriate resource class based on strategy
             if import_strategy == 'smart':
@@ -388,12 +405,29 @@ class ServicePriceImportAPIView(APIView):
             )
             
             # Process results and errors
-            response_data = self._process_import_result(result, dry_run, resource)
+            if collapsed and hasattr(resource, 'record_report_rows'):
+                resource.record_report_rows('duplicate', collapsed)
+            response_data = self._process_import_result(result, dry_run, resource, row_refs)
+            response_data['duplicates_collapsed'] = len(collapsed)
+            if collapsed:
+                response_data['collapsed_rows'] = collapsed[:MAX_RESPONSE_ERRORS]
+            self._report_ambiguous_matches(response_data, records, dry_run)
             
             if result.has_errors():
                 return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
             else:
                 return Response(response_data, status=status.HTTP_200_OK)
+        
+        except DuplicateKeyError as e:
+            return Response({
+                'status': 'error',
+                'message': f'❌ {e} (duplicate_policy: error)',
+                'duplicates_count': len(e.duplicates),
+                'errors': [
+                    {'row': duplicate['row'], 'errors': [f"Duplicate of row {duplicate['kept_row']}"]}
+                    for duplicate in e.duplicates[:MAX_RESPONSE_ERRORS]
+                ]
+            }, status=status.HTTP_400_BAD_REQUEST)
                 
         except Exception as e:
             logger.error(f"Error processing Excel file: {str(e)}")
@@ -402,6 +436,49 @@ class ServicePriceImportAPIView(APIView):
                 'message': f'Error processing file: {str(e)}'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    def _process_partitioned(self, file, dry_run=True, use_mapping=True, duplicate_policy='last'):
+        """
+        Read all sheets of the workbook and import them partitioned by brand.
+        """
+        import pandas as pd
+        
+        sheets = pd.read_excel(file, sheet_name=None, engine='openpyxl')
+        sheets = {name: df for name, df in sheets.items() if not df.empty}
+        if not sheets:
+            return Response({
+                'status': 'error',
+                'message': 'The uploaded file is empty or contains no data.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        logger.info(f"Excel file contains {len(sheets)} sheets: {list(sheets)}")
+        if use_mapping:
+            sheets = {name: self._apply_column_mapping(df) for name, df in sheets.items()}
+        
+        importer = PartitionedServicePriceImport()
+        records = {name: df.to_dict('records') for name, df in sheets.items()}
+        response_data = importer.run(records, dry_run=dry_run, duplicate_policy=duplicate_policy)
+        self._report_ambiguous_matches(
+            response_data, [row for rows in records.values() for row in rows], dry_run
+        )
+        logger.info(f"Import result: {response_data['message']}")
+        if response_data.get('write_failed'):
+            # Some brands may be committed; see the partitions' write_status
+            return Response(response_data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if response_data['status'] == 'error':
+            return Response(response_data, status=status.HTTP_400_BAD_REQUEST)
+        return Response(response_data, status=status.HTTP_200_OK)
+    
+    def _report_ambiguous_matches(self, response_data, records, dry_run):
+        """
+        After an applied import, report services of the imported brands that now
+        have several candidate prices for the same brand/model.
+        """
+        if dry_run or response_data.get('status') != 'success':
+            return
+        brand_keys = {normalize_key_part(row_value(row, 'brand')) for row in records}
+        brand_keys.discard('')
+        response_data['ambiguous_matches'] = find_ambiguous_matches(brand_keys)
+    
     def _apply_column_mapping(self, df):
         """
         Apply flexible column name mapping to handle different Excel formats.
@@ -449,13 +526,16 @@ class ServicePriceImportAPIView(APIView):
         logger.info(f"Mapped column headers: {list(df.columns)}")
         return df
     
-    def _process_import_result(self, result, dry_run, resource=None):
+    def _process_import_result(self, result, dry_run, resource=None, row_refs=None):
         """
         Process import results and format enhanced response data.
+        ``row_refs`` maps dataset positions to sheet rows when rows were collapsed.
         """
         # Extract error information
         errors = []
-        for row_number, row_errors in result.row_errors:
+        for row_number, row_errors in result.row_errors():
+            if row_refs is not None:
+                row_number = row_refs[row_number - 1]
             error_messages = []
             for error in row_errors:
                 if hasattr(error, 'error'):
@@ -483,6 +563,12 @@ class ServicePriceImportAPIView(APIView):
             'total_rows': sum(result.totals.values()),
         }
         
+        # Store the full error list in the import report and keep the response bounded
+        if hasattr(resource, 'record_report_rows'):
+            resource.record_report_rows('error', errors)
+        error_count = len(errors)
+        errors = errors[:MAX_RESPONSE_ERRORS]
+        
         # Add detailed summary if using ServicePriceResourceSmart
         if hasattr(resource, 'get_import_summary'):
             detailed_summary = resource.get_import_summary()
@@ -514,7 +600,7 @@ class ServicePriceImportAPIView(APIView):
             # Standard messaging
             if errors:
                 response_data['errors'] = errors
-                response_data['message'] = f'Import completed with {len(errors)} errors'
+                response_data['message'] = f'Import completed with {error_count} errors'
             else:
                 if dry_run:
                     response_data['message'] = 'Validation successful. No errors found. Ready for actual import.'
@@ -523,42 +609,266 @@ class ServicePriceImportAPIView(APIView):
         
         if errors:
             response_data['errors'] = errors
-            response_data['message'] = f'❌ Import completed with {len(errors)} errors'
+            response_data['error_count'] = error_count
+            response_data['message'] = f'❌ Import completed with {error_count} errors'
         
         logger.info(f"Import result: {response_data}")
         return response_data
 
 
-class ServicePriceListView(generics.ListAPIView):
+class ServicePriceImportReportView(APIView):
+    """
+    Paginated access to the per-row report of an import.
+    
+    Query parameters:
+    - kind: 'new', 'updated', 'skipped' or 'error' (optional, default: all)
+    - page: page number (default: 1)
+    - page_size: rows per page (default: 100, max: 500)
+    """
+    
+    def get(self, request, report_id):
+        kind = request.query_params.get('kind')
+        if kind and kind not in REPORT_KINDS:
+            return Response({
+                'status': 'error',
+                'message': f'Invalid kind. Use one of: {", ".join(REPORT_KINDS)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            report = read_import_report(
+                report_id,
+                kind=kind,
+                page=request.query_params.get('page', 1),
+                page_size=request.query_params.get('page_size', 100)
+            )
+        except ValueError:
+            return Response({
+                'status': 'error',
+                'message': 'Invalid report id or pagination parameters.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        except FileNotFoundError:
+            return Response({
+                'status': 'error',
+                'message': f'Import report "{report_id}" not found.'
+            }, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response(report, status=status.HTTP_200_OK)
+
+
+class ServicePriceListView(ReplicaReadMixin, generics.ListAPIView):
     """
     API endpoint to list all service prices with filtering and search.
     """
     queryset = ServicePrice.objects.filter(is_active=True)
+    renderer_classes = CATALOG_RENDERER_CLASSES
     serializer_class = ServicePriceSerializer
     
     def get_queryset(self):
         queryset = super().get_queryset()
+        return filter_service_prices(queryset, self.request.query_params)
+    
+    def list(self, request, *args, **kwargs):
+        # Values-based fast path; same output as ServicePriceSerializer
+        rows = service_price_rows(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(serialize_service_price_rows(page))
+        return Response(serialize_service_price_rows(rows))
+
+
+class PriceQuoteView(APIView):
+    """
+    Batch price quotes for many services and cars in one call.
+    
+    POST {"items": [{"service_id": 4, "brand": "Toyota", "model": "Innova"}, ...]}
+    
+    Each quote has the same real_price/display_price/price_status as the
+    services-by-category endpoint; all items are resolved with one price
+    index pass (or one query when the index is disabled).
+    """
+    renderer_classes = CATALOG_RENDERER_CLASSES
+    
+    def post(self, request):
+        serializer = PriceQuoteSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response({
+                'status': 'error',
+                'message': 'Invalid request data',
+                'errors': serializer.errors
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Filter parameters
-        brand = self.request.query_params.get('brand', None)
-        model = self.request.query_params.get('model', None)
-        service_type = self.request.query_params.get('type', None)
-        search = self.request.query_params.get('search', None)
+        items = serializer.validated_data['items']
+        max_items = getattr(settings, 'CATALOG_QUOTE_MAX_ITEMS', DEFAULT_QUOTE_MAX_ITEMS)
+        if len(items) > max_items:
+            return Response({
+                'status': 'error',
+                'message': f'At most {max_items} items can be quoted per request'
+            }, status=status.HTTP_400_BAD_REQUEST)
         
-        if brand:
-            queryset = queryset.filter(brand__icontains=brand)
-        if model:
-            queryset = queryset.filter(model__icontains=model)
-        if service_type:
-            queryset = queryset.filter(type__icontains=service_type)
-        if search:
-            queryset = queryset.filter(
-                models.Q(brand__icontains=search) |
-                models.Q(model__icontains=search) |
-                models.Q(type__icontains=search) |
-                models.Q(product_name__icontains=search)
-            )
+        return Response(build_price_quotes([
+            (item['service_id'], item['brand'], item['model']) for item in items
+        ]), status=status.HTTP_200_OK)
+
+
+class ServicePriceDealsView(APIView):
+    """
+    Top-N deals (highest discount first) for the home-screen promotions.
+    
+    Query parameters:
+    - brand, model: exact values, as listed by the facets endpoint
+    - type: service type (exact)
+    - limit: number of deals (default: 10, at most CATALOG_DEALS_MAX_LIMIT)
+    
+    Ordered by the stored discount_pct column, so the query reads the top
+    rows of a partial index instead of ranking every price in Python.
+    """
+    renderer_classes = CATALOG_RENDERER_CLASSES
+    
+    def get(self, request):
+        max_limit = getattr(settings, 'CATALOG_DEALS_MAX_LIMIT', DEFAULT_DEALS_MAX_LIMIT)
+        try:
+            limit = int(request.query_params.get('limit') or DEFAULT_DEALS_LIMIT)
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= max_limit:
+            return Response({
+                'status': 'error',
+                'message': f'limit must be an integer between 1 and {max_limit}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        deals = ServicePrice.objects.filter(is_active=True, discount_pct__gt=0)
+        for field in ('brand', 'model', 'type'):
+            value = request.query_params.get(field)
+            if value is not None:
+                deals = deals.filter(**{field: value})
+        deals = deals.order_by('-discount_pct', 'id')[:limit]
         
-        return queryset.order_by('brand', 'model', 'type', 'product_name')
+        return Response({
+            'deals': serialize_service_price_rows(service_price_rows(deals)),
+        }, status=status.HTTP_200_OK)
 
 
+class PriceFacetView(APIView):
+    """
+    Brands and models that have active prices, with price counts and
+    min/max prices, for the car selection screens.
+    
+    Query parameters:
+    - brand: only this brand (case-insensitive)
+    
+    Served from the incrementally maintained PriceFacet table; the ETag
+    changes only when a facet does (304 on If-None-Match).
+    """
+    renderer_classes = CATALOG_RENDERER_CLASSES
+    
+    def get(self, request):
+        data, etag = facets_response_data(request.query_params.get('brand'))
+        max_age = getattr(settings, 'CATALOG_FACETS_MAX_AGE', DEFAULT_FACETS_MAX_AGE)
+        
+        if etag in {tag.strip().removeprefix('W/') for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')}:
+            response = HttpResponseNotModified()
+        else:
+            response = Response(data, status=status.HTTP_200_OK)
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=max_age)
+        return response
+
+
+class CatalogChangesView(APIView):
+    """
+    Delta sync of categories, services and prices.
+    
+    Query parameters:
+    - since: the ``next`` token of the previous sync (default: 0, the whole catalog)
+    - limit: change entries per page (default: 1000)
+    
+    Returns the current state of every row that changed after ``since`` and
+    the ids of the rows that were deactivated or deleted. Call again with
+    ``next`` while ``has_more`` is true. A ``since`` older than the retained
+    change feed (CATALOG_CHANGE_RETENTION) gets 410 Gone: download the
+    snapshot and continue from its version.
+    """
+    renderer_classes = CATALOG_RENDERER_CLASSES
+    
+    def get(self, request):
+        try:
+            since = int(request.query_params.get('since') or 0)
+            limit = int(request.query_params.get('limit') or DEFAULT_SYNC_LIMIT)
+        except ValueError:
+            return Response({
+                'status': 'error',
+                'message': 'since and limit must be integers'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0 or not 0 < limit <= get_sync_max_limit():
+            return Response({
+                'status': 'error',
+                'message': f'since must be >= 0 and limit between 1 and {get_sync_max_limit()}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            delta = changes_since(since, limit)
+        except ChangesExpired as e:
+            return Response({
+                'status': 'error',
+                'message': str(e),
+                'resync': True,
+            }, status=status.HTTP_410_GONE)
+        return Response(delta, status=status.HTTP_200_OK)
+
+
+class CatalogSnapshotView(APIView):
+    """
+    Offline catalog bundle for the mobile client (MessagePack, see myapp.snapshot).
+    
+    The ETag and X-Content-SHA256 header carry the blob's SHA-256 and
+    X-Catalog-Version the change sequence to continue from with
+    /api/catalog/changes/?since=<version>.
+    """
+    
+    def get(self, request):
+        try:
+            entry = get_snapshot()
+        except Exception as e:
+            logger.error(f"❌ Building catalog snapshot failed: {str(e)}")
+            return Response({
+                'status': 'error',
+                'message': f'Snapshot unavailable: {str(e)}'
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        response = payload_response(request, entry, content_type='application/msgpack')
+        response['X-Catalog-Version'] = entry['version']
+        response['X-Content-SHA256'] = entry['sha256']
+        return response
+
+
+class ServicePriceExportView(APIView):
+    """
+    Low-memory export of active service prices.
+    
+    Accepts the same filters as ServicePriceListView (brand, model, type, search)
+    plus:
+    - file_format: 'csv' (default, streamed row by row) or 'xlsx' (written to a
+      temporary file with a write-only workbook, then sent; the download only
+      starts once every row is written)
+    - chunk_size: rows fetched per database round trip (default: 2000)
+    """
+    
+    def get(self, request):
+        file_format = request.query_params.get('file_format', 'csv').lower()
+        if file_format not in EXPORT_FORMATS:
+            return Response({
+                'status': 'error',
+                'message': f'Invalid file_format. Use one of: {", ".join(EXPORT_FORMATS)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', DEFAULT_CHUNK_SIZE))
+        except ValueError:
+            chunk_size = DEFAULT_CHUNK_SIZE
+        chunk_size = max(100, min(chunk_size, 10000))
+        
+        queryset = filter_service_prices(
+            ServicePrice.objects.filter(is_active=True), request.query_params
+        )
+        logger.info(f"Streaming {file_format} export of service prices, chunk_size: {chunk_size}")
+        return export_service_prices(queryset, file_format, chunk_size)
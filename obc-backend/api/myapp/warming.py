@@ -0,0 +1,119 @@
+"""
+Traffic-ranked warming of the catalog payload store.
+
+Every payload request (see myapp.payload_store.get_payload) counts its
+(category, brand, model) combination. The counts are kept per process and
+merged into one compact counter entry in the payload cache every
+CATALOG_WARM_FLUSH_SECONDS, trimmed to the CATALOG_WARM_TRACKED most
+requested combinations.
+
+After a catalog change (a price import, a Service or category save), the
+background re-render renders the CATALOG_WARM_TOP_N hottest combinations
+first, spread over CATALOG_WARM_WORKERS threads, so the first users after a
+price refresh find them rendered. The counts are then halved, so the
+ranking follows recent traffic.
+
+Settings:
+- CATALOG_WARM_TOP_N: combinations warmed after a change (default: 100)
+- CATALOG_WARM_WORKERS: threads rendering them (default: 4)
+- CATALOG_WARM_TRACKED: combinations kept in the counter store (default: 1000)
+- CATALOG_WARM_FLUSH_SECONDS: seconds between merges of a process' counts (default: 10)
+"""
+
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+
+from .payload_store import get_cache, render_unleased
+
+logger = logging.getLogger(__name__)
+
+COUNTS_KEY = 'catalog-warm:counts'
+
+DEFAULT_TOP_N = 100
+DEFAULT_WORKERS = 4
+DEFAULT_TRACKED = 1000
+DEFAULT_FLUSH_SECONDS = 10
+
+_local_counts = Counter()
+_counts_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+
+def record_request(category_identifier, brand, model):
+    """Count one request of a combination; merged into the shared counts now and then."""
+    global _last_flush
+
+    with _counts_lock:
+        _local_counts[(category_identifier, brand, model)] += 1
+        if time.monotonic() - _last_flush < getattr(settings, 'CATALOG_WARM_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS):
+            return
+        _last_flush = time.monotonic()
+    flush_counts()
+
+
+def flush_counts():
+    """Merge this process' counts into the shared counter store."""
+    with _counts_lock:
+        local = _local_counts.copy()
+        _local_counts.clear()
+    if not local:
+        return
+    # Read-modify-write: concurrent flushes may drop a few counts, which a ranking can afford
+    cache = get_cache()
+    counts = Counter(cache.get(COUNTS_KEY) or {})
+    counts.update(local)
+    tracked = getattr(settings, 'CATALOG_WARM_TRACKED', DEFAULT_TRACKED)
+    cache.set(COUNTS_KEY, dict(counts.most_common(tracked)), timeout=None)
+
+
+def hot_combinations(limit=None):
+    """The most requested combinations, most requested first."""
+    flush_counts()
+    counts = Counter(get_cache().get(COUNTS_KEY) or {})
+    return [combination for combination, _ in counts.most_common(limit)]
+
+
+def decay_counts():
+    """Halve the shared counts, dropping the ones that reach zero."""
+    cache = get_cache()
+    counts = cache.get(COUNTS_KEY) or {}
+    cache.set(COUNTS_KEY, {
+        combination: count // 2 for combination, count in counts.items() if count // 2
+    }, timeout=None)
+
+
+def warm_hot_payloads(generation):
+    """
+    Render the CATALOG_WARM_TOP_N hottest combinations at ``generation`` in a
+    bounded thread pool. Returns the combinations handled.
+    """
+    hot = hot_combinations(getattr(settings, 'CATALOG_WARM_TOP_N', DEFAULT_TOP_N))
+    if not hot:
+        return []
+    workers = max(1, min(getattr(settings, 'CATALOG_WARM_WORKERS', DEFAULT_WORKERS), len(hot)))
+
+    def render_share(combinations):
+        # One share per thread, so each thread opens (and closes) one connection
+        rendered = 0
+        try:
+            for category_identifier, brand, model in combinations:
+                rendered += render_unleased(category_identifier, brand, model, generation)
+        finally:
+            connection.close()
+        return rendered
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='catalog-warm') as pool:
+        rendered = sum(pool.map(render_share, [hot[i::workers] for i in range(workers)]))
+    decay_counts()
+    logger.info(
+        f"🔥 Warmed {rendered} of the {len(hot)} hottest catalog payloads "
+        f"in {time.perf_counter() - started:.2f}s ({workers} threads)"
+    )
+    return hot
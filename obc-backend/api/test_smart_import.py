@@ -23,6 +23,7 @@ django.setup()
 
 from myapp.models import ServicePrice
 from myapp.resources import ServicePriceResourceSmart
+from myapp.import_reports import read_import_report
 from tablib import Dataset
 
 def create_initial_data():
@@ -167,22 +168,25 @@ def test_import(filename, description):
     print(f"      🔄 Updated: {final_summary['updated_count']} records")
     print(f"      ⏭️ Skipped: {final_summary['skipped_count']} records")
     
-    # Show details
-    if final_summary['details']['new_records']:
+    # Show details (read back from the on-disk import report)
+    new_records = read_import_report(final_summary['report_id'], kind='new')['results']
+    if new_records:
         print("\n   📝 New Records:")
-        for record in final_summary['details']['new_records']:
+        for record in new_records:
             print(f"      ✨ {record['brand']} {record['model']} - {record['product_name']}")
     
-    if final_summary['details']['updated_records']:
+    updated_records = read_import_report(final_summary['report_id'], kind='updated')['results']
+    if updated_records:
         print("\n   📝 Updated Records:")
-        for record in final_summary['details']['updated_records']:
+        for record in updated_records:
             print(f"      🔄 {record['brand']} {record['model']} - {record['product_name']}")
             for change in record['changes']:
                 print(f"         📋 {change['field']}: {change['old']} → {change['new']}")
     
-    if final_summary['details']['skipped_records']:
+    skipped_records = read_import_report(final_summary['report_id'], kind='skipped')['results']
+    if skipped_records:
         print("\n   📝 Skipped Records:")
-        for record in final_summary['details']['skipped_records']:
+        for record in skipped_records:
             print(f"      ⏭️ {record['brand']} {record['model']} - {record['product_name']} ({record['reason']})")
 
 def main():